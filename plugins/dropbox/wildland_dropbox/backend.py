@@ -332,3 +332,9 @@ class DropboxStorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, Stor
         attr = self.getattr(path)
         assert isinstance(attr, DropboxFileAttr)
         return attr.content_hash
+
+    def native_hash_type(self) -> Optional[str]:
+        return 'dropbox-content-hash'
+
+    def get_native_hash(self, path: PurePosixPath) -> Optional[str]:
+        return self.get_file_token(path)
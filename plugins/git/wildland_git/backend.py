@@ -97,7 +97,7 @@ class GitStorageBackend(DirectoryCachedStorageMixin, StorageBackend):
     def __init__(self, **kwds):
         super().__init__(**kwds)
         repo_url = self.params['url']
-        location = f'/tmp/git_repo/{self.params["owner"]}/{self._directory_uuid()}'
+        location = f'/tmp/git_repo/{self.params["owner"]}/{self._directory_uuid()}.git'
         username = self.params.get('username')
         password = self.params.get('password')
         self.client = GitClient(repo_url, location, username, password)
@@ -106,9 +106,9 @@ class GitStorageBackend(DirectoryCachedStorageMixin, StorageBackend):
     def _directory_uuid(self) -> str:
         """
         Generates an uuid necessary in order to clone the repository to an unique
-        directory
+        directory, shared by all storages of the same repository
         """
-        return str(uuid.uuid3(uuid.UUID(self.backend_id), str(self.params['url'])))
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, str(self.params['url'])))
 
     @classmethod
     def cli_options(cls):
@@ -155,6 +155,15 @@ class GitStorageBackend(DirectoryCachedStorageMixin, StorageBackend):
         attr = self._get_attr_from_object(obj)
         return GitFile(self.client, self.convert_to_subparts(path), attr, None)
 
+    def native_hash_type(self) -> Optional[str]:
+        return 'git-blob-sha1'
+
+    def get_native_hash(self, path: PurePosixPath) -> Optional[str]:
+        obj = self.client.get_object(self.convert_to_subparts(path))
+        if isinstance(obj, Blob):
+            return obj.hexsha
+        return None
+
     def _get_attr_from_object(self, obj: Union[Blob, Tree]):
         if isinstance(obj, Blob):
             attr = Attr(mode=stat.S_IFREG | 0o644,
@@ -28,19 +28,28 @@ as wildland containers
 # pylint: disable=no-member
 import os
 import shutil
-from typing import List, Union, Optional
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Union, Optional, Tuple
 
-from git import Repo, Blob, Tree, exc
+from git import Repo, Blob, Commit, Tree, exc
 
 from wildland.exc import WildlandError
 from wildland.log import get_logger
 
 logger = get_logger('git-client')
 
+#: number of trees whose entries are kept in the path -> object cache
+TREE_CACHE_SIZE = 4096
+
 
 class GitClient:
     """
-    GitClient responsible for handling the cloned repository data
+    GitClient responsible for handling the cloned repository data.
+
+    The repository is kept as a bare clone, which is reused and only fetched into on later mounts.
+    Files are read from the object database, so no worktree is ever checked out.
     """
 
     def __init__(self, repo_url: str, location: str,
@@ -53,43 +62,80 @@ class GitClient:
         else:
             self.url = repo_url
         self.repo: Optional[Repo] = None
+        self.commit: Optional[Commit] = None
+        # entries of recently used trees by name, indexed by path
+        self._trees: 'OrderedDict[Tuple[str, ...], Dict[str, Union[Blob, Tree]]]' = \
+            OrderedDict()
+        self._trees_lock = threading.Lock()
 
     def connect(self) -> None:
         """
-        Clones the chosen repo to /tmp/git_repo/{owner}/{directory uuid} and
-        creates an instance of git.Repo so that all the necessary
-        information about the chosen repository can be accessed from the
-        client.
+        Opens the bare clone of the chosen repo kept in /tmp/git_repo/{owner}/{url uuid}.git
+        and fetches the current remote HEAD into it, which downloads only the objects that are
+        not there yet. If there is no clone yet, a shallow one is made. If fetching fails, the
+        previously fetched version is exposed.
 
-        Upon mounting the storage, the previous version of the cloned repo
-        (if such exists) is removed from its location so that a new,
-        up to date version can be cloned.
+        The HEAD commit is read once, so that the container shows the same version until the next
+        mount.
 
-        Because of this, the authorization with parameters (--username/--password)
-        is preferred over the authorization over the prompt
+        Because the remote is contacted on every mount, the authorization with parameters
+        (--username/--password) is preferred over the authorization over the prompt
         (the backend will continuously prompt for the username and password
         upon every mount/unmount of the container), but you can choose to use the
         prompt if you don't want your credentials to be shown in bash history.
         """
-        # removes the current contents of the directory
-        if os.path.isdir(self.location) and os.listdir(self.location):
+        if os.path.isdir(os.path.join(self.location, 'objects')):
+            self.repo = Repo(self.location)
+            self._fetch()
+        else:
+            self.repo = self._clone()
+
+        self.commit = self.repo.head.commit if self.repo else None
+        with self._trees_lock:
+            self._trees.clear()
+
+    def _clone(self) -> Optional[Repo]:
+        """
+        Makes a shallow bare clone of the repo. It is cloned next to its location and then moved
+        into place, so that an interrupted clone is never taken for a complete one.
+        """
+        # removes leftovers that are not a repository
+        if os.path.isdir(self.location):
             try:
                 shutil.rmtree(self.location)
             except OSError as error:
                 raise WildlandError('Cleaning the directory %s unsuccessful: %s'
                                     % (self.location, error.strerror)) from error
 
+        parent = os.path.dirname(self.location)
+        os.makedirs(parent, exist_ok=True)
+        clone_location = tempfile.mkdtemp(prefix='.clone-', dir=parent)
         try:
-            os.makedirs(self.location)
-        except FileExistsError:
-            pass
-
-        try:
-            self.repo = Repo.clone_from(url=self.url, to_path=self.location, depth=1)
-        except exc.GitCommandError:
+            Repo.clone_from(url=self.url, to_path=clone_location, bare=True, depth=1)
+            os.rename(clone_location, self.location)
+        except exc.GitCommandError as error:
             # TODO
             # https://gitlab.com/wildland/wildland-client/-/issues/553
-            pass
+            logger.warning('Cloning into %s failed: %s', self.location, error.stderr)
+            return None
+        except OSError:
+            # cloned in the meantime by another storage of the same repo
+            if not os.path.isdir(os.path.join(self.location, 'objects')):
+                raise
+        finally:
+            shutil.rmtree(clone_location, ignore_errors=True)
+        return Repo(self.location)
+
+    def _fetch(self) -> None:
+        """
+        Fetches the remote HEAD into the branch that HEAD of the clone points to.
+        """
+        assert self.repo is not None
+        try:
+            self.repo.git.fetch('--depth=1', self.url, f'+HEAD:{self.repo.head.reference.path}')
+        except exc.GitCommandError as error:
+            logger.warning('Fetching into %s failed, using the previously fetched version: %s',
+                           self.location, error.stderr)
 
     def parse_url(self, url: str) -> str:
         """
@@ -105,56 +151,64 @@ class GitClient:
 
     def disconnect(self) -> None:
         """
-        Clean up; used when unmounting the container
+        Clean up; used when unmounting the container. The clone is kept, to be updated on the next
+        mount.
         """
+        if self.repo is not None:
+            self.repo.close()
         self.repo = None
-        if os.listdir(self.location):
-            try:
-                shutil.rmtree(self.location)
-            except OSError as error:
-                raise WildlandError('Cleaning the directory %s unsuccessful: %s'
-                                    % (self.location, error.strerror)) from error
+        self.commit = None
+        with self._trees_lock:
+            self._trees.clear()
 
-    def list_folder(self, path_parts: List[str]) -> List[Union[Blob, Tree]]:
+    def _entries(self, path_parts: Tuple[str, ...]) -> Dict[str, Union[Blob, Tree]]:
         """
-        Lists all git objects under the specified path
+        Returns git objects (trees first) in the tree under the specified path, by name.
         """
-        assert self.repo is not None
-        assert self.repo.head is not None
-        initial_tree = self.repo.head.commit.tree
-        to_return = []
-
-        for part in path_parts:
-            initial_tree = initial_tree[part]
+        with self._trees_lock:
+            entries = self._trees.get(path_parts)
+            if entries is not None:
+                self._trees.move_to_end(path_parts)
+                return entries
+
+        if path_parts:
+            tree = self._entries(path_parts[:-1])[path_parts[-1]]
+            if not isinstance(tree, Tree):
+                raise KeyError(f'Tree named {path_parts[-1]!r} not found')
+        else:
+            assert self.commit is not None
+            tree = self.commit.tree
 
-        for tree in initial_tree.trees:
-            to_return.append(tree)
+        entries = {obj.name: obj for obj in tree.trees}
+        entries.update((obj.name, obj) for obj in tree.blobs)
 
-        for blob in initial_tree.blobs:
-            to_return.append(blob)
+        with self._trees_lock:
+            self._trees[path_parts] = entries
+            while len(self._trees) > TREE_CACHE_SIZE:
+                self._trees.popitem(last=False)
+        return entries
 
-        return to_return
+    def list_folder(self, path_parts: List[str]) -> List[Union[Blob, Tree]]:
+        """
+        Lists all git objects under the specified path
+        """
+        return list(self._entries(tuple(path_parts)).values())
 
     def get_commit_timestamp(self):
         """
         Returns the timestamp of the repo's HEAD commit
         """
-        assert self.repo is not None
-        assert self.repo.head is not None
-        return self.repo.head.commit.committed_date
+        assert self.commit is not None
+        return self.commit.committed_date
 
     def get_object(self, path_parts: List[str]) -> Union[Blob, Tree]:
         """
         Returns a git object (blob/tree) found under the specified path
         """
-        assert self.repo is not None
-        assert self.repo.head is not None
-        initial_tree = self.repo.head.commit.tree
-
-        for part in path_parts:
-            initial_tree = initial_tree[part]
-
-        return initial_tree
+        if not path_parts:
+            assert self.commit is not None
+            return self.commit.tree
+        return self._entries(tuple(path_parts[:-1]))[path_parts[-1]]
 
     def get_file_content(self, path_parts: List[str]) -> bytes:
         """
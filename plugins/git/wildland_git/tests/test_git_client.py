@@ -0,0 +1,121 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# pylint: disable=missing-docstring,redefined-outer-name,protected-access
+
+import os
+import subprocess
+
+import pytest
+from git import Repo
+
+from wildland_git.git_client import GitClient
+
+
+def git(cwd, *args):
+    subprocess.run(['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com',
+                    *args], cwd=cwd, check=True, capture_output=True)
+
+
+def commit(work_dir, remote, files):
+    for name, content in files.items():
+        path = work_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    git(work_dir, 'add', '.')
+    git(work_dir, 'commit', '-m', 'commit')
+    git(work_dir, 'push', '-q', str(remote), 'HEAD:main')
+
+
+@pytest.fixture
+def repo(tmp_path):
+    work_dir = tmp_path / 'work'
+    remote = tmp_path / 'remote.git'
+    git(tmp_path, 'init', '-q', '--bare', '-b', 'main', str(remote))
+    git(tmp_path, 'init', '-q', '-b', 'main', str(work_dir))
+    commit(work_dir, remote, {'a/b/file.txt': 'file', 'top.txt': 'top'})
+    return work_dir, remote
+
+
+@pytest.fixture
+def client(repo, tmp_path):
+    _work_dir, remote = repo
+    git_client = GitClient(f'file://{remote}', str(tmp_path / 'cache' / 'repo.git'), None, None)
+    yield git_client
+    git_client.disconnect()
+
+
+def test_clone(client):
+    client.connect()
+    assert Repo(client.location).bare
+    assert [obj.name for obj in client.list_folder([])] == ['a', 'top.txt']
+    assert [obj.name for obj in client.list_folder(['a', 'b'])] == ['file.txt']
+    assert client.get_file_content(['a', 'b', 'file.txt']) == b'file'
+
+    with pytest.raises(KeyError):
+        client.get_object(['a', 'missing'])
+    with pytest.raises(KeyError):
+        client.list_folder(['top.txt'])
+
+
+def test_remount_fetches(client, repo, monkeypatch):
+    work_dir, remote = repo
+    client.connect()
+    client.disconnect()
+    assert os.path.isdir(client.location)
+
+    commit(work_dir, remote, {'a/b/new.txt': 'new', 'top.txt': 'changed'})
+    monkeypatch.setattr(Repo, 'clone_from', None)
+    client.connect()
+    assert [obj.name for obj in client.list_folder(['a', 'b'])] == ['file.txt', 'new.txt']
+    assert client.get_file_content(['top.txt']) == b'changed'
+
+
+def test_fetch_failure_uses_cache(client, repo):
+    _work_dir, remote = repo
+    client.connect()
+    client.disconnect()
+
+    client.url = f'file://{remote}-missing'
+    client.connect()
+    assert client.get_file_content(['a', 'b', 'file.txt']) == b'file'
+
+
+def test_clone_replaces_leftovers(client):
+    os.makedirs(client.location)
+    with open(os.path.join(client.location, 'junk'), 'w', encoding='utf-8') as f:
+        f.write('junk')
+
+    client.connect()
+    assert client.get_file_content(['top.txt']) == b'top'
+    assert os.listdir(os.path.dirname(client.location)) == ['repo.git']
+
+
+def test_tree_cache(client, monkeypatch):
+    client.connect()
+    client.get_object(['a', 'b', 'file.txt'])
+    assert list(client._trees) == [(), ('a',), ('a', 'b')]
+
+    # the trees are not read again
+    monkeypatch.setattr(client, 'commit', None)
+    assert client.get_file_content(['a', 'b', 'file.txt']) == b'file'
+    assert [obj.name for obj in client.list_folder(['a'])] == ['b']
@@ -25,29 +25,34 @@ Google Drive storage backend
 """
 import errno
 import json
+import math
 import stat
+import threading
+import time
 
 from datetime import datetime
 from pathlib import PosixPath, PurePosixPath
-from typing import cast, Callable, Iterable, Optional, Tuple
+from typing import cast, Callable, Iterable, List, Optional, Tuple
 
 import click
 
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.errors import HttpError
-from treelib import Tree
 from wildland.storage_backends.base import StorageBackend, Attr
 from wildland.storage_backends.buffered import File, FullBufferedFile
 from wildland.storage_backends.cached import DirectoryCachedStorageMixin
 from wildland.storage_backends.file_children import FileChildrenMixin
+from wildland.storage_backends.watch import FileEvent, FileEventType, StorageWatcher
 from wildland.manifest.schema import Schema
 from wildland.log import get_logger
-from .drive_client import DriveClient
+from .drive_client import DriveCacheTree, DriveClient
 
 # for scopes, see: https://developers.google.com/drive/api/v3/about-auth
 DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
 # for mimetypes, see: https://developers.google.com/drive/api/v3/mime-types
 FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+# key of the changes feed state (page token and cache tree) in the backend's persistent DB
+CHANGES_STATE_KEY = "changes"
 
 
 class DriveFileAttr(Attr):
@@ -55,11 +60,13 @@ class DriveFileAttr(Attr):
     Attributes of a Google Drive file.
     """
 
-    def __init__(self, size: int, timestamp: int, head_revision_id: str):
+    def __init__(self, size: int, timestamp: int, head_revision_id: str,
+                 md5_checksum: Optional[str] = None):
         self.mode = stat.S_IFREG | 0o644
         self.size = size
         self.timestamp = timestamp
         self.head_revision_id = head_revision_id
+        self.md5_checksum = md5_checksum
 
     @classmethod
     def from_file_metadata(cls, metadata):
@@ -73,10 +80,12 @@ class DriveFileAttr(Attr):
         size = int(metadata.get("size", 0))
         timestamp = int(modification_date.timestamp())
         head_revision_id = metadata.get("headRevisionId", None)
+        md5_checksum = metadata.get("md5Checksum", None)
         return cls(
             size,
             timestamp,
             head_revision_id,
+            md5_checksum,
         )
 
 
@@ -105,11 +114,52 @@ class DriveFile(FullBufferedFile):
         return len(data)
 
 
+class DriveChangesWatcher(StorageWatcher):
+    """
+    Watches for changes using the Google Drive changes feed, checked every ``changes_interval``
+    seconds. Changes found by the backend in the meantime (when serving FUSE calls) are reported
+    as well.
+    """
+
+    def __init__(self, backend: "DriveStorageBackend"):
+        super().__init__()
+        self.backend = backend
+        self.events_lock = threading.Lock()
+        self.events: List[FileEvent] = []
+
+    def add_events(self, events: List[FileEvent]) -> None:
+        """
+        Queue events to be reported.
+        """
+        with self.events_lock:
+            self.events.extend(events)
+
+    def init(self) -> None:
+        pass
+
+    def wait(self) -> Optional[List[FileEvent]]:
+        self.stop_event.wait(self.backend.changes_interval)
+        if self.stop_event.is_set():
+            return None
+        self.backend.poll_changes(force=True)
+        with self.events_lock:
+            events, self.events = self.events, []
+        return events or None
+
+    def shutdown(self) -> None:
+        pass
+
+
 class DriveStorageBackend(
     FileChildrenMixin, DirectoryCachedStorageMixin, StorageBackend
 ):
     """
     Google Drive storage supporting both read and write operations.
+
+    Once mounted, the backend follows the Google Drive changes feed, which is checked (at most
+    every ``changes_interval`` seconds) before serving cached information. Changes are applied to
+    the cache tree and the directory cache, which otherwise do not expire. The feed's page token
+    is stored together with the cache tree when unmounting, to be resumed on the next mount.
     """
 
     SCHEMA = Schema(
@@ -148,10 +198,14 @@ class DriveStorageBackend(
     def __init__(self, **kwds):
         super().__init__(**kwds)
         drive_access_credentials = self.params.get("credentials")
-        self.cache_tree = Tree()
+        self.cache_tree = DriveCacheTree()
         self.client = DriveClient(drive_access_credentials, self.cache_tree)
         self.root = PosixPath(self.params.get("location", "/")).resolve()
         self.logger = get_logger("Google Drive Logger")
+        self.changes_lock = threading.Lock()
+        self.changes_token: Optional[str] = None
+        self.changes_interval = self.DEFAULT_CACHE_TIMEOUT
+        self._next_changes_poll = 0.
 
     @classmethod
     def cli_options(cls):
@@ -214,14 +268,118 @@ class DriveStorageBackend(
         self.cache_tree.create_node(
             root_folder["name"], root_folder["id"], data=FOLDER_MIMETYPE
         )
+        self._start_changes()
 
     def unmount(self) -> None:
+        with self.changes_lock:
+            if self.changes_token is not None:
+                entries, listed = self.cache_tree.snapshot()
+                self.persistent_db.store_object(
+                    CHANGES_STATE_KEY,
+                    {
+                        "root": self.cache_tree.root,
+                        "token": self.changes_token,
+                        "entries": entries,
+                        "listed": listed,
+                    },
+                )
+                self.changes_token = None
         self.client.disconnect()
 
+    def _start_changes(self) -> None:
+        """
+        Start following the changes feed, from where the previous mount left off if possible.
+        """
+        state = self.persistent_db.get_object(CHANGES_STATE_KEY)
+        if state and state["root"] == self.cache_tree.root:
+            self.cache_tree.restore(state["entries"], state["listed"])
+            self.changes_token = state["token"]
+            self.poll_changes(force=True)
+        if self.changes_token is None:
+            self.changes_token = self.client.get_start_page_token()
+        self.cache_timeout = math.inf
+        self.cache_tree.negative_timeout = math.inf
+
+    def poll_changes(self, force: bool = False) -> List[FileEvent]:
+        """
+        Apply changes made since the last poll to the cache tree and the directory cache, and
+        return them as file events. Unless forced, the changes feed is checked at most once per
+        ``changes_interval`` seconds.
+        """
+        events: List[FileEvent] = []
+        updates: List[Tuple[FileEventType, PurePosixPath, Optional[Attr]]] = []
+        with self.changes_lock:
+            now = time.monotonic()
+            if self.changes_token is None or (not force and now < self._next_changes_poll):
+                return events
+            self._next_changes_poll = now + self.changes_interval
+
+            try:
+                changes, self.changes_token = self.client.list_changes(self.changes_token)
+            except HttpError as e:
+                # for example an expired token, start over with an empty cache
+                self.logger.warning("Cannot list Google Drive changes: %s", e)
+                self.changes_token = self.client.get_start_page_token()
+                self.cache_tree.prune()
+                self.clear_cache()
+                return events
+
+            for change in changes:
+                old_path, new_path = self.cache_tree.apply_change(change)
+                if old_path is not None and old_path != new_path:
+                    updates.append((FileEventType.DELETE, old_path, None))
+                if new_path is not None:
+                    event_type = FileEventType.MODIFY if old_path == new_path \
+                        else FileEventType.CREATE
+                    attr = self._get_attr_from_metadata(change["file"])
+                    updates.append((event_type, new_path, attr))
+            self._apply_updates(updates)
+
+        events = [
+            FileEvent(event_type, path)
+            for event_type, path, attr in updates
+            if not (event_type == FileEventType.MODIFY and attr and attr.is_dir())
+        ]
+        if events and isinstance(self.watcher_instance, DriveChangesWatcher):
+            self.watcher_instance.add_events(events)
+        return events
+
+    def _apply_updates(
+        self, updates: List[Tuple[FileEventType, PurePosixPath, Optional[Attr]]]
+    ) -> None:
+        """
+        Update the directory cache with changed entries, without listing the directories again.
+        """
+        with self.cache_lock:
+            for event_type, path, attr in updates:
+                if event_type != FileEventType.MODIFY:
+                    # nothing cached under a removed or new path is valid
+                    for cached in [cached for cached in self._dir_nodes
+                                   if cached == path or path in cached.parents]:
+                        self._drop_node(cached)
+                self._update_cache(path, attr)
+
+    def getattr(self, path: PurePosixPath) -> Attr:
+        self.poll_changes()
+        return super().getattr(path)
+
+    def readdir(self, path: PurePosixPath) -> Iterable[str]:
+        self.poll_changes()
+        return super().readdir(path)
+
+    def watcher(self):
+        """
+        If manifest explicitly specifies a watcher-interval, use default implementation. If not,
+        report changes from the Google Drive changes feed.
+        """
+        default_watcher = super().watcher()
+        if not default_watcher:
+            return DriveChangesWatcher(self)
+        return default_watcher
+
     def info_dir(self, path: PurePosixPath) -> Iterable[Tuple[PurePosixPath, Attr]]:
         for metadata in self.client.list_folder(path):
             attr = self._get_attr_from_metadata(metadata)
-            self.add_into_tree(metadata)
             yield path / metadata.get("name"), attr
 
     def open(self, path: PurePosixPath, _flags: int) -> File:
@@ -285,18 +443,21 @@ class DriveStorageBackend(
         attr: DriveFileAttr = cast(DriveFileAttr, self.getattr(path))
         return str(attr.head_revision_id)
 
+    def native_hash_type(self) -> Optional[str]:
+        return 'md5'
+
+    def get_native_hash(self, path: PurePosixPath) -> Optional[str]:
+        # Google Docs files have no binary content, and so no checksum
+        attr = self.getattr(path)
+        if isinstance(attr, DriveFileAttr):
+            return attr.md5_checksum
+        return None
+
     def add_into_tree(self, metadata):
         """
         Map current dir file/folder items into cache tree
         """
-        current_node = self.cache_tree.get_node(metadata["id"])
         try:
-            if not current_node:
-                self.cache_tree.create_node(
-                    metadata["name"],
-                    metadata["id"],
-                    parent=metadata["parents"][0],
-                    data=metadata["mimeType"],
-                )
+            self.cache_tree.add_entry(metadata)
         except Exception as error:
             raise Exception(f"Cache tree error: {error}") from error
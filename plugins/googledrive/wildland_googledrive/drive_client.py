@@ -25,9 +25,10 @@ Google Drive client wrapping and exposing Google Drive API calls
 that are relevant for the Google Drive plugin
 """
 import errno
+import time
 from io import BytesIO
 from pathlib import PosixPath, PurePosixPath
-from typing import Union
+from typing import Dict, List, Optional, Tuple
 
 import httplib2shim
 
@@ -36,7 +37,8 @@ from googleapiclient.errors import Error
 from googleapiclient.http import MediaIoBaseUpload
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from treelib import Node
+from treelib import Node, Tree
+from treelib.exceptions import LoopError
 
 # issue: ssl.SSLError: [SSL: DECRYPTION_FAILED_OR_BAD_RECORD_MAC] decryption
 # failed or bad record mac (_ssl.c:2622)
@@ -47,6 +49,236 @@ httplib2shim.patch()
 # for mimetypes, see: https://developers.google.com/drive/api/v3/mime-types
 FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
 
+# how long (in seconds) a complete folder listing, or a failed lookup, is trusted to tell that
+# a name does not exist; existing entries are kept until removed
+NEGATIVE_CACHE_TIMEOUT = 3.
+# expired failed lookups are dropped once that many are recorded
+MAX_MISSING_ENTRIES = 10000
+
+# entry fields needed to apply a change
+# see: https://developers.google.com/drive/api/v3/reference/changes
+CHANGE_FIELDS = (
+    "nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, "
+    "parents, trashed, size, modifiedTime, headRevisionId, md5Checksum))"
+)
+
+
+class DriveCacheTree(Tree):
+    """
+    Tree of already seen Google Drive entries, with node tag being the entry name.
+
+    Alongside the tree, children are indexed by (parent id, name), so that resolving a path
+    component does not depend on the number of cached entries. The tree also remembers which
+    folders were listed as a whole and which names were not found, so that a lookup of a missing
+    name does not require another Drive API query. That knowledge is trusted for
+    ``negative_timeout`` seconds, unless the tree is kept up to date with ``apply_change()``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._index: Dict[Tuple[str, str], str] = {}
+        self._listed: Dict[str, float] = {}
+        self._missing: Dict[Tuple[str, str], float] = {}
+        self.negative_timeout = NEGATIVE_CACHE_TIMEOUT
+        super().__init__(*args, **kwargs)
+
+    def add_node(self, node: Node, parent=None) -> None:
+        super().add_node(node, parent)
+        parent_id = parent.identifier if isinstance(parent, Node) else parent
+        if parent_id is not None:
+            self._add_to_index(parent_id, node)
+
+    def remove_node(self, identifier: str) -> int:
+        for node_id in list(self.expand_tree(identifier)):
+            self._remove_from_index(self[node_id])
+            self._listed.pop(node_id, None)
+        return super().remove_node(identifier)
+
+    def move_node(self, source, destination) -> None:
+        self._remove_from_index(self[source])
+        super().move_node(source, destination)
+        self._add_to_index(destination, self[source])
+
+    def update_node(self, nid: str, **attrs) -> None:
+        if "tag" not in attrs:
+            super().update_node(nid, **attrs)
+            return
+        self._remove_from_index(self[nid])
+        super().update_node(nid, **attrs)
+        parent_id = self[nid].predecessor(self.identifier)
+        if parent_id is not None:
+            self._add_to_index(parent_id, self[nid])
+
+    def lookup(self, parent_id: str, name: str) -> Optional[Node]:
+        """
+        Return the cached entry of given name under given parent, if there is one.
+        """
+        node_id = self._index.get((parent_id, name))
+        return self.get_node(node_id) if node_id else None
+
+    def known_missing(self, parent_id: str, name: str) -> bool:
+        """
+        Check if given name was recently found not to exist under given parent, either by an
+        explicit lookup or by listing the whole folder.
+        """
+        if (parent_id, name) in self._index:
+            return False
+        checked = max(
+            self._missing.get((parent_id, name), float("-inf")),
+            self._listed.get(parent_id, float("-inf")),
+        )
+        return time.monotonic() - checked < self.negative_timeout
+
+    def mark_missing(self, parent_id: str, name: str) -> None:
+        """
+        Record that given name does not exist under given parent.
+        """
+        now = time.monotonic()
+        if len(self._missing) >= MAX_MISSING_ENTRIES:
+            self._missing = {
+                key: checked
+                for key, checked in self._missing.items()
+                if now - checked < self.negative_timeout
+            }
+            if len(self._missing) >= MAX_MISSING_ENTRIES:
+                self._missing.clear()
+        self._missing[(parent_id, name)] = now
+
+    def add_entry(self, metadata: dict, parent_id: Optional[str] = None) -> Node:
+        """
+        Add (or update) an entry described by Drive API metadata. Unless given explicitly, the
+        entry is put under its first parent.
+        """
+        if parent_id is None:
+            parent_id = metadata["parents"][0]
+        node = self.get_node(metadata["id"])
+        if not node:
+            return self.create_node(
+                metadata["name"], metadata["id"], parent=parent_id, data=metadata["mimeType"]
+            )
+        if node.predecessor(self.identifier) != parent_id:
+            self.move_node(node.identifier, parent_id)
+        if node.tag != metadata["name"]:
+            self.update_node(node.identifier, tag=metadata["name"])
+        return node
+
+    def set_listing(self, parent_id: str, entries: list) -> None:
+        """
+        Replace cached children of given folder with a complete listing of it.
+        """
+        listed = {entry["id"] for entry in entries}
+        for child in self.children(parent_id):
+            if child.identifier not in listed:
+                self.remove_node(child.identifier)
+        for entry in entries:
+            self.add_entry(entry, parent_id)
+        self._listed[parent_id] = time.monotonic()
+
+    def path(self, node_id: str) -> PurePosixPath:
+        """
+        Path of given entry, relative to the tree root.
+        """
+        parts = []
+        while node_id != self.root:
+            node = self[node_id]
+            parts.append(node.tag)
+            node_id = node.predecessor(self.identifier)
+        return PurePosixPath(*reversed(parts))
+
+    def apply_change(
+        self, change: dict
+    ) -> Tuple[Optional[PurePosixPath], Optional[PurePosixPath]]:
+        """
+        Apply a change reported by the Drive changes API. Returns paths of the changed entry
+        before and after the change, ``None`` if it was (or is) not in the tree. Entries outside
+        of the tree are only added when their parent is known.
+        """
+        file_id = change["fileId"]
+        if file_id == self.root:
+            return None, None
+
+        old_path = self.path(file_id) if file_id in self else None
+        metadata = None if change.get("removed") else change.get("file")
+        parent_id = None
+        if metadata and not metadata.get("trashed") and is_listed_type(metadata["mimeType"]):
+            parent_id = next((parent for parent in metadata.get("parents", [])
+                              if parent in self), None)
+
+        if parent_id is None or metadata is None:
+            if old_path is not None:
+                self.remove_node(file_id)
+            return old_path, None
+
+        try:
+            self.add_entry(metadata, parent_id)
+        except LoopError:
+            # a move into a (since moved) descendant, the next listing will put things in order
+            self.remove_node(file_id)
+            return old_path, None
+        return old_path, self.path(file_id)
+
+    def snapshot(self) -> Tuple[List[Tuple[str, str, str, str]], List[str]]:
+        """
+        Return all entries below the root, parents first, as (id, name, parent id, mimetype)
+        tuples, and a list of completely listed folders.
+        """
+        entries = []
+        for node_id in self.expand_tree(mode=Tree.WIDTH):
+            if node_id == self.root:
+                continue
+            node = self[node_id]
+            entries.append(
+                (node_id, node.tag, node.predecessor(self.identifier), node.data)
+            )
+        return entries, list(self._listed)
+
+    def restore(self, entries: List[Tuple[str, str, str, str]], listed: List[str]) -> None:
+        """
+        Add entries returned by ``snapshot()`` below the (already created) root.
+        """
+        for node_id, name, parent_id, mimetype in entries:
+            if parent_id in self and node_id not in self:
+                self.create_node(name, node_id, parent=parent_id, data=mimetype)
+        now = time.monotonic()
+        for folder_id in listed:
+            if folder_id in self:
+                self._listed[folder_id] = now
+
+    def prune(self) -> None:
+        """
+        Remove all entries except the root, together with the lookup history.
+        """
+        if self.root is not None:
+            for child in self.children(self.root):
+                self.remove_node(child.identifier)
+        self._listed.clear()
+        self._missing.clear()
+
+    def clear(self) -> None:
+        """
+        Remove all entries, together with the index and lookup history.
+        """
+        if self.root is not None:
+            self.remove_node(self.root)
+        self._index.clear()
+        self._listed.clear()
+        self._missing.clear()
+
+    def _add_to_index(self, parent_id: str, node: Node) -> None:
+        # Drive allows many entries with the same name, the first one seen is used
+        self._index.setdefault((parent_id, node.tag), node.identifier)
+        self._missing.pop((parent_id, node.tag), None)
+
+    def _remove_from_index(self, node: Node) -> None:
+        parent_id = node.predecessor(self.identifier)
+        key = (parent_id, node.tag)
+        if self._index.get(key) != node.identifier:
+            return
+        del self._index[key]
+        for sibling in self.children(parent_id):
+            if sibling.tag == node.tag and sibling.identifier != node.identifier:
+                self._index[key] = sibling.identifier
+                break
+
 
 class DriveClient:
     """
@@ -55,6 +287,7 @@ class DriveClient:
 
     def __init__(self, credentials, cache_tree):
         self.drive_api: Resource
+        self.changes_api: Resource
         self.cache_tree = cache_tree
         self.credentials = Credentials(
             token=credentials["token"],
@@ -75,6 +308,7 @@ class DriveClient:
         drive = build("drive", "v3", credentials=self.credentials)
         # pylint: disable=maybe-no-member
         self.drive_api = drive.files()
+        self.changes_api = drive.changes()
 
         root_id = "root"
         if not root == "/":
@@ -115,7 +349,8 @@ class DriveClient:
         assert self.drive_api
         self.drive_api.close()
         self.drive_api = None
-        self.cache_tree.remove_node(self.cache_tree.root)
+        self.changes_api = None
+        self.cache_tree.clear()
 
     def list_folder(self, path: PurePosixPath) -> list:
         """
@@ -123,9 +358,11 @@ class DriveClient:
         """
         try:
             parent_id = self._get_id_from_path(path)
-            return self._retrieve_entries("'{}' in parents".format(parent_id))
+            entries = self._retrieve_entries("'{}' in parents".format(parent_id))
         except (Error) as e:
             raise e
+        self.cache_tree.set_listing(parent_id, entries)
+        return entries
 
     def get_file_content(self, path: PurePosixPath) -> bytes:
         """
@@ -152,13 +389,8 @@ class DriveClient:
         for item in path.parts:
             node_item = self._retrieve_from_cache_tree(item, parent_id)
 
-            if not node_item:
-                folder_id = self._retrieve_if_exist(item, parent_id)
-            else:
-                folder_id = node_item.identifier
-
-            if folder_id:
-                parent_id = folder_id
+            if node_item:
+                parent_id = node_item.identifier
                 continue
 
             file_metadata = {
@@ -168,13 +400,16 @@ class DriveClient:
             }
 
             try:
-                parent_id = self.drive_api.create(
-                    body=file_metadata, fields="id"
+                folder_metadata = self.drive_api.create(
+                    body=file_metadata, fields="id, name, mimeType"
                 ).execute()
             except PermissionError as e:
                 raise PermissionError(
                     errno.EACCES, f"No permissions to create directories [{path}]"
                 ) from e
+            parent_id = self.cache_tree.add_entry(folder_metadata, parent_id).identifier
+            # a new folder is known to be empty
+            self.cache_tree.set_listing(parent_id, [])
 
     def rmdir(self, path: PurePosixPath) -> None:
         """
@@ -193,13 +428,8 @@ class DriveClient:
             node_item = self._retrieve_from_cache_tree(item, src_cursor_id)
 
             if not node_item:
-                entry_id = self._retrieve_if_exist(item, src_cursor_id)
-            else:
-                entry_id = node_item.identifier
-
-            if not entry_id:
                 raise EntryNotFoundError("Source path is not exist: {}".format(move_from))
-            src_cursor_id = entry_id
+            src_cursor_id = node_item.identifier
 
         # if paths are the same just update the name
         if move_from.parent == move_to.parent:
@@ -221,11 +451,7 @@ class DriveClient:
 
         for item in move_to.parts:
             node_item = self._retrieve_from_cache_tree(item, dst_cursor_id)
-
-            if not node_item:
-                entry_id = self._retrieve_if_exist(item, dst_cursor_id)
-            else:
-                entry_id = node_item.identifier
+            entry_id = node_item.identifier if node_item else None
 
             if not entry_id and item != move_to.name:
                 raise EntryNotFoundError("Destination path is not exist: {}".format(move_to))
@@ -268,7 +494,14 @@ class DriveClient:
             body=body,
             fields="*",
         ).execute()
-        self.cache_tree.move_node(src_cursor_id, new_parents)
+        new_parent_id = new_parents.split(",")[0]
+        if new_parent_id in self.cache_tree:
+            self.cache_tree.add_entry(
+                {"id": src_cursor_id, "name": body["name"], "mimeType": src_mimeType},
+                new_parent_id,
+            )
+        else:
+            self.cache_tree.remove_node(src_cursor_id)
 
     def get_metadata(self, path: PurePosixPath) -> Resource:
         """
@@ -289,6 +522,27 @@ class DriveClient:
         """
         return self._upload_file(bytes(), path, new_file=True)
 
+    def get_start_page_token(self) -> str:
+        """
+        Get a token for listing changes made from now on.
+        """
+        return self.changes_api.getStartPageToken().execute()["startPageToken"]
+
+    def list_changes(self, page_token: str) -> Tuple[list, str]:
+        """
+        List all changes made since given page token. Returns the changes, oldest first, and
+        a token for listing the following ones.
+        """
+        changes: list = []
+        while True:
+            listing = self.changes_api.list(
+                pageToken=page_token, pageSize=1000, spaces="drive", fields=CHANGE_FIELDS
+            ).execute()
+            changes.extend(listing.get("changes", []))
+            if "newStartPageToken" in listing:
+                return changes, listing["newStartPageToken"]
+            page_token = listing["nextPageToken"]
+
     def _retrieve_entries(
         self, query: str = "", fields: str = "nextPageToken, files"
     ) -> list:
@@ -339,49 +593,38 @@ class DriveClient:
 
             node_item = self._retrieve_from_cache_tree(path_item, parent_id)
 
-            if node_item:
-                parent_id = node_item.identifier
-                continue
-
-            query = "'{}' in parents and name='{}'".format(parent_id, path_item)
-            entries = self._retrieve_entries(query)
-
-            if not entries:
+            if not node_item:
                 raise EntryNotFoundError(f"Entries not found for given path: {path}")
 
-            parent_id = entries[0].get("id")
+            parent_id = node_item.identifier
 
         return parent_id
 
-    def _retrieve_if_exist(self, name, parent_id) -> Union[bool, str]:
+    def _retrieve_from_cache_tree(self, item, parent_id) -> Optional[Node]:
         """
-        Retrieves the id of given entry name, if exist under given parent_id
+        Finds given item under the given parent_id. A folder that is not cached yet, or whose
+        listing has expired, is fetched as a whole, so that looking up its other entries (or
+        ones that do not exist) does not need another query.
         """
-        try:
-            query = "'{}' in parents and name='{}'".format(parent_id, name)
-            entries = self._retrieve_entries(query)
-            if not entries:
-                return False
-            return entries[0].get("id")
-        except Exception:
-            return False
+        node_item = self.cache_tree.lookup(parent_id, item)
+        if node_item or self.cache_tree.known_missing(parent_id, item):
+            return node_item
 
-    def _retrieve_from_cache_tree(self, item, parent_id) -> Node:
+        self._prefetch_folder(parent_id)
+        node_item = self.cache_tree.lookup(parent_id, item)
+        if not node_item:
+            self.cache_tree.mark_missing(parent_id, item)
+        return node_item
+
+    def _prefetch_folder(self, folder_id: str) -> None:
         """
-        Checks if cache tree has given item under the given parent_id
+        Reads all entries of given folder into the cache tree.
         """
-        node_item = None
-        try:
-            node_item = next(
-                self.cache_tree.filter_nodes(
-                    lambda node, tag=item: (
-                        node.tag==tag and node.predecessor(self.cache_tree.identifier)==parent_id
-                    )
-                )
-            )
-        except StopIteration:
-            pass
-        return node_item
+        entries = self._retrieve_entries(
+            "'{}' in parents".format(folder_id),
+            fields="nextPageToken, files(id, name, mimeType)",
+        )
+        self.cache_tree.set_listing(folder_id, entries)
 
     def _upload_file(
         self, data: bytes, path: PurePosixPath, new_file: bool = False
@@ -397,13 +640,8 @@ class DriveClient:
 
             node_item = self._retrieve_from_cache_tree(item, cursor_id)
 
-            if not node_item:
-                entry_id = self._retrieve_if_exist(item, cursor_id)
-            else:
-                entry_id = node_item.identifier
-
-            if entry_id:
-                cursor_id = entry_id
+            if node_item:
+                cursor_id = node_item.identifier
 
         media_body = MediaIoBaseUpload(
             BytesIO(data),
@@ -417,9 +655,11 @@ class DriveClient:
                 "mimeType": "application/octet-stream",
                 "parents": [cursor_id],
             }
-            return self.drive_api.create(
+            metadata = self.drive_api.create(
                 body=file_metadata, media_body=media_body, fields="*"
             ).execute()
+            self.cache_tree.add_entry(metadata, cursor_id)
+            return metadata
         return self.drive_api.update(
             fileId=cursor_id, media_body=media_body, fields="*"
         ).execute()
@@ -433,14 +673,9 @@ class DriveClient:
             node_item = self._retrieve_from_cache_tree(item, parent_id)
 
             if not node_item:
-                folder_id = self._retrieve_if_exist(item, parent_id)
-            else:
-                folder_id = node_item.identifier
-
-            if not folder_id:
                 raise EntryNotFoundError("Given path not exist: {}".format(path))
 
-            parent_id = folder_id
+            parent_id = node_item.identifier
 
         try:
             self.drive_api.delete(fileId=parent_id).execute()
@@ -451,6 +686,14 @@ class DriveClient:
             ) from e
 
 
+def is_listed_type(mimetype: str) -> bool:
+    """
+    Check if entries of given mimetype are exposed, that is if they are folders or have binary
+    content (unlike Google Docs files).
+    """
+    return mimetype == FOLDER_MIMETYPE or not mimetype.startswith("application/vnd.google-apps")
+
+
 class EntryNotFoundError(FileNotFoundError):
     """Exception raised if given path does not return any entry from Google Drive"""
 
@@ -0,0 +1,256 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+A local fake of the Google Drive v3 HTTP API, to be passed as ``http`` to
+``googleapiclient.discovery.build()``. It serves the ``files`` and ``changes`` requests made by
+the Google Drive plugin, from an in-memory set of files, and keeps a log of the requests.
+"""
+
+import email
+import email.policy
+import hashlib
+import itertools
+import json
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+ROOT_ID = 'root-folder'
+
+
+class FakeDrive:
+    """
+    In-memory Google Drive, exposing the HTTP API through ``request()``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files: Dict[str, dict] = {}
+        self.contents: Dict[str, bytes] = {}
+        #: requests made, as (method, path) tuples with the API prefix stripped
+        self.requests: List[Tuple[str, str]] = []
+        self.change_log: List[dict] = []
+        self.ids = itertools.count()
+        self.revisions = itertools.count()
+        self.files[ROOT_ID] = self._metadata(ROOT_ID, 'My Drive', FOLDER_MIMETYPE, [])
+
+    # Direct access, for changes made by "another client"
+
+    def add(self, name: str, parent: str = ROOT_ID, content: Optional[bytes] = None) -> str:
+        """
+        Create a file (or a folder, if ``content`` is None).
+        """
+        with self.lock:
+            return self._create({'name': name, 'parents': [parent],
+                                 'mimeType': FOLDER_MIMETYPE if content is None else
+                                 'application/octet-stream'}, content)
+
+    def modify(self, file_id: str, content: Optional[bytes] = None,
+               name: Optional[str] = None, parent: Optional[str] = None) -> None:
+        """
+        Change content, name and/or parent of a file.
+        """
+        with self.lock:
+            entry = self.files[file_id]
+            if content is not None:
+                self._set_content(file_id, content)
+            if name is not None:
+                entry['name'] = name
+            if parent is not None:
+                entry['parents'] = [parent]
+            self._changed(file_id)
+
+    def remove(self, file_id: str) -> None:
+        """
+        Delete a file (permanently, not to the trash).
+        """
+        with self.lock:
+            self._delete(file_id)
+
+    def count(self, method: str, path: str) -> int:
+        """
+        Number of requests made with given method, to paths starting with ``path``.
+        """
+        return sum(1 for request in self.requests
+                   if request[0] == method and request[1].startswith(path))
+
+    # HTTP API
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=None, connection_type=None):  # pylint: disable=unused-argument
+        """
+        Handle a request, as ``httplib2.Http.request()`` would.
+        """
+        url = urlparse(uri)
+        path = re.sub(r'^(/upload)?/drive/v3', '', url.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.lock:
+            self.requests.append((method, path))
+            try:
+                result = self._handle(method, path, query, body, headers or {})
+            except KeyError:
+                return self._response(404, {'error': {'code': 404, 'message': 'Not found'}})
+        if isinstance(result, bytes):
+            return httplib2.Response({'status': 200}), result
+        return self._response(200, result)
+
+    def close(self):
+        """
+        Close connections, as ``httplib2.Http.close()`` would.
+        """
+
+    @staticmethod
+    def _response(status, data):
+        return (httplib2.Response({'status': status, 'content-type': 'application/json'}),
+                json.dumps(data).encode())
+
+    def _handle(self, method, path, query, body, headers):
+        # pylint: disable=too-many-return-statements
+        if path == '/changes/startPageToken':
+            return {'startPageToken': str(len(self.change_log))}
+        if path == '/changes':
+            return self._list_changes(query)
+        if path == '/files' and method == 'GET':
+            return self._list_files(query)
+        if path == '/files' and method == 'POST':
+            metadata, content = self._parse_body(body, headers)
+            return self.files[self._create(metadata, content)]
+
+        file_id = self._file_id(path.split('/')[2])
+        if method == 'GET' and query.get('alt') == 'media':
+            return self.contents[file_id]
+        if method == 'GET':
+            return self.files[file_id]
+        if method == 'DELETE':
+            self._delete(file_id)
+            return {}
+        if method == 'PATCH':
+            return self._update(file_id, query, body, headers)
+        raise NotImplementedError(f'{method} {path}')
+
+    def _file_id(self, file_id: str) -> str:
+        if file_id == 'root':
+            return ROOT_ID
+        if file_id not in self.files:
+            raise KeyError(file_id)
+        return file_id
+
+    @staticmethod
+    def _parse_body(body, headers):
+        content_type = headers.get('content-type', '')
+        if content_type.startswith('multipart/related'):
+            message = email.message_from_bytes(
+                b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body,
+                policy=email.policy.HTTP)
+            metadata_part, media_part = message.iter_parts()
+            return json.loads(metadata_part.get_content()), media_part.get_content()
+        if content_type.startswith('application/json'):
+            return json.loads(body), None
+        return {}, body
+
+    def _list_files(self, query):
+        self.requests[-1] = ('GET', '/files?' + query['q'])
+        parent_match = re.search(r"'([^']*)' in parents", query['q'])
+        assert parent_match
+        parent = self._file_id(parent_match.group(1))
+        name = re.search(r"name ?= ?'([^']*)'", query['q'])
+        files = [entry for entry in self.files.values()
+                 if parent in entry['parents'] and (not name or entry['name'] == name.group(1))]
+        start = int(query.get('pageToken', 0))
+        page_size = int(query.get('pageSize', 100))
+        result: dict = {'files': files[start:start + page_size]}
+        if start + page_size < len(files):
+            result['nextPageToken'] = str(start + page_size)
+        return result
+
+    def _list_changes(self, query):
+        start = int(query['pageToken'])
+        if start > len(self.change_log):
+            raise KeyError(start)
+        page_size = int(query.get('pageSize', 100))
+        result: dict = {'changes': self.change_log[start:start + page_size]}
+        if start + page_size < len(self.change_log):
+            result['nextPageToken'] = str(start + page_size)
+        else:
+            result['newStartPageToken'] = str(len(self.change_log))
+        return result
+
+    @staticmethod
+    def _metadata(file_id, name, mimetype, parents):
+        return {
+            'id': file_id,
+            'name': name,
+            'mimeType': mimetype,
+            'parents': parents,
+            'trashed': False,
+            'modifiedTime': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        }
+
+    def _create(self, metadata, content):
+        file_id = f'file-{next(self.ids)}'
+        self.files[file_id] = self._metadata(
+            file_id, metadata['name'], metadata.get('mimeType', 'application/octet-stream'),
+            [self._file_id(parent) for parent in metadata.get('parents', [ROOT_ID])])
+        if self.files[file_id]['mimeType'] != FOLDER_MIMETYPE:
+            self._set_content(file_id, content or b'')
+        self._changed(file_id)
+        return file_id
+
+    def _update(self, file_id, query, body, headers):
+        metadata, content = self._parse_body(body, headers)
+        entry = self.files[file_id]
+        if 'name' in metadata:
+            entry['name'] = metadata['name']
+        if 'addParents' in query:
+            removed = query.get('removeParents', '').split(',')
+            entry['parents'] = [parent for parent in entry['parents'] if parent not in removed]
+            entry['parents'].extend(query['addParents'].split(','))
+        if content is not None:
+            self._set_content(file_id, content)
+        self._changed(file_id)
+        return entry
+
+    def _set_content(self, file_id, content):
+        entry = self.files[file_id]
+        self.contents[file_id] = content
+        entry['size'] = str(len(content))
+        entry['md5Checksum'] = hashlib.md5(content).hexdigest()
+        entry['headRevisionId'] = f'rev-{next(self.revisions)}'
+
+    def _changed(self, file_id):
+        entry = self.files[file_id]
+        entry['modifiedTime'] = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        self.change_log.append({'fileId': file_id, 'removed': False, 'file': dict(entry)})
+
+    def _delete(self, file_id):
+        for child_id in [child_id for child_id, entry in self.files.items()
+                         if file_id in entry['parents']]:
+            self._delete(child_id)
+        del self.files[file_id]
+        self.contents.pop(file_id, None)
+        self.change_log.append({'fileId': file_id, 'removed': True})
@@ -0,0 +1,216 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# pylint: disable=missing-docstring,redefined-outer-name
+
+import os
+import time
+from pathlib import PurePosixPath
+
+import pytest
+from googleapiclient.discovery import build
+
+from wildland_googledrive import drive_client
+from wildland_googledrive.backend import DriveStorageBackend
+from wildland.storage_backends.watch import FileEvent, FileEventType
+from .fake_drive import FakeDrive, ROOT_ID
+
+
+@pytest.fixture
+def drive(monkeypatch, tmp_path):
+    fake = FakeDrive()
+    monkeypatch.setenv('WILDLAND_CONFIG_DIR', str(tmp_path))
+    monkeypatch.setattr(
+        drive_client, 'build',
+        lambda name, version, credentials: build(name, version, http=fake))
+    return fake
+
+
+def make_backend():
+    return DriveStorageBackend(params={
+        'type': 'googledrive',
+        'backend-id': 'test-drive',
+        'location': '/',
+        'credentials': {
+            'token': 'token',
+            'refresh_token': 'refresh',
+            'token_uri': 'https://oauth2.googleapis.com/token',
+            'client_id': 'client',
+            'client_secret': 'secret',
+            'scopes': ['https://www.googleapis.com/auth/drive'],
+        },
+    })
+
+
+@pytest.fixture
+def backend(drive):  # pylint: disable=unused-argument
+    storage = make_backend()
+    storage.request_mount()
+    yield storage
+    storage.request_unmount()
+
+
+def test_changes_applied_to_cache(drive, backend):
+    dir_id = drive.add('dir')
+    file_id = drive.add('file.txt', dir_id, b'content')
+    backend.poll_changes(force=True)
+
+    assert list(backend.readdir(PurePosixPath('.'))) == ['dir']
+    assert list(backend.readdir(PurePosixPath('dir'))) == ['file.txt']
+    assert backend.getattr(PurePosixPath('dir/file.txt')).size == 7
+    listings = drive.count('GET', '/files?')
+
+    drive.modify(file_id, b'new content')
+    drive.add('other.txt', dir_id, b'other')
+    events = backend.poll_changes(force=True)
+    assert events == [
+        FileEvent(FileEventType.MODIFY, PurePosixPath('dir/file.txt')),
+        FileEvent(FileEventType.CREATE, PurePosixPath('dir/other.txt')),
+    ]
+    assert list(backend.readdir(PurePosixPath('dir'))) == ['file.txt', 'other.txt']
+    assert backend.getattr(PurePosixPath('dir/file.txt')).size == 11
+
+    drive.modify(dir_id, name='renamed')
+    events = backend.poll_changes(force=True)
+    assert events == [
+        FileEvent(FileEventType.DELETE, PurePosixPath('dir')),
+        FileEvent(FileEventType.CREATE, PurePosixPath('renamed')),
+    ]
+    assert list(backend.readdir(PurePosixPath('.'))) == ['renamed']
+    with pytest.raises(FileNotFoundError):
+        backend.getattr(PurePosixPath('dir/file.txt'))
+    listings_after_rename = drive.count('GET', '/files?')
+    assert listings_after_rename == listings
+
+    # contents of a moved directory are listed again, and kept until changed
+    assert list(backend.readdir(PurePosixPath('renamed'))) == ['file.txt', 'other.txt']
+    assert drive.count('GET', '/files?') == listings + 1
+    backend.poll_changes(force=True)
+    assert list(backend.readdir(PurePosixPath('renamed'))) == ['file.txt', 'other.txt']
+    assert drive.count('GET', '/files?') == listings + 1
+
+    drive.remove(file_id)
+    events = backend.poll_changes(force=True)
+    assert events == [FileEvent(FileEventType.DELETE, PurePosixPath('renamed/file.txt'))]
+    assert list(backend.readdir(PurePosixPath('renamed'))) == ['other.txt']
+    assert drive.count('GET', '/files?') == listings + 1
+
+
+def test_changes_polled_at_interval(drive, backend):
+    dir_id = drive.add('dir')
+    backend.changes_interval = 0.1
+    time.sleep(0.1)
+    assert list(backend.readdir(PurePosixPath('.'))) == ['dir']
+
+    drive.add('file.txt', dir_id, b'content')
+    polls = drive.count('GET', '/changes')
+    assert list(backend.readdir(PurePosixPath('.'))) == ['dir']
+    assert drive.count('GET', '/changes') == polls
+
+    time.sleep(0.1)
+    assert list(backend.readdir(PurePosixPath('dir'))) == ['file.txt']
+    assert drive.count('GET', '/changes') == polls + 1
+
+
+def test_own_changes(drive, backend):
+    backend.mkdir(PurePosixPath('dir'))
+    with backend.create(PurePosixPath('dir/file.txt'), os.O_CREAT | os.O_RDWR) as f:
+        f.write(b'content', 0)
+    assert list(backend.readdir(PurePosixPath('dir'))) == ['file.txt']
+
+    file_id = backend.client._get_id_from_path(  # pylint: disable=protected-access
+        PurePosixPath('dir/file.txt'))
+    assert drive.contents[file_id] == b'content'
+
+    backend.poll_changes(force=True)
+    backend.unlink(PurePosixPath('dir/file.txt'))
+    assert file_id not in drive.files
+    # already applied to the cache
+    assert backend.poll_changes(force=True) == []
+    assert not list(backend.readdir(PurePosixPath('dir')))
+
+
+def wait_for_events(events, count):
+    for _ in range(50):
+        if len(events) >= count:
+            return
+        time.sleep(0.1)
+
+
+def test_watcher(drive, backend):
+    events = []
+    backend.changes_interval = 0.1
+    backend.start_watcher(handler=events.extend)
+    try:
+        dir_id = drive.add('dir')
+        drive.add('file.txt', dir_id, b'content')
+        wait_for_events(events, 2)
+        assert events == [
+            FileEvent(FileEventType.CREATE, PurePosixPath('dir')),
+            FileEvent(FileEventType.CREATE, PurePosixPath('dir/file.txt')),
+        ]
+
+        # found by the backend before the watcher checked the feed
+        events.clear()
+        backend.changes_interval = 0.5
+        assert list(backend.readdir(PurePosixPath('dir'))) == ['file.txt']
+        drive.add('other.txt', dir_id, b'other')
+        backend.poll_changes(force=True)
+        wait_for_events(events, 1)
+        assert events == [FileEvent(FileEventType.CREATE, PurePosixPath('dir/other.txt'))]
+    finally:
+        backend.stop_watcher()
+
+
+def test_resume_from_stored_token(drive):
+    dir_id = drive.add('dir')
+    sub_id = drive.add('sub', dir_id)
+    drive.add('file.txt', sub_id, b'content')
+
+    backend = make_backend()
+    backend.request_mount()
+    assert list(backend.readdir(PurePosixPath('dir/sub'))) == ['file.txt']
+    backend.request_unmount()
+
+    drive.add('new.txt', sub_id, b'new')
+    listings = drive.count('GET', '/files?')
+
+    backend = make_backend()
+    backend.request_mount()
+    try:
+        # the path is resolved with the stored tree, only the directory itself is listed
+        assert list(backend.readdir(PurePosixPath('dir/sub'))) == ['file.txt', 'new.txt']
+        assert drive.count('GET', '/files?') == listings + 1
+    finally:
+        backend.request_unmount()
+
+
+def test_expired_token(drive, backend):
+    drive.add('dir')
+    assert list(backend.readdir(PurePosixPath('.'))) == ['dir']
+
+    backend.changes_token = '1000'
+    drive.add('other')
+    assert backend.poll_changes(force=True) == []
+    assert list(backend.readdir(PurePosixPath('.'))) == ['dir', 'other']
+    assert backend.changes_token == str(len(drive.change_log))
+    assert backend.cache_tree.children(ROOT_ID)
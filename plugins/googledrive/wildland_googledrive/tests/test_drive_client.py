@@ -0,0 +1,220 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# pylint: disable=missing-docstring,redefined-outer-name,protected-access
+
+import itertools
+import re
+from pathlib import PurePosixPath
+
+import pytest
+
+from wildland_googledrive import drive_client
+from wildland_googledrive.drive_client import (
+    DriveCacheTree, DriveClient, EntryNotFoundError, FOLDER_MIMETYPE
+)
+
+CREDENTIALS = {
+    'token': 'token',
+    'refresh_token': 'refresh',
+    'token_uri': 'https://oauth2.googleapis.com/token',
+    'client_id': 'client',
+    'client_secret': 'secret',
+    'scopes': ['https://www.googleapis.com/auth/drive'],
+}
+
+
+class Request:
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def execute(self):
+        return self.func(*self.args)
+
+
+class FakeFiles:
+    """
+    In-memory stand-in for the Drive API ``files()`` resource, understanding just the queries
+    the client makes.
+    """
+
+    def __init__(self):
+        self.entries = {'root-id': {'id': 'root-id', 'name': 'root', 'mimeType': FOLDER_MIMETYPE,
+                                    'parents': []}}
+        self.queries = []
+        self.ids = itertools.count()
+
+    def add(self, name, parent='root-id', folder=False):
+        entry_id = f'id-{next(self.ids)}'
+        self.entries[entry_id] = {
+            'id': entry_id,
+            'name': name,
+            'mimeType': FOLDER_MIMETYPE if folder else 'text/plain',
+            'parents': [parent],
+            'modifiedTime': '2022-01-01T00:00:00.000Z',
+        }
+        return entry_id
+
+    def _list(self, q, page_size, page_token):
+        self.queries.append(q)
+        parent = re.search(r"'([^']*)' in parents", q).group(1)
+        name = re.search(r"name ?= ?'([^']*)'", q)
+        files = [entry for entry in self.entries.values()
+                 if parent in entry['parents'] and (not name or entry['name'] == name.group(1))]
+        start = int(page_token or 0)
+        result = {'files': files[start:start + page_size]}
+        if start + page_size < len(files):
+            result['nextPageToken'] = str(start + page_size)
+        return result
+
+    def list(self, q, pageSize, fields, pageToken=None):  # pylint: disable=unused-argument
+        return Request(self._list, q, pageSize, pageToken)
+
+    def get(self, fileId, fields):  # pylint: disable=unused-argument
+        return Request(lambda: dict(self.entries[fileId]))
+
+    def _create(self, body):
+        entry_id = self.add(body['name'], body['parents'][0],
+                            body['mimeType'] == FOLDER_MIMETYPE)
+        return dict(self.entries[entry_id])
+
+    def create(self, body, fields, media_body=None):  # pylint: disable=unused-argument
+        return Request(self._create, body)
+
+    def _update(self, file_id, body, add_parents, remove_parents):
+        entry = self.entries[file_id]
+        entry.update(body or {})
+        if add_parents:
+            entry['parents'] = [p for p in entry['parents'] if p not in remove_parents.split(',')]
+            entry['parents'].extend(add_parents.split(','))
+        return dict(entry)
+
+    # pylint: disable=unused-argument
+    def update(self, fileId, fields, body=None, media_body=None, addParents=None,
+               removeParents=None):
+        return Request(self._update, fileId, body, addParents, removeParents)
+
+    def delete(self, fileId):
+        return Request(self.entries.pop, fileId)
+
+
+@pytest.fixture
+def files():
+    return FakeFiles()
+
+
+@pytest.fixture
+def client(files):
+    tree = DriveCacheTree()
+    tree.create_node('root', 'root-id', data=FOLDER_MIMETYPE)
+    drive = DriveClient(CREDENTIALS, tree)
+    drive.drive_api = files
+    return drive
+
+
+def test_lookup_prefetches_folder(client, files):
+    folder_id = files.add('dir', folder=True)
+    file_ids = [files.add(f'file{i}', folder_id) for i in range(500)]
+
+    # 2 folder listings, the second one in 3 pages
+    assert client._get_id_from_path(PurePosixPath('/dir/file5')) == file_ids[5]
+    assert len(files.queries) == 4
+
+    for i, file_id in enumerate(file_ids):
+        assert client._get_id_from_path(PurePosixPath(f'/dir/file{i}')) == file_id
+    assert len(files.queries) == 4
+
+
+def test_negative_lookup(client, files, monkeypatch):
+    folder_id = files.add('dir', folder=True)
+    with pytest.raises(EntryNotFoundError):
+        client._get_id_from_path(PurePosixPath('/dir/missing'))
+    queries = len(files.queries)
+    with pytest.raises(EntryNotFoundError):
+        client._get_id_from_path(PurePosixPath('/dir/missing'))
+    with pytest.raises(EntryNotFoundError):
+        client._get_id_from_path(PurePosixPath('/dir/other'))
+    assert len(files.queries) == queries
+
+    # created by another client, visible once the negative entry expires
+    file_id = files.add('missing', folder_id)
+    now = drive_client.time.monotonic()
+    monkeypatch.setattr(drive_client.time, 'monotonic',
+                        lambda: now + drive_client.NEGATIVE_CACHE_TIMEOUT)
+    assert client._get_id_from_path(PurePosixPath('/dir/missing')) == file_id
+    assert len(files.queries) == queries + 1
+
+
+def test_index_follows_changes(client, files):
+    client.mkdir(PurePosixPath('dir/sub'))
+    client.upload_empty_file(PurePosixPath('dir/sub/file'))
+    queries = len(files.queries)
+
+    sub_id = client._get_id_from_path(PurePosixPath('dir/sub'))
+    file_id = client._get_id_from_path(PurePosixPath('dir/sub/file'))
+    assert files.entries[file_id]['parents'] == [sub_id]
+
+    client.rename(PurePosixPath('dir/sub/file'), PurePosixPath('dir/sub/renamed'))
+    assert client._get_id_from_path(PurePosixPath('dir/sub/renamed')) == file_id
+    with pytest.raises(EntryNotFoundError):
+        client._get_id_from_path(PurePosixPath('dir/sub/file'))
+
+    client.rename(PurePosixPath('dir/sub/renamed'), PurePosixPath('dir/moved'))
+    assert client._get_id_from_path(PurePosixPath('dir/moved')) == file_id
+    with pytest.raises(EntryNotFoundError):
+        client._get_id_from_path(PurePosixPath('dir/sub/renamed'))
+
+    client.unlink(PurePosixPath('dir/moved'))
+    with pytest.raises(EntryNotFoundError):
+        client._get_id_from_path(PurePosixPath('dir/moved'))
+    assert len(files.queries) == queries
+
+
+def test_listing_replaces_children(client, files):
+    folder_id = files.add('dir', folder=True)
+    old_id = files.add('old', folder_id)
+    assert client._get_id_from_path(PurePosixPath('dir/old')) == old_id
+
+    del files.entries[old_id]
+    new_id = files.add('new', folder_id)
+    assert [entry['name'] for entry in client.list_folder(PurePosixPath('dir'))] == ['new']
+    assert client.cache_tree.lookup(folder_id, 'old') is None
+    assert client.cache_tree.lookup(folder_id, 'new').identifier == new_id
+
+
+def test_cache_tree_duplicate_names():
+    tree = DriveCacheTree()
+    tree.create_node('root', 'root-id')
+    tree.create_node('file', 'first', parent='root-id')
+    tree.create_node('file', 'second', parent='root-id')
+    assert tree.lookup('root-id', 'file').identifier == 'first'
+
+    tree.remove_node('first')
+    assert tree.lookup('root-id', 'file').identifier == 'second'
+
+    tree.update_node('second', tag='other')
+    assert tree.lookup('root-id', 'file') is None
+    assert tree.lookup('root-id', 'other').identifier == 'second'
+
+    tree.clear()
+    assert tree.lookup('root-id', 'other') is None
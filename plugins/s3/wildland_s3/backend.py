@@ -27,7 +27,7 @@ S3 storage backend
 import functools
 from pathlib import PurePosixPath
 from io import BytesIO
-from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional, Tuple
 import mimetypes
 
 from urllib.parse import urlparse
@@ -38,13 +38,14 @@ import stat
 import time
 
 import boto3
+import boto3.s3.transfer
 import botocore
 import click
 
 from wildland.link import Link
 from wildland.storage_backends.base import StorageBackend, Attr
 from wildland.storage_backends.file_children import FileChildrenMixin
-from wildland.storage_backends.buffered import File, FullBufferedFile, PagedFile
+from wildland.storage_backends.buffered import File, SpooledBufferedFile, PagedFile
 from wildland.storage_backends.cached import DirectoryCachedStorageMixin
 from wildland.manifest.schema import Schema
 from wildland.exc import WildlandError
@@ -80,7 +81,7 @@ class S3FileAttr(Attr):
         return cls(size, timestamp, etag)
 
 
-class S3File(FullBufferedFile):
+class S3File(SpooledBufferedFile):
     """
     A buffered S3 file.
     """
@@ -91,7 +92,8 @@ class S3File(FullBufferedFile):
                  key: str,
                  content_type: str,
                  attr: Attr,
-                 update_cache: Callable[[Attr], None]):
+                 update_cache: Callable[[Attr], None],
+                 transfer_config: Optional[boto3.s3.transfer.TransferConfig] = None):
         super().__init__(attr,
                          clear_cache_callback=self.__clear_cache,
                          update_cache_callback=update_cache)
@@ -100,29 +102,25 @@ class S3File(FullBufferedFile):
         self.key = key
         self.content_type = content_type
         self.update_cache = update_cache
+        self.transfer_config = transfer_config
 
-    def read_full(self) -> bytes:
-        response = self.client.get_object(
-            Bucket=self.bucket,
-            Key=self.key,
-        )
-        return response['Body'].read()
+    def read_full_into(self, stream: IO[bytes]) -> None:
+        self.client.download_fileobj(self.bucket, self.key, stream, Config=self.transfer_config)
 
-    def write_full(self, data: bytes) -> int:
-        # Set the Content-Type again, otherwise it will get overwritten with
-        # application/octet-stream.
-        self.client.put_object(
-            Bucket=self.bucket,
-            Key=self.key,
-            Body=BytesIO(data),
-            ContentType=self.content_type)
-        return len(data)
+    def write_full_from(self, stream: IO[bytes], size: int) -> int:
+        # Uploaded in parts (in parallel) if larger than the part size. Set the Content-Type again,
+        # otherwise it will get overwritten with application/octet-stream.
+        self.client.upload_fileobj(
+            stream, self.bucket, self.key,
+            ExtraArgs={'ContentType': self.content_type},
+            Config=self.transfer_config)
+        return size
 
     def __clear_cache(self):
         """
         Get the file info and update a single cache record instead of invalidating the entire cache.
         """
-        response = self.client.get_object(
+        response = self.client.head_object(
             Bucket=self.bucket,
             Key=self.key,
         )
@@ -212,6 +210,12 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
                 "type": "boolean",
                 "description": "Maintain index.html files with directory listings (default: False)",
             },
+            "part-size": {
+                "type": "integer",
+                "minimum": 5 * 1024 ** 2,
+                "description": "Size (in bytes) of parts of multipart uploads and copies; larger "
+                               "files are transferred in parallel parts (default: 8 MiB)",
+            },
             "manifest-pattern": {
                 "oneOf": [
                     {"$ref": "/schemas/types.json#pattern-glob"},
@@ -222,6 +226,11 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
     })
     TYPE = 's3'
     LOCATION_PARAM = 'base_url'
+    HASH_WORKERS = 8
+    #: default size of parts of multipart transfers
+    PART_SIZE = 8 * 1024 ** 2
+    #: number of parts transferred in parallel
+    TRANSFER_WORKERS = 8
 
     INDEX_NAME = '/'
 
@@ -230,6 +239,13 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
 
         self.with_index = self.params.get('with-index', False)
 
+        part_size = self.params.get('part-size', self.PART_SIZE)
+        self.transfer_config = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=self.TRANSFER_WORKERS,
+        )
+
         credentials = self.params['credentials']
         session = boto3.Session(
             aws_access_key_id=credentials['access-key'],
@@ -280,6 +296,8 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
                          help='S3 url to access the resource in s3://<bucket_name>/path format'),
             click.Option(['--with-index'], is_flag=True,
                          help='Maintain index.html files with directory listings'),
+            click.Option(['--part-size'], metavar='BYTES', type=click.IntRange(min=5 * 1024 ** 2),
+                         help='Size of parts of multipart uploads and copies (default: 8 MiB)'),
             click.Option(['--access-key'], required=True,
                          help='S3 access key'),
             click.Option(['--secret-key'], required=True,
@@ -305,6 +323,8 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
             },
             'with-index': data['with_index'],
         })
+        if data.get('part_size'):
+            result['part-size'] = data['part_size']
         return result
 
     def mount(self):
@@ -462,7 +482,8 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
                 content_type = self.get_content_type(path)
                 file = S3File(
                     self.client, self.bucket, self.key(path),
-                    content_type, attr, functools.partial(self.update_cache, path))
+                    content_type, attr, functools.partial(self.update_cache, path),
+                    self.transfer_config)
                 self.open_files[path] = file
                 return file
 
@@ -491,7 +512,8 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
         self.update_cache(path, attr)
         self._update_index(path.parent)
         return S3File(self.client, self.bucket, self.key(path),
-                      content_type, attr, functools.partial(self.update_cache, path))
+                      content_type, attr, functools.partial(self.update_cache, path),
+                      self.transfer_config)
 
     def unlink(self, path: PurePosixPath):
         if self.with_index and path.name == self.INDEX_NAME:
@@ -563,13 +585,15 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
                          f"{self.bucket}/{self.key(move_from)}", self.key(move_to))
 
             # S3 doesn't support renaming. you *must* copy and delete an object
-            # in order to rename
-            self.client.copy_object(
-                Bucket=self.bucket,
-                Key=self.key(move_to),
-                CopySource=f"{self.bucket}/{self.key(move_from)}",
+            # in order to rename. Large objects are copied in ranged parts, server-side.
+            self.client.copy(
+                {'Bucket': self.bucket, 'Key': self.key(move_from)},
+                self.bucket, self.key(move_to),
+                ExtraArgs={'ContentType': self.get_content_type(move_to),
+                           'MetadataDirective': 'REPLACE'},
+                Config=self.transfer_config,
             )
-            self.update_cache(move_to, self.getattr_cache[move_from])
+            self.update_cache(move_to, self.getattr(move_from))
             self.unlink(move_from)
 
     def utimens(self, path: PurePosixPath, atime, mtime) -> None:
@@ -600,6 +624,20 @@ class S3StorageBackend(FileChildrenMixin, DirectoryCachedStorageMixin, StorageBa
 
         return None
 
+    def native_hash_type(self) -> Optional[str]:
+        return 'md5'
+
+    def get_native_hash(self, path: PurePosixPath) -> Optional[str]:
+        # The E-Tag of an object uploaded in a single part (and not encrypted with SSE-C or
+        # SSE-KMS) is the MD5 digest of its content. Multipart E-Tags ("<digest>-<parts>")
+        # depend on the part size, so they cannot be compared with other hashes.
+        attr = self.getattr(path)
+
+        if isinstance(attr, S3FileAttr) and '-' not in attr.etag:
+            return attr.etag
+
+        return None
+
     def start_bulk_writing(self) -> None:
         self.clear_cache()
         self.cache_timeout = float('inf')
@@ -0,0 +1,105 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# pylint: disable=missing-docstring,redefined-outer-name
+
+import os
+from pathlib import PurePosixPath
+
+import pytest
+
+from wildland_s3.backend import S3StorageBackend
+
+moto = pytest.importorskip('moto')
+
+PART_SIZE = 5 * 1024 ** 2
+
+
+@pytest.fixture
+def backend():
+    with moto.mock_aws():
+        storage = S3StorageBackend(params={
+            'type': 's3',
+            'backend-id': 'test-s3',
+            's3_url': 's3://bucket/',
+            'base_url': '/',
+            'credentials': {'access-key': 'key', 'secret-key': 'secret'},
+            'part-size': PART_SIZE,
+        })
+        storage.client.create_bucket(Bucket='bucket')
+        yield storage
+
+
+def _object(storage, key):
+    return storage.client.get_object(Bucket='bucket', Key=key)
+
+
+def test_write_multipart(backend):
+    data = os.urandom(2 * PART_SIZE + 100)
+    with backend.create(PurePosixPath('big.bin'), os.O_CREAT | os.O_RDWR) as f:
+        for offset in range(0, len(data), 128 * 1024):
+            f.write(data[offset:offset + 128 * 1024], offset)
+
+    obj = _object(backend, 'big.bin')
+    assert obj['Body'].read() == data
+    # uploaded in three parts
+    assert obj['ETag'].strip('"').endswith('-3')
+    assert obj['ContentType'] == 'application/octet-stream'
+
+    attr = backend.getattr(PurePosixPath('big.bin'))
+    assert attr.size == len(data)
+    assert attr.etag == obj['ETag'].strip('"')
+
+
+def test_write_refreshes_attributes_without_download(backend, monkeypatch):
+    with backend.create(PurePosixPath('file.txt'), os.O_CREAT | os.O_RDWR) as f:
+        f.write(b'content', 0)
+        monkeypatch.setattr(backend.client, 'get_object', None)
+
+    assert backend.getattr(PurePosixPath('file.txt')).size == 7
+    monkeypatch.undo()
+    assert _object(backend, 'file.txt')['Body'].read() == b'content'
+
+
+def test_read_and_modify(backend):
+    data = os.urandom(PART_SIZE + 10)
+    backend.client.put_object(Bucket='bucket', Key='file.bin', Body=data)
+
+    with backend.open(PurePosixPath('file.bin'), os.O_RDWR) as f:
+        assert f.read(10, PART_SIZE) == data[PART_SIZE:]
+        f.write(b'abc', 0)
+
+    assert _object(backend, 'file.bin')['Body'].read() == b'abc' + data[3:]
+
+
+def test_rename_multipart_copy(backend):
+    data = os.urandom(2 * PART_SIZE + 1)
+    backend.client.put_object(Bucket='bucket', Key='dir/old.txt', Body=data,
+                              ContentType='text/plain')
+
+    backend.rename(PurePosixPath('dir/old.txt'), PurePosixPath('new.bin'))
+
+    obj = _object(backend, 'new.bin')
+    assert obj['Body'].read() == data
+    assert obj['ETag'].strip('"').endswith('-3')
+    assert obj['ContentType'] == 'application/octet-stream'
+    assert 'Contents' not in backend.client.list_objects_v2(Bucket='bucket', Prefix='dir/')
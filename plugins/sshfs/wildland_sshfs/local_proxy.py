@@ -30,6 +30,8 @@ class LocalProxy(StorageBackend):
     as Wildland storage.
     """
 
+    RANGED_WRITES = True
+
     def __init__(self, **kwds):
         super().__init__(**kwds)
         self.inner_mount_point: Optional[PurePosixPath] = None
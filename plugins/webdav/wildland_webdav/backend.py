@@ -26,7 +26,7 @@ WebDAV storage backend
 """
 
 from pathlib import PurePosixPath
-from typing import Iterable, Tuple
+from typing import IO, Iterable, Tuple
 from urllib.parse import urljoin, urlparse, urlunparse, quote, unquote
 import os
 
@@ -37,13 +37,13 @@ from lxml import etree
 import click
 
 from wildland.storage_backends.base import StorageBackend, Attr
-from wildland.storage_backends.buffered import FullBufferedFile, PagedFile
+from wildland.storage_backends.buffered import SpooledBufferedFile, PagedFile
 from wildland.storage_backends.cached import CachedStorageMixin
 from wildland.storage_backends.file_children import FileChildrenMixin
 from wildland.manifest.schema import Schema
 
 
-class WebdavFile(FullBufferedFile):
+class WebdavFile(SpooledBufferedFile):
     """
     A buffered WebDAV file.
     """
@@ -53,23 +53,29 @@ class WebdavFile(FullBufferedFile):
         self.session = session
         self.url = url
 
-    def read_full(self) -> bytes:
-        resp = self.session.request(
-            method='GET',
-            url=self.url,
-            headers={'Accept': '*/*'},
-        )
-        resp.raise_for_status()
-        return resp.content
-
-    def write_full(self, data: bytes) -> int:
+    #: size of chunks read from the server
+    CHUNK_SIZE = 1024 ** 2
+
+    def read_full_into(self, stream: IO[bytes]) -> None:
+        with self.session.request(
+                method='GET',
+                url=self.url,
+                headers={'Accept': '*/*'},
+                stream=True,
+        ) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(self.CHUNK_SIZE):
+                stream.write(chunk)
+
+    def write_full_from(self, stream: IO[bytes], size: int) -> int:
         resp = self.session.request(
             method='PUT',
             url=self.url,
-            data=data,
+            data=stream,
+            headers={'Content-Length': str(size)},
         )
         resp.raise_for_status()
-        return len(data)
+        return size
 
 
 class PagedWebdavFile(PagedFile):
@@ -130,6 +136,8 @@ class WebdavStorageBackend(FileChildrenMixin, CachedStorageMixin, StorageBackend
     })
     TYPE = 'webdav'
     LOCATION_PARAM = 'base_path'
+    HASH_WORKERS = 8
+    BACKGROUND_REFRESH = True
 
     def __init__(self, **kwds):
         super().__init__(**kwds)
@@ -1255,8 +1255,12 @@ def add_mount_watch(obj: ContextObj, container_names):
               help='perform only one-time sync, do not start syncing daemon')
 @click.option('--no-wait', is_flag=True, default=False,
               help="don't wait for a one-shot sync to complete, run in the background")
+@click.option('--jobs', '-j', type=click.IntRange(min=1), metavar='N',
+              help='number of files to hash in parallel in each storage. Default: depends on '
+                   'storage type')
 @click.pass_obj
-def sync_container(obj: ContextObj, target_storage, source_storage, one_shot, no_wait, cont):
+def sync_container(obj: ContextObj, target_storage, source_storage, one_shot, no_wait, jobs,
+                   cont):
     """
     Keep the given container in sync across the local storage and selected remote storage
     (by default the first listed in manifest).
@@ -1270,7 +1274,8 @@ def sync_container(obj: ContextObj, target_storage, source_storage, one_shot, no
     source = client.get_local_storage(container, source_storage)
     target = client.get_remote_storage(container, target_storage)
     job_id = container.sync_id
-    response = client.do_sync(cont, job_id, source.params, target.params, one_shot, unidir=False)
+    response = client.do_sync(cont, job_id, source.params, target.params, one_shot, unidir=False,
+                              jobs=jobs)
 
     click.echo(response)
 
@@ -30,6 +30,8 @@ Client class
 import collections.abc
 import functools
 import glob
+import itertools
+import json
 import os
 import sys
 import time
@@ -56,6 +58,7 @@ from .storage import Storage, _get_storage_by_id_or_type
 from .wlpath import WildlandPath, PathError
 from .manifest.sig import DummySigContext, SodiumSigContext, SigContext
 from .manifest.manifest import ManifestDecryptionKeyUnavailableError, ManifestError, Manifest
+from .manifest.manifest_cache import ManifestCache
 from .session import Session
 from .storage_backends.base import StorageBackend, verify_local_access
 from .fs_client import WildlandFSClient
@@ -78,6 +81,10 @@ class Client:
     A high-level interface for operating on Wildland objects.
     """
 
+    #: largest batch of subcontainers loaded (and signature-verified) together by
+    #: all_subcontainers(); batches start small and double, so the first results come quickly
+    SUBCONTAINER_BATCH_SIZE = 256
+
     def __init__(
             self,
             base_dir: PurePosixPath = None,
@@ -145,6 +152,7 @@ class Client:
                 sig = SodiumSigContext(key_dir)
 
         self.session: Session = Session(sig)
+        self.manifest_cache = ManifestCache(config.base_dir)
 
         self.users: Dict[str, User] = {}
         self.bridges: Set[Bridge] = set()
@@ -420,6 +428,13 @@ class Client:
                                        decrypt=decrypt, trusted_owner=trusted_owner,
                                        local_path=file_path)
 
+        return self._load_object_from_manifest(manifest, object_type, local_owners, expected_owner)
+
+    def _load_object_from_manifest(self,
+                                   manifest: Manifest,
+                                   object_type: Union[WildlandObject.Type, None],
+                                   local_owners: Optional[List[str]] = None,
+                                   expected_owner: Optional[str] = None):
         wl_object = WildlandObject.from_manifest(manifest, self, object_type,
                                                  local_owners=local_owners)
         if expected_owner and wl_object.owner != expected_owner:
@@ -560,10 +575,23 @@ class Client:
         """
         trusted_owner = self.fs_client.find_trusted_owner(path)
         local_owners = self.config.get('local-owners')
-
-        return self.load_object_from_bytes(object_type, path.read_bytes(), file_path=path,
-                                           trusted_owner=trusted_owner, local_owners=local_owners,
-                                           decrypt=decrypt)
+        allow_only_primary_key = object_type == WildlandObject.Type.USER
+        data = path.read_bytes()
+
+        # Verification (and decryption) of an unchanged file is cached on disk,
+        # see ManifestCache for the exact cache key.
+        sig = self.session.sig
+        options = json.dumps([object_type.value if object_type else None, trusted_owner,
+                              allow_only_primary_key, decrypt])
+        manifest = self.manifest_cache.load(path, data, sig, options)
+        if manifest is None:
+            manifest = Manifest.from_bytes(data, sig,
+                                           allow_only_primary_key=allow_only_primary_key,
+                                           decrypt=decrypt, trusted_owner=trusted_owner,
+                                           local_path=path)
+            self.manifest_cache.store(path, data, sig, options, manifest)
+
+        return self._load_object_from_manifest(manifest, object_type, local_owners)
 
     def load_object_from_url_or_dict(self, object_type: Optional[WildlandObject.Type],
                                      obj: Union[str, dict],
@@ -783,6 +811,8 @@ class Client:
             sig = self.session.sig.copy()
             sig.recognize_local_keys()
             client = Client(config=self.config, sig=sig, load=False)
+            client.manifest_cache.close()
+            client.manifest_cache = self.manifest_cache
         else:
             client = self
 
@@ -1195,13 +1225,35 @@ class Client:
         storage = self.get_subcontainer_storage(container)
         if storage:
             with StorageBackend.from_params(storage.params, deduplicate=True) as backend:
-                for _, subcontainer in backend.get_children(self):
-                    assert subcontainer is not None
-                    try:
-                        yield self.load_subcontainer_object(container, storage, subcontainer)
-                    except (WildlandError, ManifestError) as ex:
-                        logger.warning('Container %s: cannot load subcontainer: %s',
-                                       container.uuid, str(ex))
+                children = (subcontainer for _, subcontainer in backend.get_children(self))
+                batch_size = 1
+                while True:
+                    batch = list(itertools.islice(children, batch_size))
+                    if not batch:
+                        break
+                    batch_size = min(batch_size * 2, self.SUBCONTAINER_BATCH_SIZE)
+                    self._preverify_links(batch)
+                    for subcontainer in batch:
+                        assert subcontainer is not None
+                        try:
+                            yield self.load_subcontainer_object(container, storage, subcontainer)
+                        except (WildlandError, ManifestError) as ex:
+                            logger.warning('Container %s: cannot load subcontainer: %s',
+                                           container.uuid, str(ex))
+
+    def _preverify_links(self, subcontainers: List[Union[ContainerStub, Link]]):
+        """
+        Verify signatures of linked subcontainer manifests in one go, see Manifest.preverify().
+        """
+        target_files = []
+        for subcontainer in subcontainers:
+            if isinstance(subcontainer, Link):
+                try:
+                    target_files.append(subcontainer.get_target_file())
+                except Exception:  # pylint: disable=broad-except
+                    # reported when the subcontainer is loaded
+                    continue
+        Manifest.preverify(target_files, self.session.sig)
 
 
     @staticmethod
@@ -1482,7 +1534,7 @@ class Client:
 
     def do_sync(self, container_name: str, job_id: str, source: dict, target: dict,
                 one_shot: bool, unidir: bool, active_events: List[str] = None,
-                wait_if_already_running: bool = False) -> str:
+                wait_if_already_running: bool = False, jobs: Optional[int] = None) -> str:
         """
         Start sync between source and target storages
         """
@@ -1490,6 +1542,8 @@ class Client:
                   'unidirectional': unidir, 'source': source, 'target': target}
         if active_events:
             kwargs['active-events'] = active_events
+        if jobs:
+            kwargs['jobs'] = jobs
         if wait_if_already_running and self.connected_to_sync_daemon:
             self.wait_for_sync(job_id, stop_on_finish=True)
         return self.run_sync_command('start', **kwargs)
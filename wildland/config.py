@@ -220,6 +220,11 @@ class Config:
             'default-containers': [],
             'default-remote-for-container': {},
             'default-cache-template': None,
+            'search-workers': 0,
+            'search-cache-size': 1024,
+            'search-cache-ttl': 300,
+            'sync-max-transfers': 8,
+            'sync-bandwidth': 0,
         }
 
     @staticmethod
@@ -26,8 +26,8 @@ Conflict resolution
 """
 
 import abc
-import functools
 import stat
+import threading
 from pathlib import PurePosixPath
 from typing import List, Dict, Set, Tuple, Optional, Iterable
 import re
@@ -102,6 +102,20 @@ class MountDir:
         if self.children[first].is_empty():
             del self.children[first]
 
+    def find(self, path: PurePosixPath) -> Optional['MountDir']:
+        """
+        Find the node for the given path. Returns ``None`` if the given path is not present in the
+        prefix tree.
+        """
+
+        mount_dir = self
+        for part in path.parts:
+            child = mount_dir.children.get(part)
+            if child is None:
+                return None
+            mount_dir = child
+        return mount_dir
+
     def is_synthetic(self, path: PurePosixPath) -> bool:
         """
         Is this a synthetic directory?
@@ -114,15 +128,9 @@ class MountDir:
         Returns ``False`` for paths not present in the prefix tree.
         """
 
-        mount_dir = self
-
-        while path.parts:
-            first = path.parts[0]
-            if first not in mount_dir.children:
-                return False
-            mount_dir = mount_dir.children[first]
-            path = path.relative_to(first)
-
+        mount_dir = self.find(path)
+        if mount_dir is None:
+            return False
         return len(mount_dir.children) != 0 or len(mount_dir.storage_ids) != 1
 
     def readdir(self, path: PurePosixPath) -> Optional[Iterable[str]]:
@@ -131,15 +139,9 @@ class MountDir:
         the prefix tree.
         """
 
-        mount_dir = self
-
-        while path.parts:
-            first = path.parts[0]
-            if first not in mount_dir.children:
-                return None
-            mount_dir = mount_dir.children[first]
-            path = path.relative_to(first)
-
+        mount_dir = self.find(path)
+        if mount_dir is None:
+            return None
         return mount_dir.children.keys()
 
     def resolve(self, path: PurePosixPath) -> Iterable[Resolved]:
@@ -149,14 +151,40 @@ class MountDir:
         their corresponding paths.
         """
 
-        for storage_id in self.storage_ids:
-            yield Resolved(storage_id, path)
+        parts = path.parts
+        mount_dir = self
+        depth = 0
+        while True:
+            if mount_dir.storage_ids:
+                relpath = PurePosixPath(*parts[depth:])
+                for storage_id in mount_dir.storage_ids:
+                    yield Resolved(storage_id, relpath)
+
+            if depth == len(parts):
+                return
+            child = mount_dir.children.get(parts[depth])
+            if child is None:
+                return
+            mount_dir = child
+            depth += 1
+
+    def mounts_under(self, path: PurePosixPath) -> Iterable[Tuple[PurePosixPath, int]]:
+        """
+        Find all storages mounted on the given path or deeper. Returns pairs of (mount path,
+        storage ID).
+        """
 
-        if path.parts:
-            first = path.parts[0]
-            if first in self.children:
-                rest = path.relative_to(first)
-                yield from self.children[first].resolve(rest)
+        mount_dir = self.find(path)
+        if mount_dir is None:
+            return
+
+        stack = [(path, mount_dir)]
+        while stack:
+            mount_path, mount_dir = stack.pop()
+            for storage_id in mount_dir.storage_ids:
+                yield mount_path, storage_id
+            for name, child in mount_dir.children.items():
+                stack.append((mount_path / name, child))
 
     def relative_storage_ids(self) -> Iterable[int]:
         """
@@ -172,6 +200,61 @@ class MountDir:
                     yield storage_id
 
 
+class ResolveCache:
+    """
+    A prefix tree of cached path resolution results. Keeping the results in a tree allows dropping
+    everything cached on and under a given path at once, without touching the rest of the cache.
+    """
+
+    def __init__(self):
+        self.resolved: Optional[List[Resolved]] = None
+        self.children: Dict[str, 'ResolveCache'] = {}
+
+    def get(self, path: PurePosixPath) -> Optional[List[Resolved]]:
+        """
+        Return the cached result for the given path, or ``None`` if there is none.
+        """
+
+        node = self
+        for part in path.parts:
+            child = node.children.get(part)
+            if child is None:
+                return None
+            node = child
+        return node.resolved
+
+    def put(self, path: PurePosixPath, resolved: List[Resolved]):
+        """
+        Store the result for the given path.
+        """
+
+        node = self
+        for part in path.parts:
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = ResolveCache()
+            node = child
+        node.resolved = resolved
+
+    def invalidate(self, path: PurePosixPath):
+        """
+        Remove the cached results for the given path and all paths under it.
+        """
+
+        if not path.parts:
+            self.resolved = None
+            self.children.clear()
+            return
+
+        node = self
+        for part in path.parts[:-1]:
+            child = node.children.get(part)
+            if child is None:
+                return
+            node = child
+        node.children.pop(path.parts[-1], None)
+
+
 class ConflictResolver(metaclass=abc.ABCMeta):
     """
     Helper class for object resolution. To use, subclass and override the abstract methods.
@@ -197,22 +280,28 @@ class ConflictResolver(metaclass=abc.ABCMeta):
 
     def __init__(self):
         self.root: MountDir = MountDir()
+        # Resolution results depend only on storages mounted on the path and its parents, so
+        # (un)mounting a storage invalidates just the results on and under the mount path.
+        self.resolve_cache = ResolveCache()
+        self.resolve_lock = threading.Lock()
 
     def mount(self, path: PurePosixPath, storage_id: int):
         """
         Add information about a mounted storage.
         """
 
-        self.root.mount(path, storage_id)
-        self._resolve.cache_clear()
+        with self.resolve_lock:
+            self.root.mount(path, storage_id)
+            self.resolve_cache.invalidate(path)
 
     def unmount(self, path: PurePosixPath, storage_id: int):
         """
         Remove information about a mounted storage.
         """
 
-        self.root.unmount(path, storage_id)
-        self._resolve.cache_clear()
+        with self.resolve_lock:
+            self.root.unmount(path, storage_id)
+            self.resolve_cache.invalidate(path)
 
     @abc.abstractmethod
     def storage_getattr(self, ident: int, relpath: PurePosixPath) -> Attr:
@@ -456,9 +545,13 @@ class ConflictResolver(metaclass=abc.ABCMeta):
         # and return possible real storages discovered earlier
         return real_storages + list(start_from.relative_storage_ids())
 
-    @functools.lru_cache(500)
     def _resolve(self, real_path: PurePosixPath) -> List[Resolved]:
-        return list(self.root.resolve(real_path))
+        resolved = self.resolve_cache.get(real_path)
+        if resolved is None:
+            with self.resolve_lock:
+                resolved = list(self.root.resolve(real_path))
+                self.resolve_cache.put(real_path, resolved)
+        return resolved
 
 
 def handle_io_error(func, *args):
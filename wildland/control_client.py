@@ -28,10 +28,12 @@ Client class for the control server
 from pathlib import Path
 import socket
 import json
-from typing import Dict, Iterator, List, Optional
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from .exc import WildlandError
-from .control_server import ControlRequest
+from .control_server import BATCH_COMMAND, FRAMING_COMMAND, ControlRequest, decode_frame, \
+    encode_frame, frame_encodings, read_frame
 from .log import get_logger
 
 logger = get_logger('control-server')
@@ -49,9 +51,21 @@ class ControlClientUnableToConnectError(ControlClientError):
     """
 
 
+class ControlClientConnectionClosedError(ControlClientError):
+    """
+    An error thrown when the server closed the connection before responding.
+    """
+
+
 class ControlClient:
     """
     A client for ControlServer.
+
+    The client is thread-safe: several threads can run commands over the same connection at the
+    same time. Responses are matched to requests by request ID; whichever thread is waiting reads
+    from the socket and hands over messages meant for the others.
+
+    The connection uses the text protocol until :meth:`set_framing` is called.
     """
 
     def __init__(self):
@@ -59,6 +73,16 @@ class ControlClient:
         self.conn_file = None
         self.pending_events = []
         self.id_counter = 1
+        self._send_lock = threading.Lock()
+        # protects id_counter, pending_events and the fields below
+        self._cond = threading.Condition()
+        self._responses: Dict[Any, dict] = {}
+        self._reading = False
+        self._eof = False
+        # payload encoding of length-prefixed frames, None for the text protocol
+        self._encoding: Optional[str] = None
+        # (request ID, encoding) of a set-framing request waiting for its response
+        self._framing_request: Optional[Tuple[Any, str]] = None
 
     def connect(self, path: Path) -> None:
         """
@@ -71,7 +95,9 @@ class ControlClient:
         except OSError as e:
             raise ControlClientUnableToConnectError from e
 
-        self.conn_file = self.conn.makefile()
+        self.conn_file = self.conn.makefile('rb')
+        self._eof = False
+        self._encoding = None
 
     def disconnect(self) -> None:
         """
@@ -92,32 +118,11 @@ class ControlClient:
         a proper format (``container_id`` -> ``container-id``).
 
         Returns a result, or raises :class:`ControlClientError` if the server reported an error.
+        Raises :class:`ControlClientUnableToConnectError` if the command could not be sent (so it
+        is safe to retry it over a new connection).
         """
 
-        assert self.conn
-        assert self.conn_file
-
-        request = ControlRequest(cmd=name, args=kwargs, request_id=self.id_counter)
-        logger.debug('cmd: %s', request)
-        self.conn.sendall(json.dumps(request.raw()).encode() + b'\n\n')
-
-        self.id_counter += 1
-
-        response = None
-        while response is None:
-            message = self._recv_message()
-            if message is None:
-                raise ControlClientError('No response from the server')
-            if 'event' in message:
-                logger.debug('event (pending): %s', message['event'])
-                self.pending_events.append(message['event'])
-            else:
-                response = message
-
-        response_id = response.get('id')
-        if response_id != request.id:
-            raise ControlClientError(
-                f'Wrong response ID: expected {request.id}, got {response_id}')
+        response = self._request(name, kwargs)
 
         if 'error' in response:
             error_class = response['error']['class']
@@ -129,6 +134,132 @@ class ControlClient:
         logger.debug('%s -> %s', name, response['result'])
         return response['result']
 
+    def run_batch(self, commands: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """
+        Run several commands in a single round trip, using the server's ``batch`` command.
+        ``commands`` is a list of (name, arguments) pairs, with arguments named as in
+        :meth:`run_command`.
+
+        Returns a list of results, in order. All commands are executed even if some of them fail;
+        in that case :class:`ControlClientError` is raised afterwards for the first failure.
+        """
+
+        requests = []
+        for name, args in commands:
+            request = ControlRequest(cmd=name, args=args, request_id=None).raw()
+            del request['id']
+            requests.append(request)
+
+        responses = self.run_command(BATCH_COMMAND, commands=requests)
+        assert isinstance(responses, list) and len(responses) == len(commands), \
+            'Invalid response from the server'
+
+        results = []
+        for (name, _args), response in zip(commands, responses):
+            if 'error' in response:
+                error_class = response['error']['class']
+                error_desc = response['error']['desc']
+                raise ControlClientError(f'{name}: {error_class}: {error_desc}')
+            results.append(response['result'])
+        return results
+
+    def set_framing(self, encoding: Optional[str] = None) -> str:
+        """
+        Switch the connection to length-prefixed framing (see :class:`ControlServer`). If
+        ``encoding`` is not given, the most compact encoding supported by both sides is chosen.
+
+        Should be called before other commands are started. Returns the encoding in use; raises
+        :class:`ControlClientError` if the server does not support it (in which case the connection
+        keeps using the text protocol).
+        """
+
+        encodings = [encoding] if encoding else frame_encodings()
+        error = ''
+        for candidate in encodings:
+            response = self._request(FRAMING_COMMAND, {'encoding': candidate}, framing=candidate)
+            if 'error' not in response:
+                logger.debug('using %s framing', candidate)
+                return candidate
+            error = f'{response["error"]["class"]}: {response["error"]["desc"]}'
+            logger.debug('framing %s not supported: %s', candidate, error)
+        raise ControlClientError(error)
+
+    def _request(self, name, args, framing: Optional[str] = None) -> dict:
+        assert self.conn
+        assert self.conn_file
+
+        with self._send_lock:
+            with self._cond:
+                request = ControlRequest(cmd=name, args=args, request_id=self.id_counter)
+                self.id_counter += 1
+                if framing:
+                    assert self._framing_request is None
+                    self._framing_request = (request.id, framing)
+
+            logger.debug('cmd: %s', request)
+            try:
+                if self._encoding:
+                    data = encode_frame(request.raw(), self._encoding)
+                else:
+                    data = json.dumps(request.raw()).encode() + b'\n\n'
+                self.conn.sendall(data)
+            except OSError as e:
+                with self._cond:
+                    self._framing_request = None
+                raise ControlClientUnableToConnectError(f'Failed to send command: {e}') from e
+
+            if framing:
+                # Nothing can be sent until we know the framing used by the server.
+                received = self._receive_until(lambda: request.id in self._responses)
+            else:
+                received = None
+
+        if received is None:
+            received = self._receive_until(lambda: request.id in self._responses)
+        if not received:
+            raise ControlClientConnectionClosedError('No response from the server')
+        with self._cond:
+            return self._responses.pop(request.id)
+
+    def _receive_until(self, predicate: Callable[[], bool]) -> bool:
+        """
+        Receive messages until ``predicate`` (evaluated under ``self._cond``) is true. Only one
+        thread reads from the socket at a time; the others wait for it to dispatch messages.
+
+        Returns ``False`` if the connection was closed first.
+        """
+
+        with self._cond:
+            while not predicate():
+                if self._eof:
+                    return False
+                if self._reading:
+                    self._cond.wait()
+                    continue
+
+                self._reading = True
+                self._cond.release()
+                try:
+                    message = self._recv_message()
+                finally:
+                    self._cond.acquire()
+                    self._reading = False
+                    self._cond.notify_all()
+
+                if message is None:
+                    self._eof = True
+                elif 'event' in message:
+                    logger.debug('event (pending): %s', message['event'])
+                    self.pending_events.append(message['event'])
+                else:
+                    if self._framing_request and self._framing_request[0] == message.get('id'):
+                        # Everything after this response is framed.
+                        if 'result' in message:
+                            self._encoding = self._framing_request[1]
+                        self._framing_request = None
+                    self._responses[message.get('id')] = message
+            return True
+
     def wait_for_events(self) -> List[dict]:
         """
         Wait for the server to send events (or return pending events).
@@ -136,18 +267,13 @@ class ControlClient:
         Empty list means the connection has been closed.
         """
 
-        if self.pending_events:
+        if not self._receive_until(lambda: bool(self.pending_events)):
+            return []
+
+        with self._cond:
             events = self.pending_events
             self.pending_events = []
-            return events
-
-        message = self._recv_message()
-        if not message:
-            return []
-        if 'event' not in message:
-            raise ControlClientError(f'Unexpected message: {message}')
-        logger.debug('event: %s', message['event'])
-        return [message['event']]
+        return events
 
     def iter_events(self) -> Iterator[dict]:
         """
@@ -155,10 +281,13 @@ class ControlClient:
         """
 
         while True:
-            events = self.wait_for_events()
-            if not events:
+            # Take pending events one by one, so that none of them is lost if the caller stops
+            # iterating early.
+            if not self._receive_until(lambda: bool(self.pending_events)):
                 break
-            yield from events
+            with self._cond:
+                event = self.pending_events.pop(0)
+            yield event
 
     def _recv_message(self) -> Optional[dict]:
         """
@@ -167,10 +296,17 @@ class ControlClient:
 
         assert self.conn_file
 
+        if self._encoding:
+            payload = read_frame(self.conn_file)
+            if payload is None:
+                return None
+            return decode_frame(payload, self._encoding)
+
         lines = []
-        for line in self.conn_file:
+        for line_bytes in self.conn_file:
+            line = line_bytes.decode()
             lines.append(line)
-            if line == '\n':
+            if line in ('\n', '\r\n'):
                 break
         # TODO: this doesn't distinguish empty lines from EOF
         # (in case of empty lines, we should raise an error).
@@ -25,19 +25,90 @@
 Socket server for controlling Wildland FS.
 """
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import threading
 from socketserver import ThreadingMixIn, UnixStreamServer, BaseRequestHandler
 from contextlib import closing
 import json
-from typing import Callable, Dict, Optional
+import struct
+from typing import Any, Callable, Dict, List, Optional, Union
 import socket
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from .exc import WildlandError
 from .log import get_logger
 
 logger = get_logger('control-server')
 
+# Built-in command running several commands in one round trip, see ControlServer.
+BATCH_COMMAND = 'batch'
+
+# Built-in command switching the connection to length-prefixed frames, see ControlServer.
+FRAMING_COMMAND = 'set-framing'
+
+# Frame header: payload length as a 4-byte big-endian unsigned integer.
+FRAME_HEADER = struct.Struct('>I')
+
+# Largest accepted frame payload; the header alone could announce up to 4 GiB.
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# Maximum number of requests (with IDs) executed at the same time for a single connection.
+MAX_CONCURRENT_REQUESTS = 8
+
+
+def frame_encodings() -> List[str]:
+    """
+    Payload encodings available for length-prefixed framing, most compact first. ``msgpack`` is
+    available only if the (optional) msgpack package is installed.
+    """
+    if msgpack is not None:
+        return ['msgpack', 'json']
+    return ['json']
+
+
+def encode_frame(message, encoding: str) -> bytes:
+    """
+    Serialize a message as a length-prefixed frame.
+    """
+    if encoding == 'msgpack':
+        payload = msgpack.packb(message, use_bin_type=True)
+    else:
+        payload = json.dumps(message, separators=(',', ':')).encode()
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decode_frame(payload: bytes, encoding: str):
+    """
+    Deserialize a frame payload (without the header).
+    """
+    if encoding == 'msgpack':
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    return json.loads(payload)
+
+
+def read_frame(file, max_size: int = MAX_FRAME_SIZE) -> Optional[bytes]:
+    """
+    Read a single frame payload from a binary file object. Returns ``None`` on EOF.
+
+    Raises ControlRequestError if the frame is larger than ``max_size``; the rest of the stream
+    cannot be trusted after that.
+    """
+    header = file.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > max_size:
+        raise ControlRequestError(f'frame too large: {length} bytes (limit {max_size})')
+    payload = file.read(length)
+    if len(payload) < length:
+        return None
+    return payload
+
 
 class ControlRequestError(WildlandError):
     """
@@ -90,7 +161,17 @@ class ControlRequest:
         """
         try:
             request = json.loads(request_str)
+        except Exception:
+            # pylint: disable=raise-missing-from
+            raise ControlRequestError("Failed to parse request")
+        return cls.from_dict(request)
 
+    @classmethod
+    def from_dict(cls, request):
+        """
+        Create ControlRequest instance from an already deserialized request
+        """
+        try:
             assert isinstance(request, dict), 'expecting a dictionary'
             assert 'cmd' in request, 'expecting "cmd" key'
 
@@ -131,8 +212,12 @@ class ControlHandler(BaseRequestHandler):
     def __init__(self, request, client_address, server):
         self.commands = server.commands
         self.validators = server.validators
-        self.lock = threading.Lock()
+        self.lock = threading.RLock()
         self.close_handlers = []
+        # None for the text protocol, otherwise payload encoding of length-prefixed frames
+        self.encoding: Optional[str] = None
+        # runs requests with IDs, so that a long command does not hold up the other ones
+        self.executor: Optional[ThreadPoolExecutor] = None
 
         # Apparently this calls handle() already.
         super().__init__(request, client_address, server)
@@ -157,14 +242,30 @@ class ControlHandler(BaseRequestHandler):
 
     def handle(self):
         try:
-            with closing(self.request.makefile()) as f:
+            with closing(self.request.makefile('rb')) as f:
                 lines = []
-                for line in f:
+                while True:
+                    if self.encoding:
+                        try:
+                            payload = read_frame(f)
+                        except ControlRequestError as e:
+                            logger.warning('closing connection: %s', e)
+                            self._send_response(None, {'error': {'class': type(e).__name__,
+                                                                 'desc': str(e)}})
+                            break
+                        if payload is None:
+                            break
+                        self._handle_request(payload)
+                        continue
+
+                    line = f.readline().decode()
+                    if not line:
+                        break
                     lines.append(line)
-                    if line == '\n':
+                    if line in ('\n', '\r\n'):
                         request = ''.join(lines)
+                        lines.clear()
                         if request.strip() != '':
-                            lines.clear()
                             self._handle_request(request)
 
                 # The last request can end with EOF instead of separator.
@@ -174,6 +275,7 @@ class ControlHandler(BaseRequestHandler):
         except ConnectionResetError:
             logger.exception('Connection reset when handling request:')
         finally:
+            self._wait_for_requests()
             with self.lock:
                 self.request.close()
             for close_handler in self.close_handlers:
@@ -182,43 +284,124 @@ class ControlHandler(BaseRequestHandler):
     def _send_message(self, message):
         if self.request.fileno() >= 0:
             try:
-                message_bytes = json.dumps(message, indent=2).encode() + b'\n\n'
                 with self.lock:
+                    if self.encoding:
+                        message_bytes = encode_frame(message, self.encoding)
+                    else:
+                        message_bytes = json.dumps(message, indent=2).encode() + b'\n\n'
                     self.request.sendall(message_bytes)
             except Exception:
                 logger.exception('Exception:')
         else:
             logger.warning('Connection closed for %s', message)
 
-    def _handle_request(self, request_str: str):
-        request = None
-        try:
-            request = ControlRequest.from_str(request_str)
-            assert request.cmd in self.commands, f'unknown command: {request.cmd}'
+    def _wait_for_requests(self):
+        """
+        Wait until all the requests being executed in the background are finished.
+        """
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
 
-            args = request.args
-            if self.validators is not None:
-                assert request.cmd in self.validators, f'no validator for command: {request.cmd}'
-                validator = self.validators[request.cmd]
-                validator(args)
+    def _handle_request(self, request_data: Union[str, bytes]):
+        """
+        Parse a request and execute it. Requests with IDs are executed in the background, so that
+        responses to them can be sent out of order; the other ones (and framing changes, which
+        apply to everything after them) in order, blocking the connection.
+        """
+        try:
+            if isinstance(request_data, bytes):
+                assert self.encoding, 'frame received before set-framing'
+                try:
+                    request_dict = decode_frame(request_data, self.encoding)
+                except Exception:
+                    # pylint: disable=raise-missing-from
+                    raise ControlRequestError("Failed to parse request")
+                request = ControlRequest.from_dict(request_dict)
+            else:
+                request = ControlRequest.from_str(request_data)
+        except Exception as e:
+            logger.exception('error when handling: %r', request_data)
+            self._send_response(None, {'error': {'class': type(e).__name__, 'desc': str(e)}})
+            return
+
+        if request.id is not None and request.cmd != FRAMING_COMMAND:
+            if not self.executor:
+                self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS,
+                                                   thread_name_prefix='control-request')
+            self.executor.submit(self._execute_request, request)
+        else:
+            if request.cmd == FRAMING_COMMAND:
+                self._wait_for_requests()
+            self._execute_request(request)
 
-            args = {key.replace('-', '_'): value for key, value in args.items()}
-            result = self.commands[request.cmd](self, **args)
+    def _execute_request(self, request: ControlRequest):
+        encoding = None
+        result: Any
+        try:
+            if request.cmd == BATCH_COMMAND:
+                result = self._run_batch(request.args.get('commands', []))
+            elif request.cmd == FRAMING_COMMAND:
+                requested = request.args.get('encoding', 'json')
+                assert requested in frame_encodings(), f'unsupported encoding: {requested}'
+                encoding = requested
+                result = {'encoding': encoding}
+            else:
+                result = self._run_command(request.cmd, request.args)
 
             response = {'result': result}
             logger.debug('%r -> %r', request, result)
         except Exception as e:
-            logger.exception('error when handling: %r', request or request_str)
+            logger.exception('error when handling: %r', request)
             response = {'error': {'class': type(e).__name__, 'desc': str(e)}}
 
+        self._send_response(request, response, encoding)
+
+    def _send_response(self, request: Optional[ControlRequest], response: dict,
+                       encoding: Optional[str] = None):
         if request and request.id:
             response['id'] = request.id
 
         try:
-            self._send_message(response)
+            with self.lock:
+                # The response still uses the old framing, everything after it the new one.
+                self._send_message(response)
+                if encoding:
+                    self.encoding = encoding
         except Exception:
             logger.exception('error when sending response')
 
+    def _run_command(self, cmd: str, args: dict):
+        assert cmd in self.commands, f'unknown command: {cmd}'
+
+        if self.validators is not None:
+            assert cmd in self.validators, f'no validator for command: {cmd}'
+            validator = self.validators[cmd]
+            validator(args)
+
+        args = {key.replace('-', '_'): value for key, value in args.items()}
+        return self.commands[cmd](self, **args)
+
+    def _run_batch(self, commands: List[dict]) -> List[dict]:
+        """
+        Run commands one by one; return a list of responses (without IDs) in the same order.
+        An error in one command does not stop the following ones.
+        """
+        assert isinstance(commands, list), 'expecting a list of commands'
+
+        responses = []
+        for command in commands:
+            try:
+                assert isinstance(command, dict) and 'cmd' in command, \
+                    'expecting a dictionary with "cmd" key'
+                assert command['cmd'] != BATCH_COMMAND, 'nested batch commands are not allowed'
+                result = self._run_command(command['cmd'], command.get('args', {}))
+                responses.append({'result': result})
+            except Exception as e:
+                logger.exception('error when handling batched command: %r', command)
+                responses.append({'error': {'class': type(e).__name__, 'desc': str(e)}})
+        return responses
+
 
 class SocketServer(ThreadingMixIn, UnixStreamServer):
     # pylint: disable=missing-class-docstring
@@ -254,6 +437,26 @@ class ControlServer:
     In case of error:
 
         {"error": {"class": "<class>", "desc": "<description>"}, "id": 10}
+
+    Several commands can be sent in one round trip using the built-in "batch"
+    command:
+
+        {"cmd": "batch", "args": {"commands": [{"cmd": "<name>", "args": {...}}, ...]}, "id": 11}
+
+    Its result is a list of responses (in the format above, without "id"), one
+    for each command, in order.
+
+    The text protocol above is the default. A client can switch its connection
+    to length-prefixed framing with the built-in "set-framing" command:
+
+        {"cmd": "set-framing", "args": {"encoding": "json"}, "id": 12}
+
+    The response ({"result": {"encoding": "json"}, "id": 12}) is still sent
+    as text. All subsequent messages, in both directions, are frames: a 4-byte
+    big-endian payload length followed by the payload, in compact JSON
+    ("json") or msgpack ("msgpack", available only if the msgpack package is
+    installed). An unsupported encoding results in an error response and no
+    change of framing.
     """
 
     def __init__(self):
@@ -27,10 +27,11 @@ Wildland FS client
 """
 import itertools
 import os
+import threading
 import time
 from pathlib import Path, PurePosixPath
 import subprocess
-from typing import Callable, Dict, List, Optional, Iterable, Tuple, Iterator, Union
+from typing import Any, Callable, Dict, List, Optional, Iterable, Tuple, Iterator, Union
 import json
 import sys
 import hashlib
@@ -43,7 +44,8 @@ from .container import Container, ContainerStub
 from .link import Link
 from .storage import Storage
 from .exc import WildlandError
-from .control_client import ControlClient, ControlClientUnableToConnectError
+from .control_client import ControlClient, ControlClientError, ControlClientUnableToConnectError, \
+    ControlClientConnectionClosedError
 from .entity.fileinfo import FileInfo
 from .manifest.manifest import Manifest
 from .storage_backends.base import StorageBackend
@@ -136,6 +138,10 @@ class WildlandFSClient:
         self.path_tree: Optional[PathTree] = None
         self.info_cache: Optional[Dict[int, StorageInfo]] = None
 
+        # persistent connection for run_control_command(), see _get_control_client()
+        self._control_client: Optional[ControlClient] = None
+        self._control_client_lock = threading.Lock()
+
     def clear_cache(self) -> None:
         """
         Clear cached information after changing state of the system.
@@ -158,6 +164,7 @@ class WildlandFSClient:
             default_user: specify a different default user
         """
         self.clear_cache()
+        self._close_control_client()
         cmd = [sys.executable, '-m', 'wildland.fs', str(self.mount_dir)]
         options = [
             'socket=' + str(self.socket_path),
@@ -208,6 +215,7 @@ class WildlandFSClient:
         Stop Wildland.
         """
         self.clear_cache()
+        self._close_control_client()
         cmd = ['umount', str(self.mount_dir)]
         try:
             subprocess.run(cmd, check=True, stderr=subprocess.PIPE)
@@ -233,14 +241,70 @@ class WildlandFSClient:
         Run a command using the control socket.
         """
 
-        # TODO: This creates a new connection for every command. Improve
-        # performance by keeping an open connection.
-        client = ControlClient()
-        client.connect(self.socket_path)
+        return self._run_with_control_client(lambda client: client.run_command(name, **kwargs))
+
+    def run_control_batch(self, commands: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """
+        Run several commands using the control socket, in a single round trip. ``commands`` is a
+        list of (name, arguments) pairs; returns a list of results.
+        """
+
+        return self._run_with_control_client(lambda client: client.run_batch(commands))
+
+    def _run_with_control_client(self, func: Callable[[ControlClient], Any]) -> Any:
+        """
+        Call ``func`` with the persistent control connection. If the command could not be sent
+        (e.g. the daemon was restarted in the meantime), reconnect and try once more.
+        """
+
+        client = self._get_control_client()
         try:
-            return client.run_command(name, **kwargs)
-        finally:
-            client.disconnect()
+            return func(client)
+        except ControlClientUnableToConnectError:
+            self._close_control_client(client)
+            client = self._get_control_client()
+        except (OSError, ControlClientConnectionClosedError):
+            # the connection is broken, open a new one next time
+            self._close_control_client(client)
+            raise
+
+        try:
+            return func(client)
+        except (OSError, ControlClientUnableToConnectError, ControlClientConnectionClosedError):
+            self._close_control_client(client)
+            raise
+
+    def _get_control_client(self) -> ControlClient:
+        with self._control_client_lock:
+            if self._control_client is None:
+                client = ControlClient()
+                client.connect(self.socket_path)
+                try:
+                    client.set_framing()
+                except ControlClientConnectionClosedError:
+                    client.disconnect()
+                    raise
+                except ControlClientError:
+                    # older daemon, stay with the text protocol
+                    logger.debug('length-prefixed framing not supported by the server')
+                self._control_client = client
+            return self._control_client
+
+    def _close_control_client(self, client: Optional[ControlClient] = None) -> None:
+        """
+        Close the persistent control connection (only if it is still ``client``, if given).
+        """
+
+        with self._control_client_lock:
+            if self._control_client is None:
+                return
+            if client is not None and client is not self._control_client:
+                return
+            try:
+                self._control_client.disconnect()
+            except OSError:
+                pass
+            self._control_client = None
 
     def ensure_mounted(self) -> None:
         """
@@ -401,6 +465,18 @@ class WildlandFSClient:
         self.clear_cache()
         self.run_control_command('unmount', storage_id=storage_id)
 
+    def unmount_storages(self, storage_ids: List[int]) -> None:
+        """
+        Unmount storages with given storage ids, in a single round trip. All of them are
+        unmounted even if some fail; the first failure is raised afterwards.
+        """
+
+        if not storage_ids:
+            return
+        self.clear_cache()
+        self.run_control_batch([('unmount', {'storage_id': storage_id})
+                                for storage_id in storage_ids])
+
     def find_primary_storage_id(self, container: Container) -> Optional[int]:
         """
         Find primary storage ID for a given container.
@@ -24,13 +24,19 @@ Hash db.
 """
 
 import sqlite3
+import threading
+import weakref
 from pathlib import PurePosixPath
-from typing import List, Optional, Tuple, NamedTuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple, NamedTuple
 
 from .log import get_logger
 
 logger = get_logger('hashdb')
 
+# SQLite refuses statements with more host parameters than this (SQLITE_MAX_VARIABLE_NUMBER is
+# 999 in older builds), so bulk lookups are split into chunks.
+BULK_CHUNK_SIZE = 500
+
 
 class HashCache(NamedTuple):
     """
@@ -40,16 +46,44 @@ class HashCache(NamedTuple):
     token: str
 
 
+class _ThreadConnection:
+    """
+    Holder of a connection owned by a single thread. It is stored in thread-local data, so it is
+    released (and the connection closed, see :meth:`HashDb._connect`) when the thread exits.
+    """
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _close_connection(conn: sqlite3.Connection, connections: Set[sqlite3.Connection],
+                      lock: threading.RLock) -> None:
+    with lock:
+        connections.discard(conn)
+    conn.close()
+
+
 class HashDb:
     """
     Class that handles operations related to hash storage and retrieval, and auxiliary
     functions like tracking which storage has been noted to be associated with a given
     container.
+
+    The database keeps one persistent connection per thread (opened lazily, in WAL mode) instead
+    of connecting on every call. A thread's connection is closed when the thread exits, or by
+    :meth:`close`.
     """
     def __init__(self, base_dir: PurePosixPath):
         self.base_dir = base_dir
         self.hash_db_path = base_dir / 'wlhashes.db'
-        with sqlite3.connect(self.hash_db_path) as conn:
+        self._local = threading.local()
+        self._connections: Set[sqlite3.Connection] = set()
+        # reentrant, as a finalizer closing a connection can run during garbage collection
+        # in any thread, including one holding the lock
+        self._connections_lock = threading.RLock()
+
+        with self._connect() as conn:
             self._create_container_backends_table(conn)
 
             if self._hashes_table_has_outdated_schema(conn):
@@ -58,17 +92,46 @@ class HashDb:
 
             self._create_hashes_table_if_not_exist(conn)
 
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Return the connection owned by the current thread, creating it if necessary.
+        """
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            # The connection is used only by this thread, but may be closed from another one
+            conn = sqlite3.connect(self.hash_db_path, check_same_thread=False)
+            # WAL lets readers proceed while another connection (thread or process) writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            holder = _ThreadConnection(conn)
+            self._local.holder = holder
+            with self._connections_lock:
+                self._connections.add(conn)
+            weakref.finalize(holder, _close_connection, conn, self._connections,
+                             self._connections_lock)
+        return holder.conn
+
+    def close(self) -> None:
+        """
+        Close all connections opened by this object (in any thread). Connections are opened again
+        as needed.
+        """
+        self._local = threading.local()
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+
     @staticmethod
     def _hashes_table_has_outdated_schema(conn) -> bool:
-        cursor = conn.cursor()
         table_name = 'hashes'
         column_name = 'token'
-        cursor.execute('SELECT type FROM pragma_table_info(?) WHERE name = ?',
-                       (table_name, column_name))
-        result = cursor.fetchone()
+        result = conn.execute('SELECT type FROM pragma_table_info(?) WHERE name = ?',
+                              (table_name, column_name)).fetchall()
         if not result:
             return False
-        (column_type,) = result
+        (column_type,) = result[0]
         # hashes.token column used to be integer instead of a string
         return column_type != 'TEXT'
 
@@ -96,17 +159,16 @@ class HashDb:
         """
         Storage information that given storages were associated with the given container.
         """
-        with sqlite3.connect(self.hash_db_path) as conn:
-            for storage in storages:
-                conn.execute('INSERT OR REPLACE INTO container_backends VALUES (?, ?)',
-                             (container_uuid, storage.backend_id))
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO container_backends VALUES (?, ?)',
+                             [(container_uuid, storage.backend_id) for storage in storages])
 
     def get_conflicts(self, container_uuid) -> List[Tuple[str, str, str]]:
         """
         List all known file conflicts for a given storage across all known backends; the result
         is a list of tuples (path, container_1_uuid, container_2_uuid).
         """
-        with sqlite3.connect(self.hash_db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 'SELECT DISTINCT h1.path, c1.backend_id, c2.backend_id '
@@ -127,10 +189,23 @@ class HashDb:
         :param hash_cache: HashCache named tuple (with two elements, hash (sha256 hash) and token)
         :return: None
         """
-        with sqlite3.connect(self.hash_db_path) as conn:
+        with self._connect() as conn:
             conn.execute('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)',
                          (backend_id, str(path), hash_cache.hash, hash_cache.token))
 
+    def store_hashes_bulk(self, backend_id, hashes: Iterable[Tuple[PurePosixPath, HashCache]]) \
+            -> None:
+        """
+        Stores many HashCache tuples in a single transaction.
+        :param backend_id: uuid of the backend
+        :param hashes: iterable of (path, HashCache) pairs; path can be PurePosixPath or str
+        :return: None
+        """
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)',
+                             ((backend_id, str(path), hash_cache.hash, hash_cache.token)
+                              for path, hash_cache in hashes))
+
     def retrieve_hash(self, backend_id, path) -> Optional[HashCache]:
         """
         Retrieve hash (if available) for a given path.
@@ -138,13 +213,37 @@ class HashDb:
         :param path: path to file (can be PurePosixPath or str)
         :return: HashCache named tuple (with two elements, hash (sha256 hash) and token)
         """
-        with sqlite3.connect(self.hash_db_path) as conn:
-            cursor = conn.cursor()
+        conn = self._connect()
+        # fetch all rows, so that the statement is reset and does not keep a read transaction
+        # (and thus a stale WAL snapshot) open on this persistent connection
+        result = conn.execute(
+            'SELECT hash, token from hashes WHERE backend_id = ? AND path = ?',
+            (backend_id, str(path))).fetchall()
+        if not result:
+            return None
+        hash_value, token = result[0]
+        return HashCache(hash_value, token)
+
+    def retrieve_hashes_bulk(self, backend_id, paths: Iterable[PurePosixPath]) \
+            -> Dict[str, HashCache]:
+        """
+        Retrieve hashes (if available) for many paths at once.
+        :param backend_id: uuid of the backend
+        :param paths: iterable of paths to files (can be PurePosixPath or str)
+        :return: dict mapping path (as str) to HashCache named tuple; paths without a stored hash
+            are omitted
+        """
+        str_paths = [str(path) for path in paths]
+        result: Dict[str, HashCache] = {}
+        conn = self._connect()
+        cursor = conn.cursor()
+        for i in range(0, len(str_paths), BULK_CHUNK_SIZE):
+            chunk = str_paths[i:i + BULK_CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
             cursor.execute(
-                'SELECT hash, token from hashes WHERE backend_id = ? AND path = ?',
-                (backend_id, str(path)))
-            result = cursor.fetchone()
-            if not result:
-                return None
-            hash_value, token = result
-            return HashCache(hash_value, token)
+                f'SELECT path, hash, token from hashes '
+                f'WHERE backend_id = ? AND path IN ({placeholders})',
+                (backend_id, *chunk))
+            for path, hash_value, token in cursor.fetchall():
+                result[path] = HashCache(hash_value, token)
+        return result
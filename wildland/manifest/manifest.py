@@ -25,7 +25,7 @@
 Classes for handling signed Wildland manifests
 """
 
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Iterable, List
 import re
 from pathlib import Path
 
@@ -499,6 +499,27 @@ class Manifest:
 
         return manifest
 
+    @classmethod
+    def preverify(cls, data_list: Iterable[bytes], sig_context: SigContext) -> None:
+        """
+        Verify signatures of many manifests at once (see SigContext.verify_many), so that loading
+        them with from_bytes() afterwards does not verify them again. Unsigned and malformed
+        manifests are skipped; errors are reported only when the manifest is actually loaded.
+        """
+
+        items: List[Tuple[str, bytes, Optional[str]]] = []
+        for data in data_list:
+            try:
+                header_data, rest_data = split_header(data)
+                header = Header.from_bytes(header_data)
+            except ManifestError:
+                continue
+            if header.signature is not None:
+                items.append((header.signature, rest_data, None))
+
+        if items:
+            sig_context.verify_many(items)
+
     def to_bytes(self):
         """
         Serialize the manifest, including the signature.
@@ -557,6 +578,7 @@ class Manifest:
         # Add the retrieved pubkey(s) to the sig context
         if primary_pubkey and primary_owner:
             sig_context.keys[primary_owner] = primary_pubkey
+            sig_context.invalidate_cache_token()
 
         for pubkey in pubkeys:
             sig_context.add_pubkey(pubkey, owner)
@@ -0,0 +1,190 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""
+Persistent cache of verified manifests.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import weakref
+from hashlib import sha256
+from pathlib import Path
+from typing import Optional, Set
+
+from .manifest import Header, Manifest, split_header
+from .sig import SigContext
+from ..hashdb import _ThreadConnection, _close_connection
+from ..log import get_logger
+
+logger = get_logger('manifest-cache')
+
+
+class ManifestCache:
+    """
+    On-disk cache of manifest fields that have already been verified (and decrypted), so that
+    loading an unchanged manifest file does not need YAML parsing and signature verification.
+
+    An entry is keyed by the file path, its mtime, size and content hash, the state of keys in the
+    SigContext (see :meth:`SigContext.cache_token`) and the loading options (trusted owner etc.).
+    Any change to either of them makes the entry miss, and the manifest is loaded normally.
+
+    The cache holds decrypted manifest fields, so the database (and its WAL files) is readable
+    only by the owner.
+
+    Like HashDb, keeps one persistent SQLite connection per thread.
+    """
+
+    def __init__(self, base_dir: Path):
+        self.db_path: Optional[Path] = base_dir / 'manifest-cache.db'
+        self._local = threading.local()
+        self._connections: Set[sqlite3.Connection] = set()
+        # reentrant, see HashDb
+        self._connections_lock = threading.RLock()
+
+        try:
+            self._restrict_permissions()
+            with self._connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS manifests '
+                             '(path TEXT NOT NULL PRIMARY KEY, '
+                             'mtime_ns INTEGER NOT NULL, '
+                             'size INTEGER NOT NULL, '
+                             'content_hash TEXT NOT NULL, '
+                             'key_token TEXT NOT NULL, '
+                             'options TEXT NOT NULL, '
+                             'fields TEXT NOT NULL)')
+        except (OSError, sqlite3.Error) as e:
+            logger.warning('Cannot use manifest cache [%s]: %s', self.db_path, e)
+            self.close()
+            self.db_path = None
+
+    def _restrict_permissions(self) -> None:
+        """
+        Create the database file readable only by the owner, and fix the mode of existing files.
+        SQLite creates the -wal and -shm files with the mode of the database file.
+        """
+        assert self.db_path
+        os.close(os.open(self.db_path, os.O_RDWR | os.O_CREAT, 0o600))
+        for suffix in ('', '-wal', '-shm'):
+            path = self.db_path.with_name(self.db_path.name + suffix)
+            if path.exists():
+                os.chmod(path, 0o600)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Return the connection owned by the current thread, creating it if necessary.
+        """
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            assert self.db_path
+            # used only by this thread, but may be closed from another one
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            holder = _ThreadConnection(conn)
+            self._local.holder = holder
+            with self._connections_lock:
+                self._connections.add(conn)
+            weakref.finalize(holder, _close_connection, conn, self._connections,
+                             self._connections_lock)
+        return holder.conn
+
+    def close(self) -> None:
+        """
+        Close all connections opened by this object (in any thread).
+        """
+        self._local = threading.local()
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+        """
+        if self.db_path is None:
+            return
+        with self._connect() as conn:
+            conn.execute('DELETE FROM manifests')
+
+    @staticmethod
+    def _key(path: Path, data: bytes, sig: SigContext, options: str) -> tuple:
+        st = path.stat()
+        return (str(path), st.st_mtime_ns, st.st_size, sha256(data).hexdigest(),
+                sig.cache_token(), options)
+
+    def load(self, path: Path, data: bytes, sig: SigContext, options: str) -> Optional[Manifest]:
+        """
+        Return the verified manifest for the given file content, or ``None`` if not cached.
+
+        :param path: path of the manifest file
+        :param data: current content of the file
+        :param sig: SigContext the manifest would be verified with
+        :param options: loading options affecting verification, serialized to a string
+        """
+        if self.db_path is None:
+            return None
+
+        try:
+            result = self._connect().execute(
+                'SELECT fields FROM manifests WHERE path = ? AND mtime_ns = ? AND size = ? '
+                'AND content_hash = ? AND key_token = ? AND options = ?',
+                self._key(path, data, sig, options)).fetchall()
+        except (OSError, sqlite3.Error) as e:
+            logger.debug('manifest cache lookup failed for %s: %s', path, e)
+            return None
+
+        if not result:
+            return None
+
+        (fields_json,) = result[0]
+        header_data, rest_data = split_header(data)
+        return Manifest(Header.from_bytes(header_data), json.loads(fields_json), rest_data,
+                        local_path=path)
+
+    def store(self, path: Path, data: bytes, sig: SigContext, options: str,
+              manifest: Manifest) -> None:
+        """
+        Store a manifest just verified by :meth:`Manifest.from_bytes` from the given file content.
+        Manifests with fields that do not survive a JSON round trip unchanged (for example
+        non-string dictionary keys, which JSON turns into strings) are not cached.
+        """
+        if self.db_path is None:
+            return
+
+        try:
+            fields_json = json.dumps(manifest.fields)
+        except (TypeError, ValueError):
+            return
+        if json.loads(fields_json) != manifest.fields:
+            logger.debug('not caching manifest %s: fields changed by JSON serialization', path)
+            return
+
+        try:
+            with self._connect() as conn:
+                conn.execute('INSERT OR REPLACE INTO manifests VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (*self._key(path, data, sig, options), fields_json))
+        except (OSError, sqlite3.Error) as e:
+            logger.debug('cannot cache manifest %s: %s', path, e)
@@ -26,11 +26,15 @@ Module for handling signatures. Provides two backends: libsodium/pynacl (SodiumS
 "dummy" one.
 """
 
-from typing import Optional, TypeVar, Dict, Tuple, List, Iterable
+from collections import OrderedDict
+from typing import Optional, TypeVar, Dict, Tuple, List, Iterable, Union
 from pathlib import Path
+import functools
 import os
 import base64
+import json
 import stat
+import threading
 from hashlib import sha256
 
 import nacl.utils
@@ -57,6 +61,52 @@ class SigError(WildlandError):
 T = TypeVar('T')
 
 
+class VerifiedSignatures:
+    """
+    A process-wide LRU memo of successfully verified signatures, so that the same signed bytes are
+    not verified again. Keyed by (pubkey, signature, data digest); the value is the signer.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Tuple[str, bytes, bytes], str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(pubkey: str, signature_bytes: bytes, data: bytes) -> Tuple[str, bytes, bytes]:
+        """
+        Return a memo key for the given signature.
+        """
+        return pubkey, signature_bytes, sha256(data).digest()
+
+    def get(self, key: Tuple[str, bytes, bytes]) -> Optional[str]:
+        """
+        Return the signer if the signature has already been verified.
+        """
+        with self._lock:
+            signer = self._entries.get(key)
+            if signer is not None:
+                self._entries.move_to_end(key)
+            return signer
+
+    def put(self, key: Tuple[str, bytes, bytes], signer: str) -> None:
+        """
+        Remember a successfully verified signature.
+        """
+        with self._lock:
+            self._entries[key] = signer
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Forget all verified signatures.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
 class SigContext:
     """
     A class for signing and verifying signatures. Operates on 'owner'
@@ -71,6 +121,8 @@ class SigContext:
         self.private_keys: Dict[str, str] = {}
         self.key_ownership: Dict[str, List[str]] = {}
         self.use_local_keys = False
+        # memoized cache_token(), with the key_dir state it was computed for
+        self._cache_token: Optional[Tuple[object, str]] = None
 
     @staticmethod
     def fingerprint(pubkey: str) -> str:
@@ -133,6 +185,7 @@ class SigContext:
             private_key = private_key_file.read_text()
             self.private_keys[key_id] = private_key
 
+        self.invalidate_cache_token()
         return key_id
 
     def get_all_pubkeys(self, owner: str):
@@ -195,6 +248,21 @@ class SigContext:
         """
         raise NotImplementedError()
 
+    def verify_many(self, items: Iterable[Tuple[str, bytes, Optional[str]]]) \
+            -> List[Union[str, SigError]]:
+        """
+        Verify many signatures at once. Takes (signature, data, pubkey) triples, with the same
+        meaning as in verify(), and returns for each of them (in order) either the recognized owner
+        or the SigError that verify() would raise.
+        """
+        results: List[Union[str, SigError]] = []
+        for signature, data, pubkey in items:
+            try:
+                results.append(self.verify(signature, data, pubkey))
+            except SigError as e:
+                results.append(e)
+        return results
+
     def is_valid_pubkey(self, key: str) -> bool:
         """
         Verify that given string is a valid public key
@@ -210,6 +278,45 @@ class SigContext:
             owners.extend(self.key_ownership[signer])
         return owners
 
+    def cache_token(self) -> str:
+        """
+        Return a token identifying the current state of recognized keys. Results of verification
+        and decryption done with this context (see ManifestCache) stay valid only as long as the
+        token does not change.
+
+        The token is memoized; methods changing the keys call :meth:`invalidate_cache_token`, and
+        code modifying the key dictionaries directly has to do the same. Keys in key_dir are
+        tracked through the directory's modification time.
+        """
+        key_dir_mtime = None
+        if self.use_local_keys:
+            try:
+                key_dir_mtime = self.key_dir.stat().st_mtime_ns
+            except OSError:
+                pass
+        key_dir_state = (self.use_local_keys, key_dir_mtime)
+        if self._cache_token is not None and self._cache_token[0] == key_dir_state:
+            return self._cache_token[1]
+
+        state: list = [
+            sorted(self.keys.items()),
+            sorted((key_id, sorted(owners)) for key_id, owners in self.key_ownership.items()),
+            sorted(self.private_keys),
+            self.use_local_keys,
+        ]
+        if self.use_local_keys:
+            # keys that can be loaded from key_dir on demand
+            state.append(sorted(path.name for path in self.key_dir.glob('*.pub')))
+        token = sha256(json.dumps(state).encode()).hexdigest()
+        self._cache_token = (key_dir_state, token)
+        return token
+
+    def invalidate_cache_token(self) -> None:
+        """
+        Forget the memoized :meth:`cache_token`, after the recognized keys have changed.
+        """
+        self._cache_token = None
+
     def remove_owner(self, owner: str):
         """
         Remove a given key from owners' lists of others keys (in local context).
@@ -218,6 +325,7 @@ class SigContext:
         for key_id in self.key_ownership:
             if owner in self.key_ownership[key_id]:
                 self.key_ownership[key_id].remove(owner)
+        self.invalidate_cache_token()
 
     def remove_key(self, key_id):
         """
@@ -233,6 +341,7 @@ class SigContext:
             del self.keys[key_id]
         if key_id in self.key_ownership:
             del self.key_ownership[key_id]
+        self.invalidate_cache_token()
 
     def is_private_key_available(self, key_id: str) -> bool:
         """
@@ -300,6 +409,7 @@ class DummySigContext(SigContext):
             else:
                 self.key_ownership[key_id] = [owner]
         self.private_keys[key_id] = pubkey
+        self.invalidate_cache_token()
         return key_id
 
     def get_primary_pubkey(self, owner: str) -> str:
@@ -329,6 +439,7 @@ class DummySigContext(SigContext):
             del self.keys[key_id]
         if key_id in self.key_ownership:
             del self.key_ownership[key_id]
+        self.invalidate_cache_token()
 
     def is_private_key_available(self, key_id):
         return key_id in self.private_keys
@@ -360,6 +471,29 @@ class DummySigContext(SigContext):
         return
 
 
+@functools.lru_cache(maxsize=1024)
+def _verify_key(pubkey_bytes: bytes) -> VerifyKey:
+    """
+    Return a parsed signing public key. Cached, since the same keys sign most manifests.
+    """
+    return VerifyKey(pubkey_bytes, encoder=RawEncoder)
+
+
+def _verify_chunk(items: List[Tuple[bytes, bytes, bytes]]) -> List[bool]:
+    """
+    Check (signing pubkey bytes, signature bytes, data) triples, see
+    SodiumSigContext.verify_many().
+    """
+    results = []
+    for pubkey_bytes, signature_bytes, data in items:
+        try:
+            _verify_key(pubkey_bytes).verify(data, signature_bytes, encoder=RawEncoder)
+            results.append(True)
+        except BadSignatureError:
+            results.append(False)
+    return results
+
+
 class SodiumSigContext(SigContext):
     """
     A libsodium backend.
@@ -370,6 +504,10 @@ class SodiumSigContext(SigContext):
     PRIVATE_KEY_LEN = 32
     KEY_PREFIX = b'Ed'
 
+    #: signatures verified in this process, shared by all contexts (the memo is keyed by the
+    #: pubkey, so a context that no longer recognizes the signer still rejects the signature)
+    verified = VerifiedSignatures(maxsize=16384)
+
     def _key_to_files(self, sign_public_bytes: bytes, encr_public_bytes: bytes,
                       sign_private_bytes: bytes = None, encr_private_bytes: bytes = None) \
             -> Tuple[str, str]:
@@ -525,9 +663,10 @@ class SodiumSigContext(SigContext):
 
         return key_id + ':' + base64.b64encode(signature.signature).decode()
 
-    def verify(self, signature: str, data: bytes, pubkey: Optional[str] = None) -> str:
+    def _parse_signature(self, signature: str, pubkey: Optional[str]) -> Tuple[str, str, bytes]:
         """
-        Verify signature for data, along with pubkey returning the recognized owner.
+        Split a signature and find the pubkey to check it with. Returns a tuple of signer, pubkey,
+        signature bytes.
         """
         if len(signature) == 100:
             raise SigError(
@@ -544,16 +683,69 @@ class SodiumSigContext(SigContext):
         if not pubkey:
             pubkey = self.get_primary_pubkey(signer)
 
-        pubkey_bytes = self._key_to_subkey(pubkey, public=True, signing=True)
+        return signer, pubkey, signature_bytes
+
+    def verify(self, signature: str, data: bytes, pubkey: Optional[str] = None) -> str:
+        """
+        Verify signature for data, along with pubkey returning the recognized owner.
+        """
+        signer, pubkey, signature_bytes = self._parse_signature(signature, pubkey)
+
+        memo_key = self.verified.key(pubkey, signature_bytes, data)
+        owner = self.verified.get(memo_key)
+        if owner is not None:
+            return owner
 
-        verify_key = VerifyKey(pubkey_bytes, encoder=RawEncoder)
+        pubkey_bytes = self._key_to_subkey(pubkey, public=True, signing=True)
 
         try:
-            verify_key.verify(data, signature_bytes, encoder=RawEncoder)
-            return self.fingerprint(pubkey)
+            _verify_key(pubkey_bytes).verify(data, signature_bytes, encoder=RawEncoder)
         except BadSignatureError as bse:
             raise SigError(f'Could not verify signature for {signer}') from bse
 
+        owner = self.fingerprint(pubkey)
+        self.verified.put(memo_key, owner)
+        return owner
+
+    def verify_many(self, items: Iterable[Tuple[str, bytes, Optional[str]]]) \
+            -> List[Union[str, SigError]]:
+        results: List[Union[str, SigError]] = []
+        # (result index, signer, pubkey, memo key, arguments for _verify_chunk)
+        pending: List[Tuple[int, str, str, Tuple[str, bytes, bytes],
+                            Tuple[bytes, bytes, bytes]]] = []
+
+        for signature, data, pubkey in items:
+            try:
+                signer, pubkey, signature_bytes = self._parse_signature(signature, pubkey)
+                pubkey_bytes = self._key_to_subkey(pubkey, public=True, signing=True)
+            except SigError as e:
+                results.append(e)
+                continue
+            except ValueError as e:
+                # malformed base64
+                results.append(SigError(f'Incorrect signature format: {e}'))
+                continue
+
+            memo_key = self.verified.key(pubkey, signature_bytes, data)
+            owner = self.verified.get(memo_key)
+            if owner is not None:
+                results.append(owner)
+                continue
+
+            pending.append((len(results), signer, pubkey, memo_key,
+                            (pubkey_bytes, signature_bytes, data)))
+            results.append(SigError(f'Could not verify signature for {signer}'))
+
+        valid = _verify_chunk([item[4] for item in pending])
+
+        for (index, _signer, pubkey, memo_key, _), is_valid in zip(pending, valid):
+            if is_valid:
+                owner = self.fingerprint(pubkey)
+                self.verified.put(memo_key, owner)
+                results[index] = owner
+
+        return results
+
     def is_valid_pubkey(self, key: str) -> bool:
         try:
             key_bytes = self._key_to_subkey(key, public=True, signing=False)
@@ -91,6 +91,8 @@ class Remounter:
         self.wlpaths: List[WildlandPath] = []
         # patterns to watch WL paths
         self.wlpath_patterns: Dict[str, List[WildlandPath]] = {}
+        # pattern -> uuids of containers whose resolve results depend on it
+        self.wlpath_pattern_sources: Dict[str, Set[str]] = {}
         # Containers watched for subcontainers
         self.outside_containers: List[Container] = []
         self.inside_containers: List[Container] = []
@@ -166,6 +168,7 @@ class Remounter:
             self.mount_pending()
 
         patterns: Dict[str, List[WildlandPath]] = {}
+        pattern_sources: Dict[str, Set[str]] = {}
         for wlpath in self.wlpaths:
             search = Search(self.client, wlpath,
                             aliases=self.client.config.aliases,
@@ -181,12 +184,17 @@ class Remounter:
                 for wlpattern in self.wlpath_patterns:
                     if wlpath in self.wlpath_patterns[wlpattern]:
                         patterns.setdefault(wlpattern, []).append(wlpath)
+                        pattern_sources.setdefault(wlpattern, set()).update(
+                            self.wlpath_pattern_sources.get(wlpattern, ()))
             else:
                 for pattern in patterns_for_path:
                     patterns.setdefault(str(pattern), []).append(wlpath)
+                    pattern_sources.setdefault(str(pattern), set()).update(
+                        search.pattern_sources.get(pattern, ()))
 
         patterns_changed = set(patterns.keys()) != set(self.wlpath_patterns.keys())
         self.wlpath_patterns = patterns
+        self.wlpath_pattern_sources = pattern_sources
         return patterns_changed
 
     def handle_events(self, events) -> Tuple[bool, bool]:
@@ -199,6 +207,15 @@ class Remounter:
         # avoid processing the same wlpath multiple times - each time we re-evaluate
         # all the containers resolved from them, regardless which manifest the event was about
         wlpaths_processed = set()
+        # drop only resolve results listed from the changed container(s), so that the searches
+        # below re-read them, but not the rest of the path; do it for the whole batch first,
+        # as each wlpath is searched only once
+        for event in events:
+            if isinstance(event, PatternWatchEvent):
+                for container_uuid in self.wlpath_pattern_sources.get(event.pattern, ()):
+                    Search.invalidate_container(container_uuid)
+            elif isinstance(event, SubcontainerWatchEvent):
+                Search.invalidate_container(event.container.uuid)
         for event in events:
             try:
                 if isinstance(event, PatternWatchEvent) and event.pattern in self.wlpath_patterns:
@@ -365,11 +382,10 @@ class Remounter:
         """
         Unmount queued containers.
         """
-        for storage_id in self.to_unmount:
-            try:
-                self.fs_client.unmount_storage(storage_id)
-            except WildlandError as e:
-                logger.error('failed to unmount storage %d: %s', storage_id, e)
+        try:
+            self.fs_client.unmount_storages(self.to_unmount)
+        except WildlandError as e:
+            logger.error('failed to unmount some storages: %s', e)
         self.to_unmount.clear()
 
     def mount_pending(self):
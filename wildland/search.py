@@ -26,12 +26,20 @@ Utilities for URL resolving and traversing the path
 """
 
 from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from copy import deepcopy
 
+import threading
+import time
 import types
+import itertools
 from dataclasses import dataclass
+from functools import cached_property, partial
 from pathlib import PurePosixPath
-from typing import Optional, Tuple, Iterable, Mapping, List, Set, Union, Dict
+from typing import Optional, Tuple, Iterable, Iterator, Mapping, List, Set, Union, Dict, \
+    FrozenSet, Callable, TypeVar
 from typing import TYPE_CHECKING
 
 import wildland
@@ -39,7 +47,8 @@ from wildland.wildland_object.wildland_object import WildlandObject
 from .fs_client import WildlandFSClient
 from .storage_driver import StorageDriver
 from .user import User
-from .container import Container
+from .container import Container, ContainerStub
+from .link import Link
 from .bridge import Bridge
 from .storage import Storage
 from .storage_backends.base import StorageBackend
@@ -53,6 +62,9 @@ if TYPE_CHECKING:
 
 logger = get_logger('search')
 
+T = TypeVar('T')
+R = TypeVar('R')
+
 
 @dataclass
 class Step:
@@ -107,6 +119,108 @@ class Step:
         ))
 
 
+def _unique(steps: Iterable[Step]) -> List[Step]:
+    """
+    Deduplicate steps, keeping the order of first occurrences.
+    """
+    return list(dict.fromkeys(steps))
+
+
+ResolveCacheKey = Tuple[Union[str, Step], PurePosixPath]
+
+
+class ResolveCache:
+    """
+    Cache of path resolution results, shared between Search instances.
+
+    Each entry remembers the containers whose storages were listed to compute it, so that a change
+    in one container (e.g. a manifests catalog) invalidates only the entries that depend on it.
+    Entries expire after ``ttl`` seconds, and the least recently used ones are dropped when there
+    are more than ``maxsize`` of them.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[ResolveCacheKey, Tuple[float, List[Step], FrozenSet[str]]] = \
+            OrderedDict()
+        # container uuid -> keys of entries computed by listing that container
+        self._by_source: Dict[str, Set[ResolveCacheKey]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def configure(self, maxsize: int, ttl: float):
+        """
+        Change the limits. A smaller ``maxsize`` drops the least recently used entries right away,
+        a different ``ttl`` applies to entries stored from now on.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def get(self, key: ResolveCacheKey) -> Optional[List[Step]]:
+        """
+        Return cached steps for a given key, or None if there is no (fresh) entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, steps, _ = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return steps
+
+    def put(self, key: ResolveCacheKey, steps: List[Step], sources: Iterable[str]):
+        """
+        Store steps for a given key. ``sources`` are the uuids of containers whose content was
+        used to resolve them.
+        """
+        with self._lock:
+            self._remove(key)
+            sources = frozenset(sources)
+            self._entries[key] = (time.monotonic() + self.ttl, steps, sources)
+            for source in sources:
+                self._by_source.setdefault(source, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, source: str) -> int:
+        """
+        Drop all entries resolved using a given container. Returns the number of dropped entries.
+        """
+        with self._lock:
+            keys = self._by_source.pop(source, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        """
+        Drop all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._by_source.clear()
+
+    def _remove(self, key: ResolveCacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for source in entry[2]:
+            keys = self._by_source.get(source)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_source[source]
+
+
 class Search:
     """
     A class for traversing a Wildland path.
@@ -117,26 +231,74 @@ class Search:
 
         search = Search(client, wlpath, client.config.aliases)
         search.read_file()
+
+    With ``workers`` set (by default taken from the ``search-workers`` config option), the path
+    is resolved part by part: all containers matching a part are listed concurrently, and the
+    subcontainer manifests found in them are loaded concurrently as well. The results are the
+    same, and come in the same order, as when resolving sequentially.
     """
 
     #: cache of results of (Step, part) resolve, shared between different Search instances;
-    #: for initial step, the first element is initial_owner field
-    _resolve_cache: Dict[Tuple[Union[str, Step], PurePosixPath], Iterable[Step]] = {}
+    #: for initial step, the first element is initial_owner field; limits are set from the
+    #: ``search-cache-size`` and ``search-cache-ttl`` config options
+    _resolve_cache = ResolveCache()
+
+    #: maximum number of concurrent subcontainer listings of a single storage backend
+    MAX_LISTINGS_PER_BACKEND = 2
+
+    # Thread pools used for parallel resolution, shared between Search instances. Work is
+    # submitted only to a pool later on this list than the one running the current thread,
+    # so that a busy pool never waits for itself.
+    _POOLS = ('resolve', 'load')
+    _executors: Dict[Tuple[str, int], ThreadPoolExecutor] = {}
+    _listing_slots: Dict[str, threading.BoundedSemaphore] = {}
+    _parallel_lock = threading.Lock()
+    _worker = threading.local()
 
     def __init__(self,
                  client: wildland.client.Client,
                  wlpath: Union[WildlandPath, str],
                  aliases: Mapping[str, str] = types.MappingProxyType({}),
-                 fs_client: Optional[WildlandFSClient] = None):
+                 fs_client: Optional[WildlandFSClient] = None,
+                 workers: Optional[int] = None):
         self.client = client
         self.wlpath = WildlandPath.from_str(wlpath) if isinstance(wlpath, str) else wlpath
         self.aliases = aliases
         self.initial_owner = self._subst_alias(self.wlpath.owner or '@default')
         self.fs_client = fs_client
+        #: number of threads used to resolve the path; 0 resolves it sequentially (and lazily)
+        self.workers: int = client.config.get('search-workers') if workers is None else workers
+        self._resolve_cache.configure(client.config.get('search-cache-size'),
+                                      client.config.get('search-cache-ttl'))
+
+        #: watch pattern -> uuids of containers it was computed from, filled by get_watch_params()
+        self.pattern_sources: Dict[PurePosixPath, Set[str]] = {}
+        # containers listed to resolve the first path part
+        self._first_sources: Set[str] = set()
+
+    # Local manifests are loaded only when needed, so that a search answered entirely from
+    # the resolve cache does not have to read them.
+
+    @cached_property
+    def local_containers(self) -> List[Container]:
+        """
+        Containers stored locally.
+        """
+        return list(self.client.load_all(WildlandObject.Type.CONTAINER))
+
+    @cached_property
+    def local_users(self) -> List[User]:
+        """
+        Users stored locally.
+        """
+        return self.client.get_local_users(reload=True)
 
-        self.local_containers = list(self.client.load_all(WildlandObject.Type.CONTAINER))
-        self.local_users = self.client.get_local_users(reload=True)
-        self.local_bridges = self.client.get_local_bridges(reload=True)
+    @cached_property
+    def local_bridges(self) -> List[Bridge]:
+        """
+        Bridges stored locally.
+        """
+        return self.client.get_local_bridges(reload=True)
 
     def resolve_raw(self) -> Iterable[Step]:
         """
@@ -232,6 +394,18 @@ class Search:
         """
         cls._resolve_cache.clear()
 
+    @classmethod
+    def invalidate_container(cls, container_uuid: str) -> int:
+        """
+        Forget path resolution results that were computed by listing a given container
+        (for example after its manifests catalog changed). Returns the number of dropped entries.
+        """
+        count = cls._resolve_cache.invalidate(container_uuid)
+        if count:
+            logger.debug('dropped %d resolve cache entries for container %s',
+                         count, container_uuid)
+        return count
+
     def _get_params_for_mount_step(self, step: Step) -> \
             Tuple[PurePosixPath,
                   Optional[Tuple[Container,
@@ -266,6 +440,9 @@ class Search:
          - list of mount parameters (for WildlandFSClient.mount_multiple_containers())
          - set of patterns (relative to the FUSE mount point) to watch
 
+        It also fills ``self.pattern_sources``, mapping each pattern to uuids of containers whose
+        resolve results should be invalidated (see :meth:`invalidate_container`) when it changes.
+
         Watching the patterns is legal only if all returned mount commands succeeded.
 
         Usage:
@@ -297,8 +474,9 @@ class Search:
                 mount_path, mount_params = self._get_params_for_mount_step(step)
                 if mount_params:
                     mount_cmds[mount_path] = mount_params
-                patterns_for_path.add(
-                    mount_path / step.pattern.relative_to(PurePosixPath('/')))
+                pattern = mount_path / step.pattern.relative_to(PurePosixPath('/'))
+                patterns_for_path.add(pattern)
+                self.pattern_sources.setdefault(pattern, set()).add(step.container.uuid)
 
         return list(mount_cmds.values()), patterns_for_path
 
@@ -307,6 +485,10 @@ class Search:
         Resolve all path parts, yield all results that match.
         """
 
+        if self.workers:
+            yield from self._resolve_all_parallel()
+            return
+
         # deduplicate results
         seen_last = set()
         # deduplicate and cache result of self._resolve_first(); it's here,
@@ -314,20 +496,57 @@ class Search:
         # returning results, and is using `yield from`, so deduplicating it
         # there would require quite a bit of boilerplate there
         seen_first = set()
+        first_steps = []
         cache_key = (self.initial_owner, self.wlpath.parts[0])
-        if cache_key in self._resolve_cache:
-            first_iter = self._resolve_cache[cache_key]
-        else:
+        cached = self._resolve_cache.get(cache_key)
+        first_iter: Iterable[Step]
+        if cached is None:
+            self._first_sources = set()
             first_iter = self._resolve_first()
+        else:
+            first_iter = cached
         for step in first_iter:
             if step in seen_first:
                 continue
             seen_first.add(step)
+            first_steps.append(step)
             for last_step in self._resolve_rest(step, 1):
                 if last_step not in seen_last:
                     yield last_step
                     seen_last.add(last_step)
-        self._resolve_cache[cache_key] = seen_first
+        if cached is None:
+            self._resolve_cache.put(cache_key, first_steps, self._first_sources)
+
+    def _resolve_all_parallel(self) -> Iterable[Step]:
+        """
+        Resolve all path parts breadth-first, resolving each part in the context of all
+        the previous part's results concurrently.
+        """
+
+        cache_key = (self.initial_owner, self.wlpath.parts[0])
+        steps = self._resolve_cache.get(cache_key)
+        if steps is None:
+            self._first_sources = set()
+            steps = _unique(self._resolve_first())
+            self._resolve_cache.put(cache_key, steps, self._first_sources)
+
+        for i in range(1, len(self.wlpath.parts)):
+            steps = _unique(itertools.chain.from_iterable(
+                self._map('resolve', partial(self._next_steps, i=i), steps)))
+        yield from steps
+
+    def _next_steps(self, step: Step, i: int) -> List[Step]:
+        """
+        Resolve i-th part in the context of a given step, using the resolve cache.
+        """
+
+        cache_key = (step, self.wlpath.parts[i])
+        next_steps = self._resolve_cache.get(cache_key)
+        if next_steps is None:
+            next_steps = _unique(self._resolve_next(step, i))
+            self._resolve_cache.put(cache_key, next_steps,
+                                    [step.container.uuid] if step.container else [])
+        return next_steps
 
     def _resolve_rest(self, step: Step, i: int) -> Iterable[Step]:
         if i == len(self.wlpath.parts):
@@ -335,17 +554,19 @@ class Search:
             return
 
         seen = set()
+        seen_steps = []
         cache_key = (step, self.wlpath.parts[i])
-        if cache_key in self._resolve_cache:
-            next_steps = self._resolve_cache[cache_key]
-        else:
-            next_steps = self._resolve_next(step, i)
+        cached = self._resolve_cache.get(cache_key)
+        next_steps: Iterable[Step] = self._resolve_next(step, i) if cached is None else cached
         for next_step in next_steps:
             if next_step in seen:
                 continue
             seen.add(next_step)
+            seen_steps.append(next_step)
             yield from self._resolve_rest(next_step, i + 1)
-        self._resolve_cache[cache_key] = seen
+        if cached is None:
+            sources = [step.container.uuid] if step.container else []
+            self._resolve_cache.put(cache_key, seen_steps, sources)
 
     def _find_storage(self, step: Step) -> Tuple[Storage, StorageBackend]:
         """
@@ -366,8 +587,8 @@ class Search:
             hint_user = self.client.load_object_from_url(WildlandObject.Type.USER, self.wlpath.hint,
                                                          self.initial_owner, self.initial_owner)
 
-            for step in self._user_step(hint_user, self.initial_owner, self.client, None, None):
-                yield from self._resolve_next(step, 0)
+            yield from self._resolve_next_many(self._with_first_sources(
+                self._user_step(hint_user, self.initial_owner, self.client, None, None)), 0)
 
         # Try local containers
         yield from self._resolve_local(self.wlpath.parts[0], self.initial_owner, None)
@@ -375,8 +596,70 @@ class Search:
         # Try user's manifests catalog
         for user in self.local_users:
             if user.owner == self.initial_owner:
-                for step in self._user_step(user, self.initial_owner, self.client, None, None):
-                    yield from self._resolve_next(step, 0)
+                yield from self._resolve_next_many(self._with_first_sources(
+                    self._user_step(user, self.initial_owner, self.client, None, None)), 0)
+
+    def _with_first_sources(self, steps: Iterable[Step]) -> Iterable[Step]:
+        for step in steps:
+            if step.container:
+                self._first_sources.add(step.container.uuid)
+            yield step
+
+    def _resolve_next_many(self, steps: Iterable[Step], i: int) -> Iterable[Step]:
+        """
+        Resolve next part in the context of each of given steps.
+        """
+
+        if not self.workers:
+            for step in steps:
+                yield from self._resolve_next(step, i)
+            return
+
+        for next_steps in self._map('resolve', lambda step: list(self._resolve_next(step, i)),
+                                    steps):
+            yield from next_steps
+
+    def _map(self, pool: str, func: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """
+        Apply ``func`` to ``items`` using a given thread pool and yield results in order.
+
+        Runs sequentially when resolving sequentially, or when called from a thread of the same
+        (or a later) pool.
+        """
+
+        level = self._POOLS.index(pool)
+        if not self.workers or getattr(self._worker, 'level', -1) >= level:
+            yield from map(func, items)
+            return
+
+        with self._parallel_lock:
+            executor = self._executors.get((pool, self.workers))
+            if executor is None:
+                executor = ThreadPoolExecutor(self.workers,
+                                              thread_name_prefix=f'search-{pool}')
+                self._executors[(pool, self.workers)] = executor
+
+        def run(item: T) -> R:
+            self._worker.level = level
+            return func(item)
+
+        yield from executor.map(run, items)
+
+    @contextmanager
+    def _listing_slot(self, storage: Storage):
+        """
+        Limit the number of concurrent subcontainer listings of a storage backend.
+        """
+
+        if not self.workers:
+            yield
+            return
+
+        with self._parallel_lock:
+            slot = self._listing_slots.setdefault(
+                storage.backend_id, threading.BoundedSemaphore(self.MAX_LISTINGS_PER_BACKEND))
+        with slot:
+            yield
 
     def _resolve_local(self, part: PurePosixPath,
                        owner: str,
@@ -435,35 +718,56 @@ class Search:
             return
         with storage_backend:
             try:
-                children_iter = storage_backend.get_children(step.client, part)
+                with self._listing_slot(storage):
+                    children_iter = storage_backend.get_children(step.client, part)
+                    if self.workers:
+                        # list the storage first, then load the manifests concurrently
+                        children_iter = list(children_iter)
             except NotImplementedError:
                 logger.warning('Storage %s does not support subcontainers - cannot look for %s '
                                'inside', storage.params["type"], part)
                 return
 
-            for manifest_path, subcontainer_data in children_iter:
-                try:
-                    assert subcontainer_data is not None
-                    container_or_bridge = step.client.load_subcontainer_object(
-                        step.container, storage, subcontainer_data)
-                except (ManifestError, WildlandError) as e:
-                    logger.warning('%s: cannot load subcontainer %s: %s', part, manifest_path, e)
-                    continue
+            for next_steps in self._map(
+                    'load', partial(self._subcontainer_steps, step, part, storage, storage_backend),
+                    children_iter):
+                yield from next_steps
+
+    def _subcontainer_steps(self,
+                            step: Step,
+                            part: PurePosixPath,
+                            storage: Storage,
+                            storage_backend: StorageBackend,
+                            child: Tuple[PurePosixPath, Optional[Union[Link, ContainerStub]]]) \
+            -> List[Step]:
+        """
+        Load a subcontainer (or bridge) listed in the step's container and return steps for it.
+        """
 
-                if isinstance(container_or_bridge, Container):
-                    if container_or_bridge == step.container:
-                        # manifests catalog published into itself
-                        container_or_bridge.is_manifests_catalog = True
-                    logger.debug('%s: container manifest: %s', part, subcontainer_data)
-                    yield from self._container_step(
-                        step, part, container_or_bridge)
-                elif isinstance(container_or_bridge, Bridge):
-                    logger.debug('%s: bridge manifest: %s', part, subcontainer_data)
-                    yield from self._bridge_step(
-                        step.client, step.owner,
-                        part, manifest_path, storage_backend,
-                        container_or_bridge,
-                        step)
+        manifest_path, subcontainer_data = child
+        assert step.container is not None
+        try:
+            assert subcontainer_data is not None
+            container_or_bridge = step.client.load_subcontainer_object(
+                step.container, storage, subcontainer_data)
+        except (ManifestError, WildlandError) as e:
+            logger.warning('%s: cannot load subcontainer %s: %s', part, manifest_path, e)
+            return []
+
+        if isinstance(container_or_bridge, Container):
+            if container_or_bridge == step.container:
+                # manifests catalog published into itself
+                container_or_bridge.is_manifests_catalog = True
+            logger.debug('%s: container manifest: %s', part, subcontainer_data)
+            return list(self._container_step(step, part, container_or_bridge))
+        if isinstance(container_or_bridge, Bridge):
+            logger.debug('%s: bridge manifest: %s', part, subcontainer_data)
+            return list(self._bridge_step(
+                step.client, step.owner,
+                part, manifest_path, storage_backend,
+                container_or_bridge,
+                step))
+        return []
 
     # pylint: disable=no-self-use
 
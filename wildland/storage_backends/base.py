@@ -32,6 +32,7 @@ import itertools
 import json
 import os
 import stat
+import threading
 from dataclasses import dataclass
 from pathlib import PurePosixPath, Path
 from uuid import UUID
@@ -51,6 +52,7 @@ from ..log import get_logger
 
 if TYPE_CHECKING:
     import wildland.client  # pylint: disable=cyclic-import
+    from .watch import FileEvent  # pylint: disable=cyclic-import
 
 BLOCK_SIZE = 1024 ** 2
 logger = get_logger('storage')
@@ -217,6 +219,15 @@ class StorageBackend(metaclass=abc.ABCMeta):
 
     MOUNT_REFERENCE_CONTAINER = False
 
+    # Default number of threads that may compute file hashes of this storage in parallel (e.g.
+    # during a one-shot sync). Backends where hashing is dominated by network latency should
+    # raise it.
+    HASH_WORKERS = 1
+
+    # Whether writing a range of an existing file is cheap (does not rewrite or re-upload the whole
+    # file), so that syncing can update only the blocks that changed.
+    RANGED_WRITES = False
+
     _types: Dict[str, Type['StorageBackend']] = {}
     _cache: Dict[str, 'StorageBackend'] = {}
 
@@ -247,6 +258,7 @@ class StorageBackend(metaclass=abc.ABCMeta):
         self.hash_db: Optional[HashDb] = None
         self._persistent_db: Optional[KVStore] = None  # generic persistent storage
         self.mounted = 0
+        self._mount_lock = threading.RLock()
 
         # Hash guarantees uniqueness per backend's params while backend-id does not
         self.backend_id = self.params['backend-id']
@@ -327,17 +339,19 @@ class StorageBackend(metaclass=abc.ABCMeta):
         """
         Request storage to be mounted, if not mounted already.
         """
-        if self.mounted == 0:
-            self.mount()
-        self.mounted += 1
+        with self._mount_lock:
+            if self.mounted == 0:
+                self.mount()
+            self.mounted += 1
 
     def request_unmount(self) -> None:
         """
         Request storage to be unmounted, if not used anymore.
         """
-        self.mounted -= 1
-        if self.mounted == 0:
-            self.unmount()
+        with self._mount_lock:
+            self.mounted -= 1
+            if self.mounted == 0:
+                self.unmount()
 
     def __enter__(self):
         self.request_mount()
@@ -369,6 +383,16 @@ class StorageBackend(metaclass=abc.ABCMeta):
         Clear cache, if any.
         """
 
+    def invalidate_cache(self, events: Iterable['FileEvent']) -> None:
+        """
+        Invalidate cache after changes reported by a watcher.
+
+        By default, clears the whole cache. Backends can override it to invalidate only the
+        affected paths.
+        """
+        # pylint: disable=unused-argument
+        self.clear_cache()
+
     def start_watcher(self, handler, ignore_own_events=False):
         self.ignore_own_events = ignore_own_events
 
@@ -419,11 +443,12 @@ class StorageBackend(metaclass=abc.ABCMeta):
         """
         Create a StorageWatcher (see watch.py) for this storage, if supported. If the storage
         manifest contains a ``watcher-interval`` parameter, SimpleFileWatcher (which is a naive,
-        brute-force watcher that scans the entire storage every watcher-interval seconds) will be
-        used. If a given StorageBackend provides a better solution, it's recommended to overwrite
-        this method to provide it. It is recommended to still use SimpleFileWatcher if the user
-        explicitly specifies watcher-interval in the manifest. See local.py for a simple ``super()``
-        implementation that avoids duplicating code.
+        brute-force watcher that scans the storage every watcher-interval seconds, skipping only
+        directories with an unchanged ``get_dir_token()``) will be used. If a given StorageBackend
+        provides a better solution, it's recommended to overwrite this method to provide it. It is
+        recommended to still use SimpleFileWatcher if the user explicitly specifies
+        watcher-interval in the manifest. See local.py for a simple ``super()`` implementation that
+        avoids duplicating code.
 
         Note that changes originating from FUSE are reported without using this mechanism.
         """
@@ -457,6 +482,13 @@ class StorageBackend(metaclass=abc.ABCMeta):
         """
         self.hash_db = HashDb(config_dir)
 
+    def close_hash_db(self) -> None:
+        """
+        Close connections to the local hash DB, if any. They are opened again when needed.
+        """
+        if self.hash_db:
+            self.hash_db.close()
+
     @property
     def persistent_db(self) -> KVStore:
         """
@@ -605,10 +637,66 @@ class StorageBackend(metaclass=abc.ABCMeta):
         # used to implement hash caching; should provide a token that changes when the file changes.
         raise OptionalError()
 
+    def get_dir_token(self, path: PurePosixPath) -> Optional[str]:
+        """
+        Return a token (such as an etag) that changes whenever the listing of a directory, or
+        attributes of any of its entries, change; ``None`` if not known. Used by
+        SimpleFileWatcher to skip directories that did not change.
+        """
+        # pylint: disable=unused-argument
+        return None
+
+    def native_hash_type(self) -> Optional[str]:
+        """
+        Name of the content hash returned by :meth:`get_native_hash` (such as ``'md5'``), or
+        ``None`` if the backend does not keep one. Native hashes of the same type can be compared
+        across backends: equal content must give equal hashes.
+        """
+        return None
+
+    def get_native_hash(self, path: PurePosixPath) -> Optional[str]:
+        """
+        Return a content hash of the file at path that the backend already keeps (for example
+        in its metadata), so that it does not have to be computed by reading the file. ``None``
+        if not available for this file; callers should fall back to :meth:`get_hash` then.
+        """
+        # pylint: disable=unused-argument
+        return None
+
     def get_hash(self, path: PurePosixPath) -> Optional[str]:
         """
         Return (and, if get_file_token is implemented, cache) sha256 hash for object at path.
         """
+        new_hash, hash_cache = self._compute_hash(path)
+        if hash_cache:
+            self.store_hash(path, hash_cache)
+        return new_hash
+
+    def get_hashes(self, paths: Iterable[PurePosixPath]) -> Dict[PurePosixPath, Optional[str]]:
+        """
+        Bulk variant of :meth:`get_hash`. Cached hashes for all ``paths`` are fetched from the
+        persistent storage with a single query and newly computed ones are stored in a single
+        transaction.
+        """
+        paths = list(paths)
+        self.preload_hashes(paths)
+
+        result: Dict[PurePosixPath, Optional[str]] = {}
+        new_hashes: List[Tuple[PurePosixPath, HashCache]] = []
+        try:
+            for path in paths:
+                result[path], hash_cache = self._compute_hash(path)
+                if hash_cache:
+                    new_hashes.append((path, hash_cache))
+        finally:
+            self.store_hashes(new_hashes)
+        return result
+
+    def _compute_hash(self, path: PurePosixPath) -> Tuple[Optional[str], Optional[HashCache]]:
+        """
+        Compute sha256 hash for object at path, reusing a cached value if the file token did not
+        change. Returns the hash and a HashCache that should be stored (if any).
+        """
         try:
             current_token = self.get_file_token(path)
         except OptionalError:
@@ -619,7 +707,7 @@ class StorageBackend(metaclass=abc.ABCMeta):
             if hash_cache and current_token == hash_cache.token:
                 logger.debug('Retrieving hash %s from cache for file %s with token %s',
                              hash_cache.hash, path, current_token)
-                return hash_cache.hash
+                return hash_cache.hash, None
 
         hasher = hashlib.sha256()
         offset = 0
@@ -631,12 +719,12 @@ class StorageBackend(metaclass=abc.ABCMeta):
                     offset += len(data)
                     hasher.update(data)
         except NotADirectoryError:
-            return None
+            return None, None
 
         new_hash = hasher.hexdigest()
         if current_token:
-            self.store_hash(path, HashCache(new_hash, current_token))
-        return new_hash
+            return new_hash, HashCache(new_hash, current_token)
+        return new_hash, None
 
     def store_hash(self, path, hash_cache) -> None:
         """
@@ -646,6 +734,17 @@ class StorageBackend(metaclass=abc.ABCMeta):
             self.hash_db.store_hash(self.backend_id, path, hash_cache)
         self.hash_cache[path] = hash_cache
 
+    def store_hashes(self, hashes: List[Tuple[PurePosixPath, HashCache]]) -> None:
+        """
+        Store provided (path, hash) pairs in persistent (if available) storage, in a single
+        transaction, and in local dict.
+        """
+        if not hashes:
+            return
+        if self.hash_db:
+            self.hash_db.store_hashes_bulk(self.backend_id, hashes)
+        self.hash_cache.update(hashes)
+
     def retrieve_hash(self, path) -> Optional[HashCache]:
         """
         Get cached hash, if possible; priority is given to local dict, then to permanent storage.
@@ -656,6 +755,20 @@ class StorageBackend(metaclass=abc.ABCMeta):
             return self.hash_db.retrieve_hash(self.backend_id, path)
         return None
 
+    def preload_hashes(self, paths: Iterable[PurePosixPath]) -> None:
+        """
+        Load hashes of given paths from permanent storage into local dict with a single query,
+        so that subsequent :meth:`retrieve_hash` calls do not hit the database one by one.
+        """
+        if not self.hash_db:
+            return
+        missing = {str(path): path for path in paths if path not in self.hash_cache}
+        if not missing:
+            return
+        for str_path, hash_cache in self.hash_db.retrieve_hashes_bulk(
+                self.backend_id, missing.values()).items():
+            self.hash_cache[missing[str_path]] = hash_cache
+
     def open_for_safe_replace(self, path: PurePosixPath, flags: int, original_hash: str) -> File:
         """
         This should implement a version of compare-and-swap: open a file, write data as needed,
@@ -26,8 +26,11 @@ File buffering classes
 """
 
 import abc
-from typing import Dict, Tuple, Iterable, List, Optional, Callable
-import heapq
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Dict, Tuple, Iterable, List, Optional, Callable
 import threading
 
 from .base import File, Attr
@@ -46,31 +49,56 @@ class Buffer:
         self.size = size
         self.page_size = page_size
         self.max_pages = max_pages
-        self.last_used: Dict[int, int] = {}
-        self.counter = 0
+        # page numbers, least recently used first
+        self.last_used: 'OrderedDict[int, None]' = OrderedDict()
+        # page number -> number of readers waiting for it; pinned pages are not trimmed
+        self.pinned: Dict[int, int] = {}
 
     def _page_range(self, length, start) -> Iterable[int]:
         start_page = start // self.page_size
         end_page = (start + length + self.page_size - 1) // self.page_size
         return range(start_page, end_page)
 
-    def _trim(self):
+    def _touch(self, page_num: int):
+        self.last_used[page_num] = None
+        self.last_used.move_to_end(page_num)
+
+    def pin(self, pages: Iterable[int]) -> None:
         """
-        Remove least recently used pages to maintain at most max_pages pages.
+        Protect pages (loaded or not yet) from being trimmed until unpin() is called.
         """
 
-        too_many = len(self.pages) - self.max_pages
-        if too_many <= 0:
-            return
+        for page_num in pages:
+            self.pinned[page_num] = self.pinned.get(page_num, 0) + 1
+
+    def unpin(self, pages: Iterable[int]) -> None:
+        """
+        Release pages protected with pin().
+        """
+
+        for page_num in pages:
+            if self.pinned[page_num] == 1:
+                del self.pinned[page_num]
+            else:
+                self.pinned[page_num] -= 1
+
+    def trim(self):
+        """
+        Remove least recently used pages to maintain at most max_pages pages. Pinned pages are
+        kept, even if that means going over the limit.
+        """
 
-        smallest = heapq.nsmallest(
-            too_many, self.last_used.keys(),
-            key=lambda page_num: self.last_used[page_num])
+        if len(self.pages) <= self.max_pages:
+            return
 
-        for page_num in smallest:
+        for page_num in list(self.last_used):
+            if len(self.pages) <= self.max_pages:
+                break
+            if page_num in self.pinned:
+                continue
             logger.debug('deleting page %s', page_num)
-            del self.pages[page_num]
             del self.last_used[page_num]
+            del self.pages[page_num]
 
     def set_read(self, data: bytes, length: int, start: int) -> None:
         """
@@ -92,8 +120,18 @@ class Buffer:
             ]
             page[:len(page_data)] = page_data
             self.pages[page_num] = page
-            self.last_used[page_num] = self.counter
-            self.counter += 1
+            self._touch(page_num)
+
+    def get_missing_pages(self, length: Optional[int] = None, start: int = 0) -> List[int]:
+        """
+        Returns numbers of pages necessary to load before reading the given range.
+        """
+
+        if length is None or start + length > self.size:
+            length = self.size - start
+
+        return [page_num for page_num in self._page_range(length, start)
+                if page_num not in self.pages]
 
     def get_needed_range(self,
                          length: Optional[int] = None,
@@ -104,17 +142,7 @@ class Buffer:
         or writing to a file, or None if everything is loaded already.
         """
 
-        if length is None or start + length > self.size:
-            length = self.size - start
-
-        if length == 0:
-            return None
-
-        pages: List[int] = []
-        for page_num in self._page_range(length, start):
-            if page_num not in self.pages:
-                pages.append(page_num)
-
+        pages = self.get_missing_pages(length, start)
         if not pages:
             return None
 
@@ -149,11 +177,10 @@ class Buffer:
                 part_end-start
             ] = page_data
 
-            self.last_used[page_num] = self.counter
-            self.counter += 1
+            self._touch(page_num)
 
         # Trim here, so that we never delete pages before reading.
-        self._trim()
+        self.trim()
 
         return bytes(result)
 
@@ -163,18 +190,46 @@ class PagedFile(File, metaclass=abc.ABCMeta):
     A read-only file class that stores parts of file in memory. Assumes that
     you are able to read a range of bytes from a file.
 
-    TODO: This currently performs only 1 concurrent read. A better
-    implementation would allow parallel reads, but would need to ensure that a
-    given part is read only once.
+    Pages are loaded outside of the buffer lock, so different pages can be
+    loaded in parallel; pages that are already being loaded by another thread
+    are waited for instead of being read again. Pages needed by a read are pinned
+    until the read finishes, so that other readers cannot evict them in between.
+    Sequential reads additionally trigger read-ahead: up to max_readahead_pages
+    following pages are loaded in the background, with the window doubling on
+    every sequential read.
     """
 
     page_size = 8 * 1024 * 1024
     max_pages = 8
+    max_readahead_pages = 4
+
+    # shared by all files (read_range() is usually network-bound), created on first use
+    readahead_workers = 8
+    _readahead_executor: Optional[ThreadPoolExecutor] = None
+    _readahead_executor_lock = threading.Lock()
 
     def __init__(self, attr: Attr):
         self.attr = attr
         self.buf = Buffer(attr.size, self.page_size, self.max_pages)
         self.buf_lock = threading.Lock()
+        # page number -> event set when the page load finishes (successfully or not)
+        self.loading: Dict[int, threading.Event] = {}
+        self.readahead_pages = 0
+        self.last_read_end: Optional[int] = None
+        self.readahead_jobs: Dict[int, Future] = {}
+        self.released = False
+
+    @classmethod
+    def readahead_executor(cls) -> ThreadPoolExecutor:
+        """
+        The executor running read-ahead jobs of all files.
+        """
+
+        with PagedFile._readahead_executor_lock:
+            if PagedFile._readahead_executor is None:
+                PagedFile._readahead_executor = ThreadPoolExecutor(
+                    max_workers=PagedFile.readahead_workers, thread_name_prefix='readahead')
+            return PagedFile._readahead_executor
 
     @abc.abstractmethod
     def read_range(self, length: int, start: int) -> bytes:
@@ -186,23 +241,144 @@ class PagedFile(File, metaclass=abc.ABCMeta):
         raise NotImplementedError()
 
     def read(self, length: Optional[int] = None, offset: int = 0) -> bytes:
-        with self.buf_lock:
-            needed_range = self.buf.get_needed_range(length, offset)
+        pinned: List[int] = []
+        try:
+            while True:
+                to_load: List[Tuple[int, int, threading.Event]] = []
+                with self.buf_lock:
+                    missing = self.buf.get_missing_pages(length, offset)
+                    if not missing:
+                        data = self.buf.read(length, offset)
+                        self._start_readahead(length, offset)
+                        return data
+
+                    # Pages stay pinned until the end, so every pass either finishes the read
+                    # or retries loads that failed.
+                    new_pins = [page_num for page_num in missing if page_num not in pinned]
+                    self.buf.pin(new_pins)
+                    pinned.extend(new_pins)
+
+                    waiting = {self.loading[page_num] for page_num in missing
+                               if page_num in self.loading}
+                    for first_page, page_count in self._page_runs(
+                            [page_num for page_num in missing if page_num not in self.loading]):
+                        event = self._start_loading(first_page, page_count)
+                        to_load.append((first_page, page_count, event))
+
+                for first_page, page_count, event in to_load:
+                    self._load_pages(first_page, page_count, event)
+                for event in waiting:
+                    event.wait()
+        finally:
+            if pinned:
+                with self.buf_lock:
+                    if not self.released:
+                        self.buf.unpin(pinned)
+                        self.buf.trim()
+
+    @staticmethod
+    def _page_runs(pages: List[int]) -> List[Tuple[int, int]]:
+        """
+        Group sorted page numbers into runs of consecutive pages: (first page, page count).
+        """
 
-            if needed_range:
-                range_length, range_start = needed_range
-                logger.debug('loading range: %s, %s', range_length, range_start)
-                data = self.read_range(range_length, range_start)
+        runs: List[Tuple[int, int]] = []
+        for page_num in pages:
+            if runs and page_num == runs[-1][0] + runs[-1][1]:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+            else:
+                runs.append((page_num, 1))
+        return runs
 
-                self.buf.set_read(data, range_length, range_start)
+    def _start_loading(self, first_page: int, page_count: int) -> threading.Event:
+        """
+        Mark pages as being loaded. Must be called with buf_lock held.
+        """
+
+        event = threading.Event()
+        for page_num in range(first_page, first_page + page_count):
+            self.loading[page_num] = event
+        return event
+
+    def _load_pages(self, first_page: int, page_count: int, event: threading.Event):
+        """
+        Load pages marked with _start_loading() into the buffer.
+        """
+
+        try:
+            range_start = first_page * self.page_size
+            range_length = page_count * self.page_size
+            logger.debug('loading range: %s, %s', range_length, range_start)
+            data = self.read_range(range_length, range_start)
+
+            with self.buf_lock:
+                if not self.released:
+                    self.buf.set_read(data, range_length, range_start)
+                    self.buf.trim()
+        finally:
+            with self.buf_lock:
+                for page_num in range(first_page, first_page + page_count):
+                    if self.loading.get(page_num) is event:
+                        del self.loading[page_num]
+            event.set()
+
+    def _start_readahead(self, length: Optional[int], offset: int):
+        """
+        Adjust the read-ahead window and schedule loading of the following pages. Must be called
+        with buf_lock held.
+        """
 
-            return self.buf.read(length, offset)
+        if length is None:
+            return
+
+        if offset == self.last_read_end:
+            self.readahead_pages = min(max(1, self.readahead_pages * 2), self.max_readahead_pages)
+        else:
+            self.readahead_pages = 0
+        self.last_read_end = offset + length
+
+        if not self.readahead_pages:
+            return
+
+        first_page = (offset + length + self.page_size - 1) // self.page_size
+        page_total = (self.attr.size + self.page_size - 1) // self.page_size
+        for page_num in range(first_page, min(first_page + self.readahead_pages, page_total)):
+            if page_num in self.buf.pages or page_num in self.loading:
+                continue
+            event = self._start_loading(page_num, 1)
+            self.readahead_jobs[page_num] = self.readahead_executor().submit(
+                self._readahead, page_num, event)
+
+    def _readahead(self, page_num: int, event: threading.Event):
+        with self.buf_lock:
+            self.readahead_jobs.pop(page_num, None)
+            released = self.released
+        if released:
+            # do not fetch anything for a file that is already closed
+            with self.buf_lock:
+                if self.loading.get(page_num) is event:
+                    del self.loading[page_num]
+            event.set()
+            return
+
+        try:
+            self._load_pages(page_num, 1, event)
+        except Exception:
+            logger.exception('read-ahead of page %d failed', page_num)
 
     def fgetattr(self) -> Attr:
         return self.attr
 
     def release(self, flags):
-        del self.buf
+        with self.buf_lock:
+            self.released = True
+            for job in self.readahead_jobs.values():
+                job.cancel()
+            self.readahead_jobs.clear()
+            # wake up anyone waiting for pages that will not be loaded now
+            for event in self.loading.values():
+                event.set()
+            del self.buf
 
 
 class FullBufferedFile(File, metaclass=abc.ABCMeta):
@@ -312,3 +488,140 @@ class FullBufferedFile(File, metaclass=abc.ABCMeta):
                 if self.clear_cache:
                     self.clear_cache()
                 self.dirty = False
+
+
+class SpooledBufferedFile(File, metaclass=abc.ABCMeta):
+    """
+    A file class that buffers reads and writes, like FullBufferedFile, but stages the file
+    content in a temporary file, kept in memory only up to ``SPOOL_MAX_MEMORY`` bytes. The content
+    is transferred as a stream, so memory use does not depend on the file size.
+
+    Requires you to implement read_full_into() and write_full_from().
+    """
+
+    #: content size above which the content is moved from memory to a temporary file
+    SPOOL_MAX_MEMORY = 8 * 1024 ** 2
+
+    def __init__(self, attr: Attr, clear_cache_callback: Optional[Callable] = None,
+                 update_cache_callback: Optional[Callable[[Attr], None]] = None):
+        self.attr = attr
+        self.spool: Optional[IO[bytes]] = None
+        self.loaded = self.attr.size == 0
+        self.dirty = False
+        self.buf_lock = threading.Lock()
+        self.clear_cache = clear_cache_callback
+        self.update_cache = update_cache_callback
+
+    @abc.abstractmethod
+    def read_full_into(self, stream: IO[bytes]) -> None:
+        """
+        Write the full file content into a stream.
+        """
+
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def write_full_from(self, stream: IO[bytes], size: int) -> int:
+        """
+        Replace the current file content with ``size`` bytes read from a stream (positioned at the
+        beginning). Read it in chunks, to keep memory use bounded.
+        """
+
+        raise NotImplementedError()
+
+    def _spool(self) -> IO[bytes]:
+        if self.spool is None:
+            # closed on release()
+            # pylint: disable=consider-using-with
+            self.spool = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_MAX_MEMORY)
+        return self.spool
+
+    def _size(self) -> int:
+        return self._spool().seek(0, os.SEEK_END)
+
+    def _load(self) -> None:
+        if not self.loaded:
+            spool = self._spool()
+            spool.seek(0)
+            spool.truncate()
+            self.read_full_into(spool)
+            self.loaded = True
+
+    def _save(self) -> None:
+        size = self._size()
+        spool = self._spool()
+        spool.seek(0)
+        self.write_full_from(spool, size)
+        if self.clear_cache:
+            self.clear_cache()
+
+    def release(self, _flags: int):
+        """
+        Save pending changes on release. If overriding, make sure to call
+        super().release() first.
+        """
+
+        with self.buf_lock:
+            if self.dirty:
+                self._save()
+
+            if self.spool is not None:
+                self.spool.close()
+                self.spool = None
+            self.loaded = False
+
+    def read(self, length: Optional[int] = None, offset: int = 0) -> bytes:
+        with self.buf_lock:
+            self._load()
+
+            size = self._size()
+            if length is None:
+                length = size - offset
+            if length <= 0 or offset >= size:
+                return b''
+
+            spool = self._spool()
+            spool.seek(offset)
+            return spool.read(length)
+
+    def write(self, data: bytes, offset: int) -> int:
+        with self.buf_lock:
+            self._load()
+            old_size = self._size()
+            spool = self._spool()
+            spool.seek(offset)
+            spool.write(data)
+            self.dirty = True
+            new_size = max(old_size, offset + len(data))
+            if old_size != new_size:
+                self.attr.size = new_size
+                if self.update_cache:
+                    self.update_cache(self.attr)
+        return len(data)
+
+    def fgetattr(self) -> Attr:
+        with self.buf_lock:
+            self._load()
+            self.attr.size = self._size()
+        return self.attr
+
+    def ftruncate(self, length: int) -> None:
+        with self.buf_lock:
+            if length > 0:
+                self._load()
+            else:
+                self.loaded = True
+
+            # See FullBufferedFile.ftruncate() for why truncating to 0 always marks the file dirty
+            if length < self._size() or length == 0:
+                self._spool().truncate(length)
+                self.dirty = True
+                self.attr.size = length
+                if self.update_cache:
+                    self.update_cache(self.attr)
+
+    def flush(self) -> None:
+        with self.buf_lock:
+            if self.dirty:
+                self._save()
+                self.dirty = False
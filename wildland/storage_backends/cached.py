@@ -29,10 +29,12 @@ import abc
 import errno
 import threading
 import time
+from collections import OrderedDict
 from pathlib import PurePosixPath
-from typing import Dict, Iterable, Optional, Set, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from .base import Attr
+from .watch import FileEvent, FileEventType
 from ..log import get_logger
 
 logger = get_logger('storage-cached')
@@ -48,8 +50,6 @@ class BaseCachedStorageMixin(metaclass=abc.ABCMeta):
     def __init__(self, *_args, **kwargs):
         # Silence mypy: https://github.com/python/mypy/issues/5887
         super().__init__(**kwargs)  # type: ignore
-        self.getattr_cache: Dict[PurePosixPath, Attr] = {}
-        self.readdir_cache: Dict[PurePosixPath, Set[str]] = {}
         self.cache_lock = threading.Lock()
         self._cache_timeout = self.DEFAULT_CACHE_TIMEOUT
 
@@ -65,23 +65,9 @@ class BaseCachedStorageMixin(metaclass=abc.ABCMeta):
         assert value >= 0.
         self._cache_timeout = value
 
+    @abc.abstractmethod
     def _update_cache(self, path: PurePosixPath, attr: Optional[Attr]) -> None:
-        if attr is None:
-            self.getattr_cache.pop(path, None)
-            self.readdir_cache.pop(path, None)
-
-            # Remove from parent's dir cache
-            self.readdir_cache.get(path.parent, set()).discard(path.name)
-            return
-
-        self.getattr_cache[path] = attr
-
-        # Prevent recursive caching
-        if path.parent != path:
-            self.readdir_cache.setdefault(path.parent, set()).add(path.name)
-
-        if attr.is_dir():
-            self.readdir_cache.setdefault(path, set())
+        raise NotImplementedError()
 
     def update_cache(self, path: PurePosixPath, attr: Optional[Attr]) -> None:
         """
@@ -104,8 +90,8 @@ class BaseCachedStorageMixin(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def getattr(self, path: PurePosixPath) -> Attr:
         """
-        Cached implementation of ``getattr()``. If ``path`` is not in ``self.getattr_cache`` but is
-        in ``self.readdir_cache`` then ``Attr.dir()`` should be returned as an directory's attribute
+        Cached implementation of ``getattr()``. If ``path`` has no cached attributes but has
+        a cached listing then ``Attr.dir()`` should be returned as an directory's attribute
         (indicates a synthetic directory).
         """
 
@@ -126,12 +112,34 @@ class CachedStorageMixin(BaseCachedStorageMixin):
 
     You need to implement ``info_all()``, and invalidate cache (by calling ``clear_cache()`` or
     ``update_cache()``) in all operations that might change the result.
+
+    If ``background_refresh`` is set, an expired cache is still used while a background thread
+    retrieves the new file information, which then replaces it at once. Only the first refresh
+    (and the first one after ``clear_cache()``) blocks.
+
+    If the storage can tell what changed since a previous listing, implement ``info_changes()``,
+    so that a refresh does not need to retrieve information about all the files.
     """
 
+    #: default for ``background_refresh``
+    BACKGROUND_REFRESH = False
+
     def __init__(self, *args, **kwargs):
         # Silence mypy: https://github.com/python/mypy/issues/5887
         super().__init__(*args, **kwargs)  # type: ignore
+        self.getattr_cache: Dict[PurePosixPath, Attr] = {}
+        self.readdir_cache: Dict[PurePosixPath, Set[str]] = {}
         self.expiry = 0.
+        self.background_refresh = self.BACKGROUND_REFRESH
+        #: token identifying the cached state, as returned by ``info_changes()``
+        self.change_token: Any = None
+
+        # Background refresh state, guarded by cache_lock. The generation is bumped whenever
+        # the cache is cleared or refreshed synchronously, outdating any background refresh.
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._refresh_generation = 0
+        # updates made while a background refresh runs, to re-apply on its result
+        self._pending_updates: Optional[List[Tuple[PurePosixPath, Optional[Attr]]]] = None
 
     def info_all(self) -> Iterable[Tuple[PurePosixPath, Attr]]:
         """
@@ -140,6 +148,23 @@ class CachedStorageMixin(BaseCachedStorageMixin):
 
         raise NotImplementedError()
 
+    def info_changes(self, token: Any) \
+            -> Tuple[Optional[Iterable[Tuple[PurePosixPath, Optional[Attr]]]], Any]:
+        """
+        Retrieve information about files changed since the state identified by ``token`` (``None``
+        instead of ``Attr`` for removed files; files of a removed directory have to be included),
+        and a token identifying the current state.
+
+        Return ``None`` instead of changes if they are not known (for example the token is
+        ``None`` or too old); ``info_all()`` is used then. The returned token should identify
+        the state from before retrieving any information, so that no concurrent change is missed.
+
+        By default, changes are never known.
+        """
+
+        # pylint: disable=unused-argument
+        return None, None
+
     def refresh(self) -> None:
         """
         Refresh cache.
@@ -150,16 +175,67 @@ class CachedStorageMixin(BaseCachedStorageMixin):
 
     def _refresh(self) -> None:
         logger.debug('refresh')
-        self.getattr_cache.clear()
-        self.readdir_cache.clear()
-        self.readdir_cache[PurePosixPath('.')] = set()
+        self._refresh_generation += 1
+        self._apply_refresh(*self._retrieve(self.change_token))
 
-        info: Iterable[Tuple[PurePosixPath, Attr]] = self.info_all()
-        for path, attr in info:
-            self._update_cache(path, attr)
+    def _retrieve(self, token: Any) -> Tuple[
+            Optional[Tuple[Dict[PurePosixPath, Attr], Dict[PurePosixPath, Set[str]]]],
+            List[Tuple[PurePosixPath, Optional[Attr]]],
+            Any]:
+        """
+        Retrieve file information, without touching the cache: either new (getattr_cache,
+        readdir_cache) contents, or a list of changes to the current ones; and a new change token.
+        """
+
+        changes, new_token = self.info_changes(token)
+        if changes is not None:
+            return None, list(changes), new_token
 
+        getattr_cache: Dict[PurePosixPath, Attr] = {}
+        readdir_cache: Dict[PurePosixPath, Set[str]] = {PurePosixPath('.'): set()}
+        for path, attr in self.info_all():
+            self._update_entry(getattr_cache, readdir_cache, path, attr)
+        return (getattr_cache, readdir_cache), [], new_token
+
+    def _apply_refresh(self, caches, changes, token) -> None:
+        if caches is not None:
+            self.getattr_cache, self.readdir_cache = caches
+        for path, attr in changes:
+            self._update_cache(path, attr)
+        self.change_token = token
         self.expiry = time.time() + self.cache_timeout
 
+    def _start_background_refresh(self) -> None:
+        if self._refresh_thread is not None:
+            return
+        logger.debug('background refresh')
+        self._pending_updates = []
+        self._refresh_thread = threading.Thread(
+            target=self._background_refresh,
+            args=(self._refresh_generation, self.change_token),
+            name='cache-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def _background_refresh(self, generation: int, token: Any) -> None:
+        try:
+            result = self._retrieve(token)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('background refresh failed')
+            result = None
+
+        with self.cache_lock:
+            self._refresh_thread = None
+            pending, self._pending_updates = self._pending_updates, None
+            if generation != self._refresh_generation:
+                return
+            if result is None:
+                # keep using the old cache for a while, instead of retrying on every call
+                self.expiry = time.time() + self.cache_timeout
+                return
+            self._apply_refresh(*result)
+            for path, attr in pending or ():
+                self._update_cache(path, attr)
+
     def update_cache(self, path: PurePosixPath, attr: Optional[Attr]) -> None:
         """
         Update item in the cache instead of invalidating all of the items.
@@ -169,17 +245,71 @@ class CachedStorageMixin(BaseCachedStorageMixin):
             self._update_cache(path, attr)
 
     def _update_cache(self, path: PurePosixPath, attr: Optional[Attr]) -> None:
-        super()._update_cache(path, attr)
+        if self._pending_updates is not None:
+            self._pending_updates.append((path, attr))
+        self._update_entry(self.getattr_cache, self.readdir_cache, path, attr)
+
+    def update_cache_many(self, changes: Iterable[Tuple[PurePosixPath, Optional[Attr]]]) -> None:
+        """
+        Update multiple items in the cache. Unlike ``update_cache()``, removing a directory
+        (passing ``None``) removes everything under it as well.
+        """
+
+        with self.cache_lock:
+            if not self.expiry:
+                # Nothing cached, the next access will retrieve everything anyway
+                return
+            for path, attr in changes:
+                if attr is None:
+                    self._remove_tree(path)
+                else:
+                    self._update_cache(path, attr)
+
+    def _remove_tree(self, path: PurePosixPath) -> None:
+        for name in list(self.readdir_cache.get(path, ())):
+            self._remove_tree(path / name)
+        self._update_cache(path, None)
+
+    @classmethod
+    def _update_entry(cls,
+                      getattr_cache: Dict[PurePosixPath, Attr],
+                      readdir_cache: Dict[PurePosixPath, Set[str]],
+                      path: PurePosixPath,
+                      attr: Optional[Attr]) -> None:
+        """
+        Update a single item in given caches (``None`` removes it).
+        """
+
+        if attr is None:
+            getattr_cache.pop(path, None)
+            readdir_cache.pop(path, None)
+
+            # Remove from parent's dir cache
+            readdir_cache.get(path.parent, set()).discard(path.name)
+            return
+
+        getattr_cache[path] = attr
+
+        # Prevent recursive caching
+        if path.parent != path:
+            readdir_cache.setdefault(path.parent, set()).add(path.name)
+
+        if attr.is_dir():
+            readdir_cache.setdefault(path, set())
 
         # Add all intermediate directories, in case ``info_all()`` didn't include them
         for i in range(len(path.parts)):
-            self.readdir_cache.setdefault(
+            readdir_cache.setdefault(
                 PurePosixPath(*path.parts[:i]),
                 set()
             ).add(path.parts[i])
 
     def _update(self) -> None:
-        if self.expiry < time.time():
+        if self.expiry >= time.time():
+            return
+        if self.background_refresh and self.expiry:
+            self._start_background_refresh()
+        else:
             self._refresh()
 
     def clear_cache(self) -> None:
@@ -191,6 +321,8 @@ class CachedStorageMixin(BaseCachedStorageMixin):
             self.getattr_cache.clear()
             self.readdir_cache.clear()
             self.expiry = 0.
+            self.change_token = None
+            self._refresh_generation += 1
 
     def getattr(self, path: PurePosixPath) -> Attr:
         """
@@ -229,19 +361,116 @@ class CachedStorageMixin(BaseCachedStorageMixin):
             return sorted(self.readdir_cache[path])
 
 
+class _DirNode:
+    """
+    Cached information about a single directory.
+    """
+
+    __slots__ = ('children', 'names', 'expiry', '_sorted_names')
+
+    def __init__(self) -> None:
+        #: attributes of the directory's children
+        self.children: Dict[str, Attr] = {}
+        #: the directory listing, or ``None`` if the directory is not known to exist
+        self.names: Optional[Set[str]] = None
+        #: when the listing expires, or ``None`` if the directory was never listed
+        self.expiry: Optional[float] = None
+        self._sorted_names: Optional[List[str]] = None
+
+    def size(self) -> int:
+        """
+        Number of entries held, for the purpose of limiting the cache size.
+        """
+
+        return len(self.children) + 1
+
+    def sorted_names(self) -> List[str]:
+        """
+        Sorted listing (``names`` must be set).
+        """
+
+        assert self.names is not None
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.names)
+        return self._sorted_names
+
+    def add(self, name: str, attr: Attr) -> None:
+        """
+        Add or update a child.
+        """
+
+        self.children[name] = attr
+        if self.names is not None and name not in self.names:
+            self.names.add(name)
+            self._sorted_names = None
+
+    def discard(self, name: str) -> None:
+        """
+        Remove a child, if present.
+        """
+
+        self.children.pop(name, None)
+        if self.names is not None and name in self.names:
+            self.names.discard(name)
+            self._sorted_names = None
+
+
 class DirectoryCachedStorageMixin(BaseCachedStorageMixin):
     """
     A mixin for caching file information about a specific directory.
 
     You need to implement ``info_dir()``, and invalidate the cache (by calling ``clear_cache()`` or
     ``update_cache()``) in all operations that might change the result.
+
+    The cache is indexed by directory, each directory holding its children's attributes, so that
+    cost of any operation depends only on the size of the directory. The least recently used
+    directories are dropped when the cache holds more than ``CACHE_MAX_ENTRIES`` entries.
     """
 
+    #: maximum number of cached files and directories
+    CACHE_MAX_ENTRIES = 100000
+
     def __init__(self, *args, **kwargs):
         # Silence mypy: https://github.com/python/mypy/issues/5887
         super().__init__(*args, **kwargs)  # type: ignore
 
-        self.dir_expiry: Dict[PurePosixPath, float] = {}
+        self.cache_max_entries = self.CACHE_MAX_ENTRIES
+        # directories, from the least recently used
+        self._dir_nodes: 'OrderedDict[PurePosixPath, _DirNode]' = OrderedDict()
+        self._cache_entries = 0
+
+    @property
+    def getattr_cache(self) -> Dict[PurePosixPath, Attr]:
+        """
+        A snapshot of cached file attributes (for inspection only).
+        """
+
+        with self.cache_lock:
+            return {path / name: attr
+                    for path, node in self._dir_nodes.items()
+                    for name, attr in node.children.items()}
+
+    @property
+    def readdir_cache(self) -> Dict[PurePosixPath, Set[str]]:
+        """
+        A snapshot of cached directory listings (for inspection only).
+        """
+
+        with self.cache_lock:
+            return {path: set(node.names)
+                    for path, node in self._dir_nodes.items()
+                    if node.names is not None}
+
+    @property
+    def dir_expiry(self) -> Dict[PurePosixPath, float]:
+        """
+        A snapshot of directory listing expiry times (for inspection only).
+        """
+
+        with self.cache_lock:
+            return {path: node.expiry
+                    for path, node in self._dir_nodes.items()
+                    if node.expiry is not None}
 
     def info_dir(self, path: PurePosixPath) -> Iterable[Tuple[PurePosixPath, Attr]]:
         """
@@ -257,45 +486,76 @@ class DirectoryCachedStorageMixin(BaseCachedStorageMixin):
         with self.cache_lock:
             self._update_cache(path, attr)
 
-    def _update_dir(self, path: PurePosixPath) -> None:
-        if self.dir_expiry.get(path, 0) >= time.time():
+    def _update_cache(self, path: PurePosixPath, attr: Optional[Attr]) -> None:
+        if attr is None:
+            self._drop_node(path)
+
+        # Prevent recursive caching
+        if path.parent == path:
             return
 
-        if path in self.dir_expiry:
-            self.invalidate_dir_cache(path)
+        node = self._dir_nodes.get(path.parent)
+        if attr is None:
+            if node is not None:
+                self._cache_entries -= path.name in node.children
+                node.discard(path.name)
+            return
 
-        self._refresh_dir(path)
+        if node is None:
+            node = self._dir_nodes[path.parent] = _DirNode()
+            self._cache_entries += node.size()
+        if path.name not in node.children:
+            self._cache_entries += 1
+        node.add(path.name, attr)
+        self._evict()
+
+    def _drop_node(self, path: PurePosixPath) -> None:
+        node = self._dir_nodes.pop(path, None)
+        if node is not None:
+            self._cache_entries -= node.size()
+
+    def _evict(self) -> None:
+        # Never drop the most recently used directory
+        while self._cache_entries > self.cache_max_entries and len(self._dir_nodes) > 1:
+            _path, node = self._dir_nodes.popitem(last=False)
+            self._cache_entries -= node.size()
+
+    def _update_dir(self, path: PurePosixPath) -> _DirNode:
+        node = self._dir_nodes.get(path)
+        if node is not None and node.expiry is not None and node.expiry >= time.time():
+            self._dir_nodes.move_to_end(path)
+            return node
+
+        return self._refresh_dir(path)
 
     def invalidate_dir_cache(self, path: PurePosixPath) -> None:
         """
         Invalidates directory cache
         """
-        del self.dir_expiry[path]
-
-        if path in self.readdir_cache:
-            del self.readdir_cache[path]
 
-        for getattr_path in list(self.getattr_cache.keys()):
-            if getattr_path.parent == path:
-                del self.getattr_cache[getattr_path]
+        self._drop_node(path)
 
-    def _refresh_dir(self, path: PurePosixPath) -> None:
-        names: Set[str] = set()
+    def _refresh_dir(self, path: PurePosixPath) -> _DirNode:
+        node = _DirNode()
         try:
             for file_path, attr in self.info_dir(path):
-                name = file_path.name
-                names.add(name)
-                self.getattr_cache[path / name] = attr
+                node.children[file_path.name] = attr
         except PermissionError as e:
             raise e
         except OSError as e:
-            # Don't store anything in readdir_cache, we will assume that the
-            # directory does not exist.
+            # Don't store the listing, we will assume that the directory does not exist.
             logger.exception(e)
+            node.children.clear()
         else:
-            self.readdir_cache[path] = names
+            node.names = set(node.children)
 
-        self.dir_expiry[path] = time.time() + self.cache_timeout
+        node.expiry = time.time() + self.cache_timeout
+
+        self._drop_node(path)
+        self._dir_nodes[path] = node
+        self._cache_entries += node.size()
+        self._evict()
+        return node
 
     def clear_cache(self) -> None:
         """
@@ -303,9 +563,8 @@ class DirectoryCachedStorageMixin(BaseCachedStorageMixin):
         """
 
         with self.cache_lock:
-            self.getattr_cache.clear()
-            self.readdir_cache.clear()
-            self.dir_expiry.clear()
+            self._dir_nodes.clear()
+            self._cache_entries = 0
 
     def getattr(self, path: PurePosixPath) -> Attr:
         """
@@ -320,12 +579,13 @@ class DirectoryCachedStorageMixin(BaseCachedStorageMixin):
             return Attr.dir()
 
         with self.cache_lock:
-            self._update_dir(path.parent)
+            node = self._update_dir(path.parent)
 
-            if path not in self.getattr_cache:
+            attr = node.children.get(path.name)
+            if attr is None:
                 raise FileNotFoundError(errno.ENOENT, str(path))
 
-            return self.getattr_cache[path]
+            return attr
 
     def readdir(self, path: PurePosixPath) -> Iterable[str]:
         """
@@ -336,9 +596,28 @@ class DirectoryCachedStorageMixin(BaseCachedStorageMixin):
             path = PurePosixPath(path)
 
         with self.cache_lock:
-            self._update_dir(path)
+            node = self._update_dir(path)
 
-            if path not in self.readdir_cache:
+            if node.names is None:
                 raise FileNotFoundError(errno.ENOENT, str(path))
 
-            return sorted(self.readdir_cache[path])
+            return list(node.sorted_names())
+
+    def invalidate_cache(self, events: Iterable[FileEvent]) -> None:
+        """
+        Invalidate listings of the directories containing changed files, and everything cached
+        under removed paths.
+        """
+
+        with self.cache_lock:
+            removed: Set[PurePosixPath] = set()
+            for event in events:
+                self._drop_node(event.path.parent)
+                self._drop_node(event.path)
+                if event.type == FileEventType.DELETE:
+                    removed.add(event.path)
+
+            if removed:
+                for path in [path for path in self._dir_nodes
+                             if not removed.isdisjoint(path.parents)]:
+                    self._drop_node(path)
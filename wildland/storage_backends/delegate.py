@@ -25,7 +25,7 @@
 Delegate proxy backend
 """
 
-from typing import Iterable, Optional, Tuple
+from typing import Dict, Iterable, Optional, Tuple
 from pathlib import PurePosixPath
 
 import click
@@ -169,15 +169,33 @@ class DelegateProxyStorageBackend(StorageBackend):
     def get_file_token(self, path: PurePosixPath) -> Optional[str]:
         return self.reference.get_file_token(self._path(path))
 
+    def native_hash_type(self) -> Optional[str]:
+        return self.reference.native_hash_type()
+
+    def get_native_hash(self, path: PurePosixPath) -> Optional[str]:
+        return self.reference.get_native_hash(self._path(path))
+
     def get_hash(self, path: PurePosixPath):
         return self.reference.get_hash(self._path(path))
 
+    def get_hashes(self, paths: Iterable[PurePosixPath]) -> Dict[PurePosixPath, Optional[str]]:
+        paths = list(paths)
+        hashes = self.reference.get_hashes(self._path(path) for path in paths)
+        return {path: hashes[self._path(path)] for path in paths}
+
     def store_hash(self, path, hash_cache):
         return self.reference.store_hash(self._path(path), hash_cache)
 
+    def store_hashes(self, hashes):
+        return self.reference.store_hashes([(self._path(path), hash_cache)
+                                            for path, hash_cache in hashes])
+
     def retrieve_hash(self, path):
         return self.reference.retrieve_hash(self._path(path))
 
+    def preload_hashes(self, paths):
+        self.reference.preload_hashes(self._path(path) for path in paths)
+
     def open_for_safe_replace(self, path: PurePosixPath, flags: int, original_hash: str) -> File:
         return self.reference.open_for_safe_replace(self._path(path), flags, original_hash)
 
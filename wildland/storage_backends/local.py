@@ -31,7 +31,7 @@ import select
 import threading
 import time
 from pathlib import Path, PurePosixPath
-from typing import Optional, List, Dict, Tuple, Iterable
+from typing import Optional, List, Dict, Set, Tuple, Iterable
 import click
 import inotify_simple
 
@@ -136,6 +136,7 @@ class LocalStorageBackend(FileChildrenMixin, StorageBackend):
     })
     TYPE = 'local'
     LOCATION_PARAM = 'location'
+    RANGED_WRITES = True
 
     def __init__(self, *, relative_to=None, **kwds):
         super().__init__(**kwds)
@@ -264,14 +265,18 @@ class LocalStorageBackend(FileChildrenMixin, StorageBackend):
 class LocalStorageWatcher(StorageWatcher):
     """
     Watches for changes in local storage, using inotify.
-    Known issues: on subdirectory creation, some events may be lost, because files appear
-    before the watcher can add watches. It's unfortunately a known inotify issue.
+
+    A newly created directory is listed after its watch is added, and everything found in it is
+    reported as created, so that files which appear before the watch is added are not lost.
     """
     def __init__(self, backend: StorageBackend):
         super().__init__()
-        self.path = getattr(backend, 'root', None)
-        self.clear_cache = backend.clear_cache
+        self.path = str(getattr(backend, 'root'))
+        self.invalidate_cache = backend.invalidate_cache
+        # watched directories, indexed both ways, and the watched subdirectories of each
         self.watches: Dict[int, str] = {}
+        self.watch_paths: Dict[str, int] = {}
+        self.watch_children: Dict[str, Set[str]] = {}
         self.watch_flags = inotify_simple.flags.CREATE | inotify_simple.flags.DELETE | \
             inotify_simple.flags.MOVED_TO | inotify_simple.flags.MOVED_FROM | \
             inotify_simple.flags.CLOSE_WRITE
@@ -285,15 +290,71 @@ class LocalStorageWatcher(StorageWatcher):
         with self.lock:
             self.ignore_list.append((event_type, str(path)))
 
-    def _watch_dir(self, path):
-        for root, dirs, _files in os.walk(path):
-            if root not in self.watches.values():
-                wd = self.inotify.add_watch(root, self.watch_flags)
-                self.watches[wd] = root
-            for directory in dirs:
-                dir_path = os.path.join(root, directory)
-                wd = self.inotify.add_watch(dir_path, self.watch_flags)
-                self.watches[wd] = dir_path
+    def _add_watch(self, path: str) -> None:
+        wd = self.inotify.add_watch(path, self.watch_flags)
+        # the same directory (moved) gets the same descriptor
+        old_path = self.watches.get(wd)
+        if old_path is not None and old_path != path:
+            self._forget_watch(old_path)
+        self.watches[wd] = path
+        self.watch_paths[path] = wd
+        if path != self.path:
+            self.watch_children.setdefault(os.path.dirname(path), set()).add(path)
+
+    def _forget_watch(self, path: str) -> List[int]:
+        """
+        Remove a directory and its subdirectories from the index, returning their descriptors.
+        """
+        wds = []
+        stack = [path]
+        while stack:
+            dir_path = stack.pop()
+            wd = self.watch_paths.pop(dir_path, None)
+            if wd is not None and self.watches.get(wd) == dir_path:
+                del self.watches[wd]
+                wds.append(wd)
+            stack.extend(self.watch_children.pop(dir_path, ()))
+        parent = os.path.dirname(path)
+        siblings = self.watch_children.get(parent)
+        if siblings is not None:
+            siblings.discard(path)
+            if not siblings:
+                del self.watch_children[parent]
+        return wds
+
+    def _unwatch_dir(self, path: str) -> None:
+        for wd in self._forget_watch(path):
+            try:
+                self.inotify.rm_watch(wd)
+            except OSError:
+                # already removed along with the directory
+                pass
+
+    def _watch_dir(self, path: str) -> List[str]:
+        """
+        Watch a directory and all its subdirectories. Each directory is listed after its watch is
+        added, so that nothing created in the meantime is missed. Returns paths of everything
+        found under the directory.
+        """
+        found = []
+        stack = [path]
+        while stack:
+            dir_path = stack.pop()
+            if dir_path not in self.watch_paths:
+                try:
+                    self._add_watch(dir_path)
+                except OSError:
+                    # removed in the meantime
+                    continue
+            try:
+                entries = list(os.scandir(dir_path))
+            except OSError:
+                continue
+            for entry in entries:
+                found.append(entry.path)
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+        return found
 
     def init(self) -> None:
         # pylint: disable=attribute-defined-outside-init
@@ -320,7 +381,27 @@ class LocalStorageWatcher(StorageWatcher):
         if self._stop_pipe_read in result[0]:
             return []
         events = self.inotify.read(timeout=1, read_delay=250)
-        results = []
+        results: List[FileEvent] = []
+        # including own events, which the backend might not have accounted for in its cache
+        changes: List[FileEvent] = []
+        last_types: Dict[PurePosixPath, FileEventType] = {}
+
+        def add_event(event_type: FileEventType, path: str):
+            relative_path = PurePosixPath(path).relative_to(self.path)
+            # a file can be found both by listing a new directory and by its own event
+            if event_type == FileEventType.CREATE and \
+                    last_types.get(relative_path) == FileEventType.CREATE:
+                return
+            last_types[relative_path] = event_type
+            changes.append(FileEvent(event_type, relative_path))
+
+            with self.lock:
+                ev = (event_type, str(relative_path))
+                if ev in self.ignore_list:
+                    self.ignore_list.remove(ev)
+                    return
+
+            results.append(FileEvent(event_type, relative_path))
 
         for event in events:
             event_flags = inotify_simple.flags.from_mask(event.mask)
@@ -328,31 +409,30 @@ class LocalStorageWatcher(StorageWatcher):
             if inotify_simple.flags.IGNORED in event_flags:
                 continue
 
-            path = os.path.join(self.watches[event.wd], event.name)
+            dir_path = self.watches.get(event.wd)
+            if dir_path is None:
+                # a directory no longer watched, for example moved out of the storage
+                continue
+            path = os.path.join(dir_path, event.name)
 
             if inotify_simple.flags.CREATE in event_flags or \
                     inotify_simple.flags.MOVED_TO in event_flags:
+                add_event(FileEventType.CREATE, path)
                 if inotify_simple.flags.ISDIR in event_flags:
-                    self._watch_dir(path)
-                event_type = FileEventType.CREATE
+                    found = self._watch_dir(path)
+                    # contents of a moved directory are not new, but in a new directory they
+                    # might have been created before the watch was added
+                    if inotify_simple.flags.CREATE in event_flags:
+                        for found_path in found:
+                            add_event(FileEventType.CREATE, found_path)
             elif inotify_simple.flags.DELETE in event_flags or \
                     inotify_simple.flags.MOVED_FROM in event_flags:
                 if inotify_simple.flags.ISDIR in event_flags:
-                    self.watches = {key: val for key, val in self.watches.items() if val != path}
-                event_type = FileEventType.DELETE
+                    self._unwatch_dir(path)
+                add_event(FileEventType.DELETE, path)
             elif inotify_simple.flags.CLOSE_WRITE in event_flags:
-                event_type = FileEventType.MODIFY
-            else:
-                continue
-
-            relative_path = PurePosixPath(path).relative_to(self.path)
+                add_event(FileEventType.MODIFY, path)
 
-            with self.lock:
-                ev = (event_type, str(relative_path))
-                if ev in self.ignore_list:
-                    self.ignore_list.remove(ev)
-                    continue
-
-            results.append(FileEvent(event_type, relative_path))
-        self.clear_cache()
+        if changes:
+            self.invalidate_cache(changes)
         return results
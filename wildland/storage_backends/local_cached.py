@@ -25,26 +25,27 @@
 A cached version of local storage.
 """
 
-from typing import Iterable, Tuple, Optional
+from typing import IO, Iterable, List, Tuple, Optional
 from pathlib import Path, PurePosixPath
 import os
 import errno
+import shutil
 import time
 
 import click
 
 from .cached import CachedStorageMixin, DirectoryCachedStorageMixin
-from .buffered import FullBufferedFile, PagedFile, File
+from .buffered import SpooledBufferedFile, PagedFile, File
 from .base import StorageBackend, Attr, verify_local_access
 from .local import LocalStorageWatcher
-from .watch import FileEventType
+from .watch import FileEvent, FileEventType
 from ..manifest.schema import Schema
 from ..log import get_logger
 
 logger = get_logger('local-cached')
 
 
-class LocalCachedFile(FullBufferedFile):
+class LocalCachedFile(SpooledBufferedFile):
     """
     A fully buffered local file.
     """
@@ -56,15 +57,16 @@ class LocalCachedFile(FullBufferedFile):
         self.local_path = local_path
         self.ignore_callback = ignore_callback
 
-    def read_full(self) -> bytes:
+    def read_full_into(self, stream: IO[bytes]) -> None:
         with open(self.os_path, 'rb') as f:
-            return f.read()
+            shutil.copyfileobj(f, stream)
 
-    def write_full(self, data: bytes) -> int:
+    def write_full_from(self, stream: IO[bytes], size: int) -> int:
         if self.ignore_callback:
             self.ignore_callback(FileEventType.MODIFY, self.local_path)
         with open(self.os_path, 'wb') as f:
-            return f.write(data)
+            shutil.copyfileobj(stream, f)
+        return size
 
 
 class LocalCachedPagedFile(PagedFile):
@@ -92,6 +94,9 @@ class BaseCached(StorageBackend):
     time.
     """
 
+    # files are spooled locally and written back only if changed
+    RANGED_WRITES = True
+
     SCHEMA = Schema({
         "type": "object",
         "required": ["location"],
@@ -262,8 +267,13 @@ class LocalCachedStorageBackend(CachedStorageMixin, BaseCached):
             return
 
         yield PurePosixPath('.'), self._stat(st)
+        yield from self._info_tree(PurePosixPath('.'))
 
-        for root_s, dirs, files in os.walk(self.root,
+    def _info_tree(self, path: PurePosixPath) -> Iterable[Tuple[PurePosixPath, Attr]]:
+        """
+        Load information about all files and directories under a given directory.
+        """
+        for root_s, dirs, files in os.walk(self._local(path),
                                            topdown=True,
                                            onerror=self._walk_error_handler,
                                            followlinks=True):
@@ -307,6 +317,32 @@ class LocalCachedStorageBackend(CachedStorageMixin, BaseCached):
         logger.warning('Error handled when traversing [%s] directory tree, specifically [%s] '
                        'file/directory. Details: %s', self.root, err.filename, err)
 
+    def invalidate_cache(self, events: Iterable[FileEvent]) -> None:
+        """
+        Update information about the changed files and their parent directories, instead of
+        loading information about all files again.
+        """
+        changes: List[Tuple[PurePosixPath, Optional[Attr]]] = []
+        for event in events:
+            attr = self._stat_path(event.path)
+            changes.append((event.path.parent, self._stat_path(event.path.parent)))
+            changes.append((event.path, attr))
+
+            # a directory moved in brings its contents along, with no separate events
+            if event.type == FileEventType.CREATE and attr is not None and attr.is_dir():
+                changes.extend(self._info_tree(event.path))
+
+        self.update_cache_many(changes)
+
+    def _stat_path(self, path: PurePosixPath) -> Optional[Attr]:
+        local = self._local(path)
+        if is_symlink_pointing_outside_container(self.root, local):
+            return None
+        try:
+            return self._stat(os.stat(local))
+        except OSError:
+            return None
+
 
 class LocalDirectoryCachedStorageBackend(DirectoryCachedStorageMixin, BaseCached):
     """
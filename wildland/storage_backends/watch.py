@@ -25,7 +25,8 @@
 Watching for changes.
 """
 from enum import Enum
-from typing import Optional, List, Callable, Dict, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Callable, Dict, Iterable, Tuple
 from pathlib import PurePosixPath
 import threading
 from dataclasses import dataclass
@@ -170,11 +171,9 @@ class SimpleStorageWatcher(StorageWatcher, metaclass=abc.ABCMeta):
         if new_token != self.token:
             logger.debug('storage changed...')
             self.backend.clear_cache()
-            new_info = self._get_info()
-            result = list(self._compare_info(self.info, new_info))
+            result = self._changes()
 
             self.token = new_token
-            self.info = new_info
             if result:
                 logger.debug('file changes detected')
                 return result
@@ -189,6 +188,15 @@ class SimpleStorageWatcher(StorageWatcher, metaclass=abc.ABCMeta):
     def _get_info(self) -> Dict[PurePosixPath, Attr]:
         raise NotImplementedError()
 
+    def _changes(self) -> List[FileEvent]:
+        """
+        Retrieve the current information, and return changes since the previous one.
+        """
+        new_info = self._get_info()
+        result = list(self._compare_info(self.info, new_info))
+        self.info = new_info
+        return result
+
     @staticmethod
     def _compare_info(current_info, new_info):
         current_paths = set(current_info)
@@ -205,29 +213,110 @@ class SimpleStorageWatcher(StorageWatcher, metaclass=abc.ABCMeta):
 class SimpleFileWatcher(SimpleStorageWatcher, metaclass=abc.ABCMeta):
     """
     An implementation of storage watcher that uses the backend to enumerate all files.
+
+    Directories are scanned in parallel, one level of the tree at a time. Directories for which
+    the backend's ``get_dir_token()`` did not change are not listed again, and only the listings
+    of changed directories are compared.
     """
 
+    #: number of threads scanning directories
+    SCAN_WORKERS = 8
+
+    def __init__(self, backend: StorageBackend, interval: int = 10):
+        super().__init__(backend, interval)
+        #: scanned directories: token, and attributes of directory entries
+        self.dirs: Dict[PurePosixPath, Tuple[Optional[str], Dict[str, Attr]]] = {}
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
     def _get_info(self) -> Dict[PurePosixPath, Attr]:
-        return dict(self._walk(PurePosixPath('.')))
+        self._changes()
+        return self.info
+
+    def _changes(self) -> List[FileEvent]:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.SCAN_WORKERS, thread_name_prefix='watch-scan')
+
+        result: List[FileEvent] = []
+        level = [PurePosixPath('.')]
+        while level:
+            scans = list(self.executor.map(self._scan_dir, level))
+            next_level: List[PurePosixPath] = []
+            for dir_path, (token, entries) in zip(level, scans):
+                if entries is None:
+                    entries = self.dirs[dir_path][1]
+                else:
+                    old_entries = self.dirs.get(dir_path, (None, {}))[1]
+                    self.dirs[dir_path] = (token, entries)
+                    result.extend(self._compare_dir(dir_path, old_entries, entries))
+                next_level.extend(dir_path / name for name, attr in entries.items()
+                                  if attr.is_dir())
+            level = next_level
+        return result
+
+    def _scan_dir(self, dir_path: PurePosixPath) \
+            -> Tuple[Optional[str], Optional[Dict[str, Attr]]]:
+        """
+        Retrieve a directory's token and entries, or ``None`` instead of entries if the token
+        did not change since the previous scan.
+        """
+        try:
+            token = self.backend.get_dir_token(dir_path)
+        except IOError:
+            logger.exception('error in get_dir_token %s', dir_path)
+            token = None
+        previous = self.dirs.get(dir_path)
+        if token is not None and previous is not None and previous[0] == token:
+            return token, None
 
-    def _walk(self, dir_path: PurePosixPath):
+        entries: Dict[str, Attr] = {}
         try:
             names = list(self.backend.readdir(dir_path))
         except IOError:
             logger.exception('error in readdir %s', dir_path)
-            return
+            return None, entries
 
         for name in names:
             file_path = dir_path / name
             try:
-                attr = self.backend.getattr(file_path)
+                entries[name] = self.backend.getattr(file_path)
             except IOError:
                 logger.exception('error in getattr %s', file_path)
+        return token, entries
+
+    def _compare_dir(self, dir_path: PurePosixPath,
+                     old_entries: Dict[str, Attr], new_entries: Dict[str, Attr]) \
+            -> Iterable[FileEvent]:
+        for name, old_attr in old_entries.items():
+            new_attr = new_entries.get(name)
+            if new_attr is not None and new_attr.is_dir() == old_attr.is_dir():
                 continue
-
-            yield file_path, attr
+            # removed, or replaced with a file of another type
+            if old_attr.is_dir():
+                yield from self._remove_dir(dir_path / name)
+            del self.info[dir_path / name]
+            yield FileEvent(FileEventType.DELETE, dir_path / name)
+
+        for name, new_attr in new_entries.items():
+            previous = old_entries.get(name)
+            self.info[dir_path / name] = new_attr
+            if previous is None or previous.is_dir() != new_attr.is_dir():
+                yield FileEvent(FileEventType.CREATE, dir_path / name)
+            elif previous != new_attr:
+                yield FileEvent(FileEventType.MODIFY, dir_path / name)
+
+    def _remove_dir(self, dir_path: PurePosixPath) -> Iterable[FileEvent]:
+        _token, entries = self.dirs.pop(dir_path, (None, {}))
+        for name, attr in entries.items():
             if attr.is_dir():
-                yield from self._walk(file_path)
+                yield from self._remove_dir(dir_path / name)
+            del self.info[dir_path / name]
+            yield FileEvent(FileEventType.DELETE, dir_path / name)
 
 
 class SimpleSubcontainerWatcher(SimpleStorageWatcher, metaclass=abc.ABCMeta):
@@ -25,8 +25,11 @@ Storage syncing.
 # pylint: disable=no-self-use
 import abc
 import json
+import threading
+import time
+from contextlib import contextmanager
 from enum import Enum
-from typing import Optional, Iterable, Dict, Type, List, Callable, Any
+from typing import Optional, Iterable, Iterator, Dict, Type, List, Callable, Any
 from pathlib import Path, PurePosixPath
 from wildland.storage import StorageBackend
 from ..storage_backends.base import OptionalError
@@ -162,7 +165,8 @@ class SyncStateEvent(SyncEvent):
 
 class SyncProgressEvent(SyncEvent):
     """
-    Sync progress event. Currently indicates which file/directory is being synced.
+    Sync progress event. Indicates which file/directory is being synced and, optionally, how many
+    bytes the sync has transferred so far and at what rate (bytes per second).
     """
     type = 'progress'
 
@@ -176,14 +180,29 @@ class SyncProgressEvent(SyncEvent):
         vals = obj['value'].split(' ', 1)
         event_type = FileEventType[vals[0]]
         path = PurePosixPath(vals[1])
-        return SyncProgressEvent(event_type, path)
+        return SyncProgressEvent(event_type, path, transferred=obj.get('transferred'),
+                                 throughput=obj.get('throughput'))
 
     def __init__(self, event_type: FileEventType, path: PurePosixPath,
-                 job_id: Optional[str] = None):
+                 job_id: Optional[str] = None, transferred: Optional[int] = None,
+                 throughput: Optional[float] = None):
         self.event_type = event_type
         self.path = path
         self.value = f'{event_type.name} {path}'
         self.job_id = job_id
+        self.transferred = transferred
+        self.throughput = throughput
+
+    def toJSON(self) -> str:
+        if self.transferred is None:
+            return super().toJSON()
+
+        obj: Dict[str, Any] = {'type': self.type, 'value': self.value}
+        if self.job_id:
+            obj['job_id'] = self.job_id
+        obj['transferred'] = self.transferred
+        obj['throughput'] = self.throughput
+        return json.dumps(obj)
 
 
 class SyncConflictEvent(SyncEvent):
@@ -226,6 +245,56 @@ class SyncErrorEvent(SyncEvent):
         self.job_id = job_id
 
 
+class TransferScheduler:
+    """
+    Budget of file transfers, shared by all syncers using it (e.g. all jobs of the sync daemon):
+    limits the number of files transferred at the same time and, optionally, the total bandwidth
+    (in bytes per second).
+    """
+    DEFAULT_MAX_TRANSFERS = 8
+
+    def __init__(self, max_transfers: int = DEFAULT_MAX_TRANSFERS,
+                 bandwidth: Optional[int] = None):
+        self.max_transfers = max_transfers
+        self.bandwidth = bandwidth
+        self._slots = threading.BoundedSemaphore(max_transfers)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # time at which the bandwidth budget is free again
+        self._next_free = time.monotonic()
+
+    @contextmanager
+    def transfer(self) -> Iterator[None]:
+        """
+        Take a transfer slot for the duration of the context, waiting for one if all are taken.
+        Nested transfers in the same thread (e.g. files of a batch) share the outer slot.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0:
+            self._slots.acquire()
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                self._slots.release()
+
+    def throttle(self, size: int) -> None:
+        """
+        Account for ``size`` bytes being transferred; waits as long as needed to keep within
+        the bandwidth budget.
+        """
+        if not self.bandwidth:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + size / self.bandwidth
+        if start > now:
+            time.sleep(start - now)
+
+
 class BaseSyncer(metaclass=abc.ABCMeta):
     """
     A class for watching changes in storages and synchronizing them across different backends.
@@ -266,6 +335,8 @@ class BaseSyncer(metaclass=abc.ABCMeta):
         self._event_callback: Optional[Callable] = None
         self._event_context: Any = None
         self._event_types = SyncEvent.__subclasses__()
+        self.workers: Optional[int] = None
+        self.scheduler = TransferScheduler()
 
     def one_shot_sync(self, unidirectional: bool = False):
         """
@@ -336,6 +407,20 @@ class BaseSyncer(metaclass=abc.ABCMeta):
             self._event_types = [cls for cls in SyncEvent.__subclasses__()
                                  if cls.type in event_types]
 
+    def set_workers(self, workers: Optional[int]):
+        """
+        Set how many parallel workers (e.g. for hashing files) the syncer may use per storage.
+        None means each storage backend's default (see StorageBackend.HASH_WORKERS).
+        """
+        self.workers = workers
+
+    def set_scheduler(self, scheduler: TransferScheduler):
+        """
+        Set the transfer scheduler, which may be shared with other syncers so that they keep
+        within a common concurrency and bandwidth budget.
+        """
+        self.scheduler = scheduler
+
     @property
     def active_event_types(self) -> List[Type[SyncEvent]]:
         """
@@ -42,7 +42,7 @@ from wildland.manifest.schema import Schema
 from wildland.storage_backends.base import StorageBackend, OptionalError
 from wildland.storage_backends.watch import FileEvent
 from wildland.storage_sync.base import BaseSyncer, SyncState, SyncEvent, SyncStateEvent, \
-    SyncConflictEvent, SyncErrorEvent, SyncProgressEvent
+    SyncConflictEvent, SyncErrorEvent, SyncProgressEvent, TransferScheduler
 from wildland.log import get_logger
 
 logger = get_logger('sync-daemon')
@@ -75,6 +75,8 @@ class SyncJob:
         self._current_item: Optional[FileEvent] = None
         self._conflicts: List[str] = []
         self._error: Optional[str] = None
+        # (bytes transferred, bytes per second) from the last progress event
+        self.transfer_stats: Optional[Tuple[int, float]] = None
 
     @property
     def state(self) -> SyncState:
@@ -153,6 +155,11 @@ class SyncJob:
         if self.current_item and self.state in [SyncState.RUNNING, SyncState.ONE_SHOT]:
             ret += f'\n   currently syncing: {self.current_item}'
 
+        if self.transfer_stats:
+            transferred, throughput = self.transfer_stats
+            ret += f'\n   transferred: {transferred / 1024 ** 2:.1f} MiB ' \
+                   f'({throughput / 1024 ** 2:.1f} MiB/s)'
+
         try:
             if len(self._conflicts) > 0:
                 for conflict in self._conflicts:
@@ -195,6 +202,8 @@ class SyncJob:
         finally:
             if self.continuous:
                 self.syncer.stop_sync()
+            self.source.close_hash_db()
+            self.target.close_hash_db()
             # signal that worker is finished to not lose any events in the daemon thread
             # we don't use STOPPED event because it doesn't mean the syncer is stopped permanently
             self.event_queue.put([self.job_id, None])
@@ -214,6 +223,10 @@ class SyncDaemon:
         config = Config.load(base_dir)
         self.base_dir = config.base_dir
 
+        # transfer budget shared by all jobs
+        self.scheduler = TransferScheduler(config.get('sync-max-transfers'),
+                                           config.get('sync-bandwidth') or None)
+
         if socket_path:
             self.socket_path = Path(socket_path)
         else:
@@ -262,6 +275,8 @@ class SyncDaemon:
                     job.state = event.state
                 elif isinstance(event, SyncProgressEvent):
                     job.current_item = FileEvent(event.event_type, event.path)
+                    if event.transferred is not None:
+                        job.transfer_stats = (event.transferred, event.throughput or 0.0)
                 elif isinstance(event, SyncConflictEvent):
                     job.add_conflict(event.value)
                 elif isinstance(event, SyncErrorEvent):
@@ -279,7 +294,7 @@ class SyncDaemon:
 
     def start_sync(self, container_name: str, job_id: str, continuous: bool, unidirectional: bool,
                    source: dict, target: dict, active_events: List[str],
-                   control_handler: ControlHandler) -> str:
+                   control_handler: ControlHandler, workers: Optional[int] = None) -> str:
         """
         Start syncing storages, or do a one-shot sync.
 
@@ -293,6 +308,7 @@ class SyncDaemon:
                               Empty list means all events.
         :param control_handler: ControlServer's handler to be associated with the job
                                 (used to send event notifications).
+        :param workers: Number of parallel workers per storage (None means backend defaults).
         :return: Response message.
         """
         source_backend = StorageBackend.from_params(source)
@@ -311,6 +327,7 @@ class SyncDaemon:
             hash_db = HashDb(self.base_dir)
             uuid = job_id.split('|')[1]
             hash_db.update_storages_for_containers(uuid, [source_backend, target_backend])
+            hash_db.close()
 
             source_backend.set_config_dir(self.base_dir)  # hashdb location
             target_backend.set_config_dir(self.base_dir)
@@ -325,6 +342,8 @@ class SyncDaemon:
                 active_events = []
             logger.debug('Setting event filters for %s to %s', job_id, active_events)
             syncer.set_active_events(active_events)
+            syncer.set_workers(workers)
+            syncer.set_scheduler(self.scheduler)
             self.jobs[job_id] = SyncJob(job_id, container_name, syncer, source_backend,
                                         target_backend, continuous, unidirectional,
                                         self.event_queue, control_handler)
@@ -369,7 +388,7 @@ class SyncDaemon:
         """
         events: List[str] = kwargs['active-events'] if 'active-events' in kwargs else []
         return self.start_sync(container_name, job_id, continuous, unidirectional, source, target,
-                               events, handler)
+                               events, handler, kwargs.get('jobs'))
 
     @control_command('stop')
     def control_stop(self, _handler, job_id: str) -> str:
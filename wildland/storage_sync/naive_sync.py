@@ -26,23 +26,53 @@ Storage syncing.
 import threading
 import hashlib
 import os
-from typing import List, Dict, Iterable, Optional
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Dict, Iterable, Optional, Tuple
 from functools import partial
 from pathlib import PurePosixPath, Path
 from contextlib import suppress
 
 from wildland.storage import StorageBackend
 from wildland.storage_backends.watch import FileEvent, StorageWatcher, FileEventType
-from wildland.storage_backends.base import OptionalError, HashMismatchError
+from wildland.storage_backends.base import File, OptionalError, HashMismatchError
 from wildland.storage_sync.base import BaseSyncer, SyncConflict, SyncState, SyncConflictEvent, \
     SyncErrorEvent, SyncProgressEvent
+from wildland.hashdb import HashCache
 from wildland.log import get_logger
 
 BLOCK_SIZE = 1024 ** 2
 
+# number of files hashed by a single worker task during one-shot sync
+HASH_BATCH_SIZE = 16
+
+# files smaller than this are transferred in batches (of up to TRANSFER_BATCH_SIZE files) during
+# one-shot sync, each batch taking a single transfer slot
+SMALL_FILE_SIZE = 256 * 1024
+TRANSFER_BATCH_SIZE = 32
+
+# minimum interval (in seconds) between progress events sent during a transfer of a single file
+PROGRESS_INTERVAL = 1
+
 logger = get_logger('naive-sync')
 
 
+def _is_native(file_hash: Optional[str]) -> bool:
+    """
+    Whether the hash is a native one (see :meth:`NaiveSyncer._native_hash`) rather than sha256.
+    """
+    return file_hash is not None and ':' in file_hash
+
+
+def _hashes_differ(hash1: Optional[str], hash2: Optional[str]) -> bool:
+    """
+    Whether both hashes are known, of the same type and different. Hashes of different types
+    (sha256 and native) cannot be compared, so they are never considered different.
+    """
+    return hash1 is not None and hash2 is not None and \
+        _is_native(hash1) == _is_native(hash2) and hash1 != hash2
+
+
 class NaiveSyncer(BaseSyncer):
     """
     Naive syncer mechanism - assumes zero special capabilities of storage backends.
@@ -69,6 +99,18 @@ class NaiveSyncer(BaseSyncer):
         self.lock = threading.Lock()
         self.conflicts: List[SyncConflict] = []
 
+        # transfer statistics, for progress events
+        self.stats_lock = threading.Lock()
+        self.transferred = 0
+        self.transfer_start = time.monotonic()
+        self.last_progress = self.transfer_start
+
+        # Compare files by the hashes the backends already keep, if both keep the same kind;
+        # sha256 is computed only when one of the files does not have a native hash.
+        source_hash_type = source_storage.native_hash_type()
+        self.native_hash_type = source_hash_type \
+            if source_hash_type == target_storage.native_hash_type() else None
+
     def start_sync(self, unidirectional: bool = False):
         """
         Initialize watchers.
@@ -105,7 +147,70 @@ class NaiveSyncer(BaseSyncer):
         self.notify_event(SyncConflictEvent(str(conflict)))
 
     def _progress(self, event_type: FileEventType, path: PurePosixPath):
-        self.notify_event(SyncProgressEvent(event_type, path))
+        with self.stats_lock:
+            now = time.monotonic()
+            self.last_progress = now
+            transferred = self.transferred
+            elapsed = now - self.transfer_start
+        throughput = transferred / elapsed if elapsed > 0 else 0.0
+        self.notify_event(SyncProgressEvent(event_type, path, transferred=transferred,
+                                            throughput=throughput))
+
+    def _account(self, path: PurePosixPath, size: int):
+        """
+        Account for ``size`` bytes of the file at path being transferred: keep within
+        the scheduler's bandwidth budget and send a progress event if the previous one was sent
+        long enough ago.
+        """
+        self.scheduler.throttle(size)
+        with self.stats_lock:
+            self.transferred += size
+            send_progress = time.monotonic() - self.last_progress >= PROGRESS_INTERVAL
+        if send_progress:
+            self._progress(FileEventType.MODIFY, path)
+
+    def _native_hash(self, storage: StorageBackend, path: PurePosixPath) -> Optional[str]:
+        """
+        Return the native hash of the file at path, prefixed with its type (e.g. ``md5:<hash>``),
+        or ``None`` if the synced storages do not keep native hashes of the same type or
+        the file does not have one.
+        """
+        if not self.native_hash_type:
+            return None
+        native_hash = storage.get_native_hash(path)
+        if native_hash is None:
+            return None
+        return f'{self.native_hash_type}:{native_hash}'
+
+    def _get_hash(self, storage: StorageBackend, path: PurePosixPath) -> Optional[str]:
+        """
+        Return the native hash of the file at path if available, its sha256 hash otherwise.
+        """
+        return self._native_hash(storage, path) or storage.get_hash(path)
+
+    def _current_hash(self, storage: StorageBackend, path: PurePosixPath,
+                      known_hash: Optional[str]) -> Optional[str]:
+        """
+        Return the hash of the file at path, of the same type as the previously known
+        ``known_hash`` (if possible), so that the two can be compared.
+        """
+        if known_hash is not None and not _is_native(known_hash):
+            return storage.get_hash(path)
+        return self._get_hash(storage, path)
+
+    @staticmethod
+    def _comparable_hashes(storage1: StorageBackend, hash1: Optional[str],
+                           storage2: StorageBackend, hash2: Optional[str],
+                           path: PurePosixPath) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Make hashes of the file at path in two storages comparable: if only one of them is
+        native, replace it with the sha256 hash.
+        """
+        if hash1 is None or hash2 is None or _is_native(hash1) == _is_native(hash2):
+            return hash1, hash2
+        if _is_native(hash1):
+            return storage1.get_hash(path), hash2
+        return hash1, storage2.get_hash(path)
 
     def one_shot_sync(self, unidirectional: bool = False):
         with self.source_storage, self.target_storage:
@@ -118,14 +223,15 @@ class NaiveSyncer(BaseSyncer):
         storage_dirs: Dict[StorageBackend, List[PurePosixPath]] = {}
 
         self.state = SyncState.ONE_SHOT
-        for storage in [self.source_storage, self.target_storage]:
-            self.storage_hashes[storage] = {}
-            storage_dirs[storage] = []
-            for path, attr in storage.walk():
-                if attr.is_dir():
-                    storage_dirs[storage].append(path)
-                else:
-                    self.storage_hashes[storage][path] = storage.get_hash(path)
+        with self.stats_lock:
+            self.transferred = 0
+            self.transfer_start = time.monotonic()
+        # walk (and hash) both storages at the same time
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='sync-scan') as executor:
+            scans = {storage: executor.submit(self._scan_storage, storage)
+                     for storage in [self.source_storage, self.target_storage]}
+        for storage, scan in scans.items():
+            storage_dirs[storage], self.storage_hashes[storage] = scan.result()
 
         storages = [(self.source_storage, self.target_storage)]
         if not unidirectional:
@@ -150,11 +256,14 @@ class NaiveSyncer(BaseSyncer):
         storage_hashes_src = self.storage_hashes[self.source_storage]
         storage_hashes_tg = self.storage_hashes[self.target_storage]
 
-        different = (path for path in storage_hashes_src
-                     if path in storage_hashes_tg
-                     and storage_hashes_tg[path] != storage_hashes_src[path])
-        for path in different:
-            self._handle_conflict(self.source_storage, self.target_storage, path)
+        for path in storage_hashes_src:
+            if path not in storage_hashes_tg:
+                continue
+            storage_hashes_src[path], storage_hashes_tg[path] = self._comparable_hashes(
+                self.source_storage, storage_hashes_src[path],
+                self.target_storage, storage_hashes_tg[path], path)
+            if storage_hashes_tg[path] != storage_hashes_src[path]:
+                self._handle_conflict(self.source_storage, self.target_storage, path)
 
         # find missing files
         for backend1, backend2 in storages:
@@ -176,13 +285,144 @@ class NaiveSyncer(BaseSyncer):
                             logger.warning(
                                 "%s: cannot remove file %s in backend %s, error: %s",
                                 self.log_prefix, path, backend1.backend_id, str(ex))
-            missing_files = (path for path in storage_hashes1 if path not in storage_hashes2)
-            for path in missing_files:
-                self._sync_file(backend1, backend2, path)
+            missing_files = [path for path in storage_hashes1 if path not in storage_hashes2]
+            self._sync_files(backend1, backend2, missing_files)
 
         # this won't overwrite an ERROR state, see the property setter
         self.state = SyncState.SYNCED
 
+    def _scan_storage(self, storage: StorageBackend) \
+            -> Tuple[List[PurePosixPath], Dict[PurePosixPath, Optional[str]]]:
+        """
+        Walk the storage and hash all files in it; return a list of directories and a dict of file
+        hashes (both in walk order).
+
+        Native hashes are used for files that have them (see :meth:`_native_hash`). The remaining
+        files are hashed in batches by up to ``self.workers`` (or ``storage.HASH_WORKERS``)
+        threads, starting while the walk is still in progress. Each batch looks up and stores its
+        cached hashes in a single hash db transaction.
+        """
+        workers = self.workers or storage.HASH_WORKERS
+        dirs: List[PurePosixPath] = []
+        files: List[PurePosixPath] = []
+        native_hashes: Dict[PurePosixPath, Optional[str]] = {}
+
+        def _walk_files() -> Iterable[PurePosixPath]:
+            # yield files without a native hash
+            for path, attr in storage.walk():
+                if attr.is_dir():
+                    dirs.append(path)
+                    continue
+                files.append(path)
+                native_hash = self._native_hash(storage, path)
+                if native_hash:
+                    native_hashes[path] = native_hash
+                else:
+                    yield path
+
+        hashes: Dict[PurePosixPath, Optional[str]] = {}
+
+        if workers <= 1:
+            hashes = storage.get_hashes(_walk_files())
+        else:
+            # limit the number of queued batches, so that the walk does not run arbitrarily far
+            # ahead of hashing
+            max_queued = 2 * workers
+            futures: List[Future] = []
+
+            # Pool threads open their own hash db connections, which are closed when the threads
+            # exit at the end of the scan.
+            with ThreadPoolExecutor(max_workers=workers,
+                                    thread_name_prefix='sync-hash') as executor:
+                def _submit(batch: List[PurePosixPath]):
+                    if len(futures) >= max_queued:
+                        # batches run in order, so all the earlier ones have started by then
+                        futures[-max_queued].result()
+                    futures.append(executor.submit(storage.get_hashes, batch))
+
+                batch: List[PurePosixPath] = []
+                for path in _walk_files():
+                    batch.append(path)
+                    if len(batch) >= HASH_BATCH_SIZE:
+                        _submit(batch)
+                        batch = []
+                if batch:
+                    _submit(batch)
+
+            for future in futures:
+                hashes.update(future.result())
+
+        hashes.update(native_hashes)
+        return dirs, {path: hashes[path] for path in files}
+
+    def _sync_files(self, source_storage: StorageBackend, target_storage: StorageBackend,
+                    paths: List[PurePosixPath]):
+        """
+        Sync files at paths from source_storage to target_storage, by up to ``self.workers`` (or
+        the larger of the storages' ``HASH_WORKERS``) threads. Small files are synced in batches;
+        each batch (and each larger file) takes a single transfer slot of ``self.scheduler``.
+        """
+        batches = self._transfer_batches(source_storage, paths)
+        workers = self.workers or max(source_storage.HASH_WORKERS, target_storage.HASH_WORKERS)
+
+        if workers <= 1:
+            for batch in batches:
+                self._sync_batch(source_storage, target_storage, batch)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix='sync-transfer') as executor:
+            futures = [executor.submit(self._sync_batch, source_storage, target_storage, batch)
+                       for batch in batches]
+        for future in futures:
+            future.result()
+
+    @staticmethod
+    def _transfer_batches(storage: StorageBackend, paths: List[PurePosixPath]) \
+            -> List[List[PurePosixPath]]:
+        """
+        Split paths into batches of small files (see SMALL_FILE_SIZE) and single larger files,
+        keeping their order.
+        """
+        batches: List[List[PurePosixPath]] = []
+        small_files: List[PurePosixPath] = []
+
+        for path in paths:
+            try:
+                size = storage.getattr(path).size
+            except FileNotFoundError:
+                # removed in the meantime, _sync_file() will notice
+                size = 0
+            if size >= SMALL_FILE_SIZE:
+                batches.append([path])
+                small_files = []
+                continue
+            if not small_files:
+                batches.append(small_files)
+            small_files.append(path)
+            if len(small_files) >= TRANSFER_BATCH_SIZE:
+                small_files = []
+        return batches
+
+    def _sync_batch(self, source_storage: StorageBackend, target_storage: StorageBackend,
+                    paths: List[PurePosixPath]):
+        """
+        Sync files at paths from source_storage to target_storage, taking a single transfer slot.
+        """
+        with self.scheduler.transfer():
+            for path in paths:
+                self._sync_file(source_storage, target_storage, path)
+
+    @staticmethod
+    def _file_token(storage: StorageBackend, path: PurePosixPath) -> Optional[str]:
+        """
+        Return the file token (see :meth:`StorageBackend.get_file_token`) of path, if available.
+        """
+        try:
+            return storage.get_file_token(path)
+        except (OptionalError, FileNotFoundError):
+            return None
+
     def _sync_file(self, source_storage: StorageBackend, target_storage: StorageBackend,
                    path: PurePosixPath):
         """
@@ -194,7 +434,7 @@ class NaiveSyncer(BaseSyncer):
         self._progress(FileEventType.MODIFY, path)
 
         try:
-            source_hash = source_storage.get_hash(path)
+            source_hash = self._get_hash(source_storage, path)
         except (FileNotFoundError, IsADirectoryError):
             # file deleted before we managed to get to it or someone quickly changed the file we
             # wanted to copy into a directory; abort, let the create directory event handle this
@@ -202,17 +442,21 @@ class NaiveSyncer(BaseSyncer):
                 del self.storage_hashes[source_storage][path]
             return
         old_source_hash = self.storage_hashes[source_storage].get(path)
-        self.storage_hashes[source_storage][path] = source_hash
 
         try:
-            target_hash = target_storage.get_hash(path)
+            target_hash = self._get_hash(target_storage, path)
         except FileNotFoundError:
             target_hash = None
         except IsADirectoryError:
             # Attempting to sync a file with a dir. This can never go well.
+            self.storage_hashes[source_storage][path] = source_hash
             self._handle_conflict(source_storage, target_storage, path)
             return
 
+        source_hash, target_hash = self._comparable_hashes(
+            source_storage, source_hash, target_storage, target_hash, path)
+        self.storage_hashes[source_storage][path] = source_hash
+
         old_target_hash = self.storage_hashes[target_storage].get(path)
 
         logger.debug("%s: file %s in source storage %s has hash %.10s, previous known "
@@ -220,8 +464,7 @@ class NaiveSyncer(BaseSyncer):
                      self.log_prefix, path, source_storage.backend_id, source_hash,
                      old_source_hash, target_storage.backend_id, target_hash, old_target_hash)
 
-        if old_target_hash and old_source_hash and \
-                old_target_hash != old_source_hash and target_hash is not None:
+        if _hashes_differ(old_target_hash, old_source_hash) and target_hash is not None:
             logger.warning("%s: known conflict on file %s in storages %s and %s "
                            "prevents syncing.",
                            self.log_prefix, path, source_storage.backend_id,
@@ -235,11 +478,14 @@ class NaiveSyncer(BaseSyncer):
                          target_storage.backend_id)
             return
 
-        if old_target_hash and target_hash and target_hash != old_target_hash:
+        if _hashes_differ(target_hash, old_target_hash):
             self._handle_conflict(source_storage, target_storage, path)
             return
 
         hasher = hashlib.sha256()
+        # update an existing file in place, writing only the blocks that changed
+        delta = bool(target_hash) and target_storage.RANGED_WRITES
+        write_flags = os.O_RDWR if delta else os.O_WRONLY
 
         if not target_hash:
             try:
@@ -256,10 +502,16 @@ class NaiveSyncer(BaseSyncer):
                 return
         else:
             try:
-                target_file_obj = target_storage.open_for_safe_replace(path, os.O_RDWR, target_hash)
+                if _is_native(target_hash):
+                    # open_for_safe_replace() needs the sha256 hash, which is not known here;
+                    # the native one has been checked against the last known hash above
+                    target_file_obj = target_storage.open(path, write_flags)
+                else:
+                    target_file_obj = target_storage.open_for_safe_replace(
+                        path, os.O_RDWR, target_hash)
             except OptionalError:
                 try:
-                    target_file_obj = target_storage.open(path, os.O_WRONLY)
+                    target_file_obj = target_storage.open(path, write_flags)
                 except OptionalError:
                     logger.warning("%s: cannot sync file %s to storage %s. "
                                    "Operation not supported by storage backend.",
@@ -270,19 +522,29 @@ class NaiveSyncer(BaseSyncer):
                                "cannot sync.", self.log_prefix, path, target_storage.backend_id)
                 return
 
+        # taken before reading the file, so that it does not match if the file changes meanwhile
+        source_token = self._file_token(source_storage, path)
+
         try:
-            with target_file_obj, source_storage.open(path, os.O_RDONLY) as source_file_obj:
-
-                target_file_obj.ftruncate(0)
-                offset = 0
-
-                while True:
-                    data = source_file_obj.read(BLOCK_SIZE, offset)
-                    if not data:
-                        break
-                    write_len = target_file_obj.write(data, offset)
-                    offset += write_len
-                    hasher.update(data[:write_len])
+            with self.scheduler.transfer(), target_file_obj, \
+                    source_storage.open(path, os.O_RDONLY) as source_file_obj:
+                if delta:
+                    written = self._copy_changed_blocks(source_file_obj, target_file_obj, hasher,
+                                                        partial(self._account, path))
+                    logger.debug("%s: updated file %s in storage %s, %d bytes written",
+                                 self.log_prefix, path, target_storage.backend_id, written)
+                else:
+                    target_file_obj.ftruncate(0)
+                    offset = 0
+
+                    while True:
+                        data = source_file_obj.read(BLOCK_SIZE, offset)
+                        if not data:
+                            break
+                        self._account(path, len(data))
+                        write_len = target_file_obj.write(data, offset)
+                        offset += write_len
+                        hasher.update(data[:write_len])
         except HashMismatchError:
             logger.warning("%s: unexpected hash for object %s in storage %s found, "
                            "cannot sync.", self.log_prefix, path, target_storage.backend_id)
@@ -293,6 +555,52 @@ class NaiveSyncer(BaseSyncer):
         self.storage_hashes[source_storage][path] = resulting_hash
         self.storage_hashes[target_storage][path] = resulting_hash
 
+        # Persist the hashes, so that a restarted sync (e.g. an interrupted one-shot sync) does
+        # not have to compute them again
+        checkpoint = [(source_storage, source_token),
+                      (target_storage, self._file_token(target_storage, path))]
+        for storage, token in checkpoint:
+            if token:
+                storage.store_hash(path, HashCache(resulting_hash, token))
+
+        if _is_native(source_hash):
+            # keep native hashes, so that later changes can be compared without reading files
+            target_native_hash = self._native_hash(target_storage, path)
+            if target_native_hash:
+                self.storage_hashes[source_storage][path] = source_hash
+                self.storage_hashes[target_storage][path] = target_native_hash
+
+    @staticmethod
+    def _copy_changed_blocks(source_file: File, target_file: File, hasher,
+                             account: Callable[[int], None]) -> int:
+        """
+        Make the content of target_file equal to source_file, comparing them block by block and
+        writing only the blocks that differ (and truncating the target if it is longer). Data
+        copied is fed to hasher, and the size of each block read to account. Returns the number
+        of bytes written.
+        """
+        target_size = target_file.fgetattr().size
+        offset = 0
+        written = 0
+
+        while True:
+            data = source_file.read(BLOCK_SIZE, offset)
+            if not data:
+                break
+            account(len(data))
+            if offset + len(data) <= target_size and \
+                    target_file.read(len(data), offset) == data:
+                write_len = len(data)
+            else:
+                write_len = target_file.write(data, offset)
+                written += write_len
+            offset += write_len
+            hasher.update(data[:write_len])
+
+        if target_size > offset:
+            target_file.ftruncate(offset)
+        return written
+
     def _sync_dir(self, source_storage: StorageBackend, target_storage: StorageBackend,
                   path: PurePosixPath):
         """
@@ -323,8 +631,8 @@ class NaiveSyncer(BaseSyncer):
             if is_dir:
                 storage.rmdir(path)
             else:
-                target_hash = storage.get_hash(path)
-                if target_hash != self.storage_hashes[storage][path]:
+                known_hash = self.storage_hashes[storage][path]
+                if self._current_hash(storage, path, known_hash) != known_hash:
                     logger.warning("%s: unexpected hash for object %s in storage %s "
                                    "found, not removing.", self.log_prefix, path,
                                    storage.backend_id)
@@ -386,7 +694,9 @@ class NaiveSyncer(BaseSyncer):
             self._remove_whole_dir(target_storage, path)
         else:
             try:
-                target_hash = target_storage.get_hash(path)
+                target_hash = self._current_hash(
+                    target_storage, path,
+                    old_source_hash or self.storage_hashes[target_storage].get(path))
             except FileNotFoundError:
                 self._already_removed(target_storage, path)
                 return
@@ -515,6 +825,9 @@ class NaiveSyncer(BaseSyncer):
             if attr.is_dir():
                 continue
 
-            if self.source_storage.get_hash(path) != self.target_storage.get_hash(path):
+            source_hash, target_hash = self._comparable_hashes(
+                self.source_storage, self._get_hash(self.source_storage, path),
+                self.target_storage, self._get_hash(self.target_storage, path), path)
+            if source_hash != target_hash:
                 yield SyncConflict(Path(path), self.source_storage.backend_id,
                                    self.target_storage.backend_id)
@@ -0,0 +1,44 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Micro-benchmarks of performance sensitive Wildland components.
+
+These are not collected by pytest; run each module directly, e.g.::
+
+    python -m wildland.tests.benchmarks.bench_hashdb
+"""
+
+import time
+
+
+def timed(label: str, count: int, func, *args) -> float:
+    """
+    Run ``func(*args)`` once, print the elapsed time, items (out of ``count``) per second and
+    the average time per item. Returns the elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<32} {elapsed:8.3f}s {count / elapsed:10.0f}/s '
+          f'{elapsed / count * 1e6:10.1f} us/item')
+    return elapsed
@@ -0,0 +1,93 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""
+ConflictResolver benchmark: ``getattr_extended`` latency with many mounted paths, with and without
+a storage being remounted between lookups.
+"""
+
+import argparse
+import random
+import stat
+from pathlib import PurePosixPath
+
+from wildland.conflict import ConflictResolver
+from wildland.storage_backends.base import Attr
+from wildland.tests.benchmarks import timed
+
+
+class _Resolver(ConflictResolver):
+    # pylint: disable=no-self-use
+
+    def storage_getattr(self, ident, relpath):
+        if relpath.parts:
+            return Attr(mode=stat.S_IFREG | 0o644)
+        return Attr(mode=stat.S_IFDIR | 0o755)
+
+    def storage_readdir(self, ident, relpath):
+        return []
+
+
+def main():
+    """
+    Mount the storages and time random lookups in them: twice with a stable mount table (cold,
+    then warm cache) and once with storages remounted in between.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mounts', type=int, default=10000, help='number of mounted paths')
+    parser.add_argument('--lookups', type=int, default=100000, help='number of getattr calls')
+    parser.add_argument('--files', type=int, default=5, help='files looked up in each storage')
+    parser.add_argument('--remount-every', type=int, default=100,
+                        help='remount a storage every N lookups (in the last run)')
+    args = parser.parse_args()
+
+    resolver = _Resolver()
+    mount_paths = []
+    for i in range(args.mounts):
+        mount_path = PurePosixPath(f'/users/user{i % 50}/containers/c{i}')
+        mount_paths.append(mount_path)
+        resolver.mount(mount_path, i)
+
+    rng = random.Random(0)
+    paths = [mount_paths[rng.randrange(args.mounts)] / f'file{rng.randrange(args.files)}'
+             for _ in range(args.lookups)]
+
+    def lookups():
+        for path in paths:
+            resolver.getattr_extended(path)
+
+    def lookups_with_remounts():
+        for i, path in enumerate(paths):
+            if i % args.remount_every == 0:
+                ident = rng.randrange(args.mounts)
+                resolver.unmount(mount_paths[ident], ident)
+                resolver.mount(mount_paths[ident], ident)
+            resolver.getattr_extended(path)
+
+    timed('cold cache', args.lookups, lookups)
+    timed('warm cache', args.lookups, lookups)
+    timed(f'remount every {args.remount_every}', args.lookups, lookups_with_remounts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Control socket benchmark: commands per second with a connection per command (the old
+WildlandFSClient behaviour), with a persistent connection (also shared by several threads) and
+with batched commands.
+
+With ``--framing``, compare the text protocol with length-prefixed frames (JSON and, if
+installed, msgpack) for an ``info`` response describing ``--storages`` storages.
+"""
+
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from wildland.control_client import ControlClient
+from wildland.control_server import ControlServer, control_command, frame_encodings
+from wildland.tests.benchmarks import timed
+
+
+class _Commands:
+    # pylint: disable=no-self-use
+
+    def __init__(self, storages: int):
+        self.storages = storages
+
+    @control_command('paths')
+    def control_paths(self, _handler):
+        """
+        A small payload, similar to the one of the ``paths`` command of the FUSE driver.
+        """
+        return {f'/path{i}': [i] for i in range(10)}
+
+    @control_command('info')
+    def control_info(self, _handler):
+        """
+        A payload shaped like the one of the ``info`` command of the FUSE driver.
+        """
+        return {
+            str(i): {
+                'paths': [f'/.backends/{i:08x}-container/{i:08x}-storage',
+                          f'/.users/0xuser/.uuid/{i:08x}-container',
+                          f'/forest/container{i}'],
+                'type': 'local',
+                'extra': {
+                    'tag': f'{i:08x}',
+                    'trusted_owner': None,
+                    'subcontainer_of': None,
+                    'hidden': False,
+                    'title': f'Container {i}',
+                    'categories': ['/bench/info', f'/bench/group{i % 10}'],
+                    'primary': True,
+                },
+            } for i in range(self.storages)
+        }
+
+
+def _bench_framing(socket_path: Path, commands: int):
+    def info(client: ControlClient):
+        for _ in range(commands):
+            client.run_command('info')
+
+    for encoding in ['text'] + frame_encodings():
+        client = ControlClient()
+        client.connect(socket_path)
+        if encoding != 'text':
+            client.set_framing(encoding)
+
+        try:
+            timed(f'info, {encoding}', commands, info, client)
+        finally:
+            client.disconnect()
+
+
+def main():
+    """
+    Start a control server and run the same command through each of the clients.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--commands', type=int, default=5000, help='number of commands to run')
+    parser.add_argument('--batch-size', type=int, default=50, help='commands per batch')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='client threads sharing the persistent connection')
+    parser.add_argument('--framing', action='store_true',
+                        help='compare protocol framings instead, using the info command')
+    parser.add_argument('--storages', type=int, default=5000,
+                        help='storages in the info response (with --framing)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        socket_path = Path(temp_dir) / 'bench.sock'
+        server = ControlServer()
+        server.register_commands(_Commands(args.storages))
+        server.start(socket_path)
+
+        if args.framing:
+            try:
+                _bench_framing(socket_path, args.commands)
+            finally:
+                server.stop()
+            return
+
+        def connection_per_command():
+            for _ in range(args.commands):
+                client = ControlClient()
+                client.connect(socket_path)
+                client.run_command('paths')
+                client.disconnect()
+
+        client = ControlClient()
+        client.connect(socket_path)
+
+        def persistent_connection():
+            for _ in range(args.commands):
+                client.run_command('paths')
+
+        def concurrent():
+            with ThreadPoolExecutor(max_workers=args.threads) as executor:
+                for _ in executor.map(lambda _: client.run_command('paths'),
+                                      range(args.commands)):
+                    pass
+
+        def batched():
+            for _ in range(args.commands // args.batch_size):
+                client.run_batch([('paths', {})] * args.batch_size)
+
+        try:
+            timed('connection per command', args.commands, connection_per_command)
+            timed('persistent connection', args.commands, persistent_connection)
+            timed(f'persistent connection, {args.threads} threads', args.commands, concurrent)
+            timed(f'batches of {args.batch_size}', args.commands, batched)
+        finally:
+            client.disconnect()
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
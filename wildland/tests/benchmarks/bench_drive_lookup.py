@@ -0,0 +1,127 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Google Drive benchmark: resolving paths through the Drive client cache tree, as the number of
+cached entries grows. Every lookup is a cache hit, so no Drive API is used. The full tree scan
+done before the (parent id, name) index is timed on a few lookups for comparison.
+
+Requires the Google Drive plugin.
+"""
+
+import argparse
+import random
+from pathlib import PurePosixPath
+from typing import List
+
+from wildland_googledrive.drive_client import DriveCacheTree, DriveClient
+from wildland.tests.benchmarks import timed
+
+CREDENTIALS = {
+    'token': None,
+    'refresh_token': None,
+    'token_uri': None,
+    'client_id': None,
+    'client_secret': None,
+    'scopes': None,
+}
+
+
+def build_tree(entries: int, fanout: int):
+    """
+    Build a cache tree of ``fanout`` folders per level, with ``fanout`` files in each folder of
+    the last level. Returns the tree and the paths of all files.
+    """
+    tree = DriveCacheTree()
+    tree.create_node('root', 'root')
+    folders = [(PurePosixPath('/'), 'root')]
+    paths: List[PurePosixPath] = []
+    while len(paths) < entries:
+        next_folders = []
+        for path, folder_id in folders:
+            for i in range(fanout):
+                if len(paths) >= entries:
+                    break
+                child_path = path / f'entry{i}'
+                tree.create_node(f'entry{i}', f'{folder_id}/{i}', parent=folder_id)
+                next_folders.append((child_path, f'{folder_id}/{i}'))
+                paths.append(child_path)
+        folders = next_folders
+    return tree, paths
+
+
+def indexed_lookups(client: DriveClient, paths: List[PurePosixPath]):
+    """
+    Resolve paths through the client, using the cache tree index.
+    """
+    for path in paths:
+        client._get_id_from_path(path)  # pylint: disable=protected-access
+
+
+def scan_lookups(tree, paths: List[PurePosixPath]):
+    """
+    Resolve paths by filtering the whole tree for each path component.
+    """
+    for path in paths:
+        scan_lookup(tree, path)
+
+
+def scan_lookup(tree, path: PurePosixPath):
+    """
+    Resolve a path by filtering the whole tree for each path component.
+    """
+    parent_id = tree.root
+    for part in path.parts[1:]:
+        parent_id = next(tree.filter_nodes(
+            lambda node, tag=part, parent=parent_id: (
+                node.tag == tag and node.predecessor(tree.identifier) == parent
+            ))).identifier
+    return parent_id
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='numbers of cached entries')
+    parser.add_argument('--fanout', type=int, default=50, help='entries per folder')
+    parser.add_argument('--lookups', type=int, default=100000, help='number of lookups')
+    parser.add_argument('--scan-lookups', type=int, default=10,
+                        help='number of lookups done with a full tree scan')
+    args = parser.parse_args()
+
+    for entries in args.entries:
+        tree, paths = build_tree(entries, args.fanout)
+        client = DriveClient(CREDENTIALS, tree)
+        deepest = [path for path in paths if len(path.parts) == len(paths[-1].parts)]
+        sample = random.choices(deepest, k=args.lookups)
+        print(f'{len(tree)} entries, lookups of paths {len(sample[0].parts) - 1} deep')
+
+        timed('indexed lookup', len(sample), indexed_lookups, client, sample)
+        timed('full tree scan', args.scan_lookups,
+              scan_lookups, tree, sample[:args.scan_lookups])
+
+
+if __name__ == '__main__':
+    main()
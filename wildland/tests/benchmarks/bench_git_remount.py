@@ -0,0 +1,115 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Git backend benchmark: mounting a local bare repository with many files, both with a fresh
+shallow clone with a checkout (as done on every mount before the clone was kept) and with the
+kept bare clone, first and then after the repository changed. Also lists all directories,
+without and with the tree cache.
+
+Requires the Git plugin and the git command.
+"""
+
+import argparse
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from git import Repo
+
+from wildland_git.git_client import GitClient
+from wildland.tests.benchmarks import timed
+
+FILES_PER_DIR = 1000
+
+
+def fast_import(repo: Path, files, message: str, parent: bool) -> None:
+    """
+    Commit given (path, content) pairs to the main branch of a bare repository.
+    """
+    lines = ['commit refs/heads/main',
+             'committer Bench <bench@example.com> 1600000000 +0000',
+             f'data {len(message)}', message]
+    if parent:
+        lines.append('from refs/heads/main^0')
+    for path, content in files:
+        lines.extend([f'M 100644 inline {path}', f'data {len(content)}', content])
+    subprocess.run(['git', 'fast-import', '--quiet'], cwd=repo, check=True,
+                   input=('\n'.join(lines) + '\n').encode())
+
+
+def old_mount(url: str, location: Path):
+    """
+    Remove the previous clone and clone again, with a checkout.
+    """
+    shutil.rmtree(location, ignore_errors=True)
+    Repo.clone_from(url=url, to_path=location, depth=1)
+
+
+def list_all(client: GitClient):
+    """
+    List all directories of the repository.
+    """
+    for directory in client.list_folder([]):
+        client.list_folder([directory.name])
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=100000, help='number of files')
+    parser.add_argument('--changed', type=int, default=10, help='files changed between mounts')
+    parser.add_argument('--dir', help='directory for the repositories (default: temporary)')
+    args = parser.parse_args()
+
+    base = Path(tempfile.mkdtemp(dir=args.dir))
+    try:
+        remote = base / 'remote.git'
+        subprocess.run(['git', 'init', '-q', '--bare', '-b', 'main', str(remote)], check=True)
+        fast_import(remote, ((f'd{i // FILES_PER_DIR:04}/f{i:06}', f'{i}')
+                             for i in range(args.files)), 'initial', parent=False)
+        url = f'file://{remote}'
+        print(f'{args.files} files')
+
+        timed('mount, fresh clone + checkout', args.files, old_mount, url, base / 'old')
+
+        client = GitClient(url, str(base / 'cache' / 'repo.git'), None, None)
+        timed('first mount, bare clone', args.files, client.connect)
+        client.disconnect()
+        timed('remount, unchanged', args.files, client.connect)
+        client.disconnect()
+        fast_import(remote, ((f'd0000/f{i:06}', f'changed {i}') for i in range(args.changed)),
+                    'change', parent=True)
+        timed(f'remount, {args.changed} files changed', args.files, client.connect)
+
+        timed('list all directories', args.files, list_all, client)
+        timed('list all directories, cached', args.files, list_all, client)
+        client.disconnect()
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    main()
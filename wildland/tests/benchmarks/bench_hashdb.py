@@ -0,0 +1,71 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+HashDb benchmark: per-call vs. batched hash storage and retrieval.
+"""
+
+import argparse
+import tempfile
+from pathlib import PurePosixPath
+
+from wildland.hashdb import HashDb, HashCache
+from wildland.tests.benchmarks import timed
+
+BACKEND_ID = 'bench-backend'
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--paths', type=int, default=100_000,
+                        help='number of synthetic paths in the hashes table')
+    parser.add_argument('--per-call', type=int, default=10_000,
+                        help='number of paths used for the (slow) per-call measurements')
+    args = parser.parse_args()
+
+    paths = [PurePosixPath(f'dir{i // 1000}/file{i}') for i in range(args.paths)]
+    hashes = [(path, HashCache(f'{i:064x}', str(i))) for i, path in enumerate(paths)]
+    sample = hashes[:args.per_call]
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        db = HashDb(PurePosixPath(base_dir))
+
+        def store_per_call():
+            for path, hash_cache in sample:
+                db.store_hash(BACKEND_ID, path, hash_cache)
+
+        def retrieve_per_call():
+            for path, _ in sample:
+                db.retrieve_hash(BACKEND_ID, path)
+
+        timed('store_hash (per call)', len(sample), store_per_call)
+        timed('store_hashes_bulk', len(hashes), db.store_hashes_bulk, BACKEND_ID, hashes)
+        timed('retrieve_hash (per call)', len(sample), retrieve_per_call)
+        timed('retrieve_hashes_bulk', len(paths), db.retrieve_hashes_bulk, BACKEND_ID, paths)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""
+Local storage watcher benchmark: cache hit rate of ``local-cached`` and ``local-dir-cached``
+storages read from while another thread keeps writing files, with the watcher invalidating only
+the changed paths, and (for comparison) clearing the whole cache on every batch of events.
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path, PurePosixPath
+
+from wildland.storage_backends.local_cached import LocalCachedStorageBackend, \
+    LocalDirectoryCachedStorageBackend
+
+
+def _make_tree(root: Path, dirs: int, files: int):
+    for i in range(dirs):
+        (root / f'dir{i}').mkdir()
+        for j in range(files):
+            (root / f'dir{i}/file{j}').write_bytes(b'x')
+
+
+def _run(backend_class, root: Path, args, full_clear: bool):
+    backend = backend_class(params={'location': str(root), 'type': backend_class.TYPE,
+                                    'backend-id': 'bench'})
+    backend.cache_timeout = 3600
+    if full_clear:
+        backend.invalidate_cache = lambda events: backend.clear_cache()
+
+    # count retrievals of file information, each one is a cache miss
+    misses = 0
+    info = 'info_all' if hasattr(backend, 'info_all') else 'info_dir'
+    original_info = getattr(backend, info)
+
+    def counted_info(*info_args):
+        nonlocal misses
+        misses += 1
+        return original_info(*info_args)
+
+    setattr(backend, info, counted_info)
+
+    backend.start_watcher(handler=lambda events: None)
+    stop = threading.Event()
+
+    def writer():
+        rnd = random.Random(1)
+        while not stop.is_set():
+            i = rnd.randrange(args.dirs)
+            (root / f'dir{i}/file{rnd.randrange(args.files)}').write_bytes(b'y' * rnd.randrange(64))
+            time.sleep(1 / args.write_rate)
+
+    writer_thread = threading.Thread(target=writer)
+    writer_thread.start()
+
+    rnd = random.Random(2)
+    reads = 0
+    end = time.perf_counter() + args.duration
+    try:
+        while time.perf_counter() < end:
+            backend.getattr(PurePosixPath(f'dir{rnd.randrange(args.dirs)}/'
+                                          f'file{rnd.randrange(args.files)}'))
+            reads += 1
+    finally:
+        stop.set()
+        writer_thread.join()
+        backend.stop_watcher()
+
+    mode = 'clear_cache' if full_clear else 'invalidate_cache'
+    print(f'{backend_class.TYPE:<18} {mode:<18} {reads:9} reads {misses:7} misses '
+          f'{100 * (reads - misses) / reads:7.2f}% hits {reads / args.duration:10.0f} reads/s')
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dirs', type=int, default=100, help='number of directories')
+    parser.add_argument('--files', type=int, default=100, help='files per directory')
+    parser.add_argument('--write-rate', type=float, default=50,
+                        help='file writes per second during the measurement')
+    parser.add_argument('--duration', type=float, default=5,
+                        help='duration (in seconds) of each measurement')
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix='wlbench.'))
+    try:
+        _make_tree(root, args.dirs, args.files)
+        for backend_class in (LocalCachedStorageBackend, LocalDirectoryCachedStorageBackend):
+            for full_clear in (True, False):
+                _run(backend_class, root, args, full_clear)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
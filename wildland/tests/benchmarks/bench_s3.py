@@ -0,0 +1,104 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""
+S3 backend benchmark: throughput of writing a large object through an S3File (multipart upload,
+parallel parts) and with a single ``put_object``, of reading it back through an S3File, and of
+a server-side rename.
+
+Runs against an in-process moto server by default, or a real S3 server given ``--endpoint-url``
+(for example a local MinIO, with an existing bucket). Requires the S3 plugin.
+"""
+
+import argparse
+import contextlib
+import os
+from pathlib import PurePosixPath
+
+from wildland_s3.backend import S3StorageBackend
+from wildland.tests.benchmarks import timed
+
+#: size of a single write, as done by FUSE
+WRITE_SIZE = 128 * 1024
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1024, help='object size in MiB')
+    parser.add_argument('--part-size', type=int, default=8, help='part size in MiB')
+    parser.add_argument('--endpoint-url', help='S3 server to use instead of moto')
+    parser.add_argument('--bucket', default='wlbench', help='bucket name')
+    parser.add_argument('--access-key', default='key')
+    parser.add_argument('--secret-key', default='secret')
+    args = parser.parse_args()
+
+    if args.endpoint_url:
+        mock: contextlib.AbstractContextManager = contextlib.nullcontext()
+    else:
+        import moto  # pylint: disable=import-outside-toplevel
+        mock = moto.mock_aws()
+
+    size = args.size * 1024 ** 2
+    chunk = os.urandom(WRITE_SIZE)
+
+    with mock:
+        backend = S3StorageBackend(params={
+            'type': 's3',
+            'backend-id': 'bench',
+            's3_url': f's3://{args.bucket}/',
+            'base_url': '/',
+            'endpoint_url': args.endpoint_url,
+            'credentials': {'access-key': args.access_key, 'secret-key': args.secret_key},
+            'part-size': args.part_size * 1024 ** 2,
+        })
+        if not args.endpoint_url:
+            backend.client.create_bucket(Bucket=args.bucket)
+
+        def write_file():
+            with backend.create(PurePosixPath('bench.bin'), os.O_CREAT | os.O_RDWR) as f:
+                for offset in range(0, size, WRITE_SIZE):
+                    f.write(chunk, offset)
+
+        def put_object():
+            # the old way: whole content in memory, uploaded in a single request
+            data = chunk * (size // WRITE_SIZE)
+            backend.client.put_object(Bucket=args.bucket, Key='bench-single.bin', Body=data)
+
+        def read_file():
+            with backend.open(PurePosixPath('bench.bin'), os.O_RDWR) as f:
+                f.read(1, 0)
+
+        mib = args.size
+        print(f'(per-item rates are per MiB, {mib} MiB object)')
+        timed('write (multipart)', mib, write_file)
+        timed('put_object (single request)', mib, put_object)
+        timed('read (ranged, parallel)', mib, read_file)
+        timed('rename (server-side copy)', mib, backend.rename,
+              PurePosixPath('bench.bin'), PurePosixPath('bench-renamed.bin'))
+
+
+if __name__ == '__main__':
+    main()
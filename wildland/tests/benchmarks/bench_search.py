@@ -0,0 +1,171 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Search benchmark: resolving a wildcard path (``:*:*:``) across a forest of bridged users, each
+with its own manifests catalog, sequentially and in parallel. Local storages stand in for remote
+ones, with a delay added to every listing and file open.
+
+The forest is built like the ``two_users_catalog`` fixture in ``test_search.py``, with more users
+and containers, and with all catalogs using a ``/*.yaml`` manifest pattern (like User3's there), so
+that a wildcard finds every bridge and container.
+"""
+
+import argparse
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path, PurePosixPath
+
+from wildland.cli import cli_main
+from wildland.client import Client
+from wildland.search import Search
+from wildland.storage_backends.base import StorageBackend
+from wildland.storage_backends.local import LocalStorageBackend
+from wildland.utils import yaml_parser
+from wildland.wlpath import WildlandPath
+from . import timed
+
+BACKEND_ID = '00000000-0000-0000-000000000000'
+
+
+def _delayed_local(delay: float):
+    class DelayedLocalStorageBackend(LocalStorageBackend):
+        """
+        Local storage with a fixed latency added to listings and opening files.
+        """
+
+        def get_children(self, client=None, query_path=None, paths_only=False):
+            time.sleep(delay)
+            return super().get_children(client, query_path, paths_only)
+
+        def open(self, path, flags):
+            time.sleep(delay)
+            return super().open(path, flags)
+
+    return DelayedLocalStorageBackend
+
+
+def _build_forest(base_dir: Path, users: int, containers: int):
+    (base_dir / 'wildland').mkdir()
+    with open(base_dir / 'config.yaml', 'w', encoding='utf-8') as f:
+        yaml_parser.dump({'mount-dir': str(base_dir / 'wildland'), 'dummy': True}, f)
+
+    def cli(*args):
+        cli_main.main.main(args=['--base-dir', str(base_dir), *map(str, args)],
+                           prog_name='wl', standalone_mode=False)
+
+    def container(owner, name, paths, location, files, c_args=(), s_args=()):
+        cli('container', 'create', name, '--owner', owner, *[f'--path={p}' for p in paths],
+            '--no-encrypt-manifest', '--no-publish', *c_args)
+        cli('storage', 'create', 'local', '--container', name, '--location', location,
+            '--no-publish', *s_args)
+        manifest_path = base_dir / 'containers' / f'{name}.container.yaml'
+        manifest = re.sub(r"backend-id: .*\n", f"backend-id: '{BACKEND_ID}'\n",
+                          manifest_path.read_text(encoding='utf-8'))
+        manifest_path.write_text(manifest, encoding='utf-8')
+        location.mkdir(parents=True, exist_ok=True)
+        with open(location / '.wildland-owners', 'a', encoding='utf-8') as f:
+            f.write(owner + '\n')
+        for filename, content in files.items():
+            (location / filename).parent.mkdir(parents=True, exist_ok=True)
+            (location / filename).write_text(content, encoding='utf-8')
+        return manifest
+
+    cli('user', 'create', 'KnownUser', '--key', '0xaaa')
+    for i in range(users):
+        cli('user', 'create', f'User{i}', '--key', f'0x{0xb00 + i:x}')
+    (base_dir / 'manifests').mkdir()
+
+    for i in range(users):
+        owner = f'0x{0xb00 + i:x}'
+        files = {}
+        for j in range(containers):
+            uuid = f'00000000-{i:04}-{j + 1:04}-0000-000000000000'
+            manifest = container(owner, f'user{i}-c{j}', [f'/containers/c{j}', f'/.uuid/{uuid}'],
+                                 base_dir / f'storage-{i}-{j}', {'file.txt': f'{i}/{j}'})
+            files[f'c{j}.container.yaml'] = manifest
+        manifest = container(owner, f'user{i}-catalog',
+                             ['/.catalog', f'/.uuid/00000000-{i:04}-0000-0000-000000000000'],
+                             base_dir / f'catalog-{i}', files,
+                             s_args=('--manifest-pattern', '/*.yaml'))
+        entry_path = base_dir / f'manifests/user{i}-catalog.container.yaml'
+        entry_path.write_text(manifest, encoding='utf-8')
+        cli('user', 'modify', f'User{i}', '--add-catalog-entry', f'file://{entry_path}')
+
+    container('0xaaa', 'catalog-known',
+              ['/.catalog', '/.uuid/00000000-1111-0000-0000-000000000000'],
+              base_dir / 'catalog-known', {},
+              c_args=('--update-user',),
+              s_args=('--manifest-pattern', '/*.yaml'))
+
+    for i in range(users):
+        shutil.move(base_dir / f'users/User{i}.user.yaml',
+                    base_dir / f'manifests/user{i}.user.yaml')
+        cli('bridge', 'create', '--owner', 'KnownUser', '--path', f'/users/User{i}',
+            '--target-user-location', f'file://{base_dir}/manifests/user{i}.user.yaml', f'User{i}')
+        shutil.move(base_dir / f'bridges/User{i}.bridge.yaml',
+                    base_dir / f'catalog-known/User{i}.bridge.yaml')
+
+    for path in (base_dir / 'containers').glob('user*.container.yaml'):
+        path.unlink()
+
+
+def main():
+    """
+    Build the forest in a temporary directory, then resolve the path with ``workers=0`` (serial)
+    and with ``--workers`` threads, and check that both return the same containers.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=8, help='number of bridged users')
+    parser.add_argument('--containers', type=int, default=8, help='containers per user')
+    parser.add_argument('--delay', type=float, default=0.02,
+                        help='delay (in seconds) of each storage listing and file open')
+    parser.add_argument('--workers', type=int, default=8, help='threads in parallel mode')
+    parser.add_argument('--path', default=':*:*:', help='Wildland path to resolve')
+    args = parser.parse_args()
+
+    base_dir = Path(tempfile.mkdtemp(prefix='wlbench.'))
+    try:
+        _build_forest(base_dir, args.users, args.containers)
+
+        StorageBackend.types()['local'] = _delayed_local(args.delay)
+        StorageBackend._cache.clear()  # pylint: disable=protected-access
+        client = Client(base_dir=PurePosixPath(base_dir))
+        wlpath = WildlandPath.from_str(args.path)
+
+        results = {}
+        for workers in (0, args.workers):
+            Search.clear_cache()
+            search = Search(client, wlpath, aliases={'default': '0xaaa'}, workers=workers)
+            found: list = []
+            timed(f'resolve, workers={workers}', args.users * args.containers,
+                  lambda s=search, f=found: f.extend(s.read_container()))
+            results[workers] = found
+        assert results[0] == results[args.workers], 'parallel results differ'
+    finally:
+        shutil.rmtree(base_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""
+Buffered file benchmark: peak memory (RSS) and time of writing a large file sequentially through
+FullBufferedFile (whole content in memory) and SpooledBufferedFile (content in a temporary file).
+Each variant runs in a separate process, so that the peaks do not mix.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+from wildland.storage_backends.base import Attr
+from wildland.storage_backends.buffered import FullBufferedFile, SpooledBufferedFile
+
+#: size of a single write, as done by FUSE
+WRITE_SIZE = 128 * 1024
+
+
+class _NullFullFile(FullBufferedFile):
+    def read_full(self) -> bytes:
+        return b''
+
+    def write_full(self, data: bytes) -> int:
+        return len(data)
+
+
+class _NullSpooledFile(SpooledBufferedFile):
+    def read_full_into(self, stream) -> None:
+        pass
+
+    def write_full_from(self, stream, size: int) -> int:
+        while stream.read(1024 ** 2):
+            pass
+        return size
+
+
+def _write(file_class, size: int, queue):
+    data = b'x' * WRITE_SIZE
+    start = time.perf_counter()
+    f = file_class(Attr.file())
+    for offset in range(0, size, WRITE_SIZE):
+        f.write(data, offset)
+    f.release(0)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1024,
+                        help='file size in MiB')
+    args = parser.parse_args()
+    size = args.size * 1024 ** 2
+
+    for file_class in (_NullSpooledFile, _NullFullFile):
+        queue: multiprocessing.Queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_write, args=(file_class, size, queue))
+        process.start()
+        elapsed, max_rss = queue.get()
+        process.join()
+        name = file_class.__mro__[1].__name__
+        print(f'{name:<24} {elapsed:8.3f}s {args.size / elapsed:8.0f} MiB/s '
+              f'peak RSS {max_rss / 1024:8.0f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""
+Sync delta benchmark: bytes written and wall time of syncing a large file to a local storage
+after a small part of it changed, copying the whole file and updating only the changed blocks.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path, PurePosixPath
+
+from wildland.storage_backends.local import LocalStorageBackend
+from wildland.storage_sync.naive_sync import NaiveSyncer
+
+#: size of writes used to create the test file
+CHUNK_SIZE = 16 * 1024 ** 2
+
+
+def _make_file(path: Path, size: int):
+    chunk = os.urandom(CHUNK_SIZE)
+    with open(path, 'wb') as f:
+        for offset in range(0, size, CHUNK_SIZE):
+            # make every chunk different
+            f.write(offset.to_bytes(8, 'little') + chunk[8:size - offset])
+
+
+def _modify_file(path: Path, size: int, percent: float, regions: int):
+    rnd = random.Random(1)
+    region_size = int(size * percent / 100 / regions)
+    with open(path, 'r+b') as f:
+        for _ in range(regions):
+            f.seek(rnd.randrange(size - region_size))
+            f.write(os.urandom(region_size))
+
+
+def _backend(root: Path, name: str) -> LocalStorageBackend:
+    return LocalStorageBackend(params={'location': str(root / name), 'type': 'local',
+                                       'backend-id': name})
+
+
+def _run(root: Path, size: int, delta: bool):
+    source = _backend(root, 'source')
+    target = _backend(root, 'target')
+    target.RANGED_WRITES = delta
+
+    # count the bytes written to the target
+    written = 0
+    original_open = target.open
+
+    def counted_open(*args):
+        nonlocal written
+        obj = original_open(*args)
+        original_write = obj.write
+
+        def counted_write(data, offset):
+            nonlocal written
+            written += len(data)
+            return original_write(data, offset)
+
+        obj.write = counted_write
+        return obj
+
+    target.open = counted_open  # type: ignore
+
+    syncer = NaiveSyncer(source, target, 'bench')
+    syncer.storage_hashes = {source: {}, target: {}}
+
+    start = time.perf_counter()
+    syncer._sync_file(source, target, PurePosixPath('file'))  # pylint: disable=protected-access
+    elapsed = time.perf_counter() - start
+
+    assert (root / 'target/file').stat().st_size == size
+    mode = 'changed blocks' if delta else 'full copy'
+    print(f'{mode:<16} {elapsed:8.3f}s {written / 1024 ** 2:10.1f} MiB written')
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=5120, help='file size in MiB')
+    parser.add_argument('--percent', type=float, default=1,
+                        help='percentage of the file that is changed')
+    parser.add_argument('--regions', type=int, default=16,
+                        help='number of (contiguous) changed regions')
+    parser.add_argument('--dir', help='directory for the test files (default: system temp)')
+    args = parser.parse_args()
+    size = args.size * 1024 ** 2
+
+    root = Path(tempfile.mkdtemp(prefix='wlbench.', dir=args.dir))
+    try:
+        (root / 'source').mkdir()
+        (root / 'target').mkdir()
+        _make_file(root / 'source/file', size)
+        shutil.copyfile(root / 'source/file', root / 'original')
+        _modify_file(root / 'source/file', size, args.percent, args.regions)
+
+        for delta in (False, True):
+            shutil.copyfile(root / 'original', root / 'target/file')
+            _run(root, size, delta)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# Wildland Project
+#
+# Copyright (C) 2022 Golem Foundation
+#
+# Authors:
+#                    Wildland Project <contact@wildland.io>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+"""
+Local storage watcher benchmark on a large tree: time to add watches on all directories
+(50,000 by default), and events lost when new directories are filled right after being created.
+
+Each directory needs an inotify watch, so ``fs.inotify.max_user_watches`` has to be larger than
+the number of directories.
+"""
+
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path, PurePosixPath
+from typing import Set
+
+from wildland.storage_backends.local import LocalStorageBackend, LocalStorageWatcher
+from wildland.storage_backends.watch import FileEventType
+from wildland.tests.benchmarks import timed
+
+
+def _make_tree(root: Path, dirs: int, fanout: int):
+    for i in range(dirs):
+        path = root / f'd{i // fanout}' / f'd{i}' if i >= fanout else root / f'd{i}'
+        path.mkdir()
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dirs', type=int, default=50_000, help='directories in the tree')
+    parser.add_argument('--fanout', type=int, default=500,
+                        help='top-level directories (each holding the same share of the rest)')
+    parser.add_argument('--new-dirs', type=int, default=200,
+                        help='directories created (with files) while watching')
+    parser.add_argument('--files', type=int, default=10, help='files in each new directory')
+    args = parser.parse_args()
+
+    limit = Path('/proc/sys/fs/inotify/max_user_watches')
+    if limit.exists() and int(limit.read_text(encoding='utf-8')) <= args.dirs:
+        print(f'warning: {limit} is not larger than --dirs, some watches will fail')
+
+    root = Path(tempfile.mkdtemp(prefix='wlbench.'))
+    try:
+        timed('create tree', args.dirs, _make_tree, root, args.dirs, args.fanout)
+
+        backend = LocalStorageBackend(params={'location': str(root), 'type': 'local',
+                                              'backend-id': 'bench'})
+        watcher = LocalStorageWatcher(backend)
+        timed('add watches', args.dirs, watcher.init)
+
+        received: Set[PurePosixPath] = set()
+        received_lock = threading.Lock()
+
+        def handler(events):
+            with received_lock:
+                received.update(event.path for event in events
+                                if event.type == FileEventType.CREATE)
+
+        watcher.handler = handler
+        watcher.thread.start()
+
+        expected: Set[PurePosixPath] = set()
+        for i in range(args.new_dirs):
+            new_dir = PurePosixPath(f'new{i}/sub')
+            (root / new_dir).mkdir(parents=True)
+            expected.update((new_dir.parent, new_dir))
+            for j in range(args.files):
+                (root / new_dir / f'file{j}').write_bytes(b'x')
+                expected.add(new_dir / f'file{j}')
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            with received_lock:
+                if expected <= received:
+                    break
+            time.sleep(0.1)
+        watcher.stop()
+
+        lost = len(expected - received)
+        print(f'{"lost events":<32} {lost:8} of {len(expected)}')
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -265,6 +265,9 @@ class TestControlClient:
     def disconnect(self):
         pass
 
+    def set_framing(self, encoding=None):
+        return encoding or 'json'
+
     def run_command(self, name, **kwargs):
         assert name in self.results, f'unexpected command: {name}'
         self.calls[name] = kwargs
@@ -273,6 +276,19 @@ class TestControlClient:
             raise self.results[name]
         return self.results[name]
 
+    def run_batch(self, commands):
+        results = []
+        error = None
+        for name, args in commands:
+            try:
+                results.append(self.run_command(name, **args))
+            except Exception as e:  # pylint: disable=broad-except
+                error = error or e
+                results.append(None)
+        if error:
+            raise error
+        return results
+
     def iter_events(self):
         while self.events:
             event = self.events.pop(0)
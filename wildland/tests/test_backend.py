@@ -19,25 +19,32 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
-
+# pylint: disable=missing-docstring,redefined-outer-name,unused-argument,too-many-lines
 # pylint: disable=missing-docstring,redefined-outer-name,unused-argument
 
+import errno
+import gc
 import os
+import shutil
 import io
 import sqlite3
+import threading
 import time
-from typing import Callable, Dict, Iterable, List, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 from pathlib import PurePosixPath, Path
 from unittest.mock import patch
 from dataclasses import dataclass
 
 import pytest
 
+from ..hashdb import HashDb, HashCache
 from ..storage_backends.local import LocalStorageBackend
 from ..storage_backends.local_cached import LocalCachedStorageBackend, \
     LocalDirectoryCachedStorageBackend
-from ..storage_backends.base import StorageBackend, verify_local_access, OptionalError
-from ..storage_backends.watch import FileEvent, FileEventType
+from ..storage_backends.base import StorageBackend, verify_local_access, OptionalError, Attr
+from ..storage_backends.cached import CachedStorageMixin, DirectoryCachedStorageMixin
+from ..storage_backends.watch import FileEvent, FileEventType, SimpleFileWatcher
 
 
 @pytest.fixture(params=[LocalStorageBackend, LocalCachedStorageBackend,
@@ -182,6 +189,140 @@ def test_watcher_ignore_own(tmpdir, storage_backend, cleanup):
     assert received_events == [FileEvent(FileEventType.CREATE, PurePosixPath('anotherdir'))]
 
 
+def test_watcher_new_dir_contents(tmp_path, cleanup):
+    backend, storage_dir = make_storage(tmp_path, LocalStorageBackend)
+
+    received_events: List[FileEvent] = []
+    backend.start_watcher(handler=received_events.extend)
+    cleanup(backend.stop_watcher)
+
+    # created before the watcher gets to watch the new directories
+    os.makedirs(storage_dir / 'a/b/c')
+    (storage_dir / 'a/b/c/file').write_text('file', encoding='utf-8')
+    time.sleep(1)
+
+    created = [event.path for event in received_events if event.type == FileEventType.CREATE]
+    assert sorted(created) == [PurePosixPath('a'), PurePosixPath('a/b'), PurePosixPath('a/b/c'),
+                               PurePosixPath('a/b/c/file')]
+
+
+def test_watcher_moved_dir(tmp_path, cleanup):
+    backend, storage_dir = make_storage(tmp_path, LocalStorageBackend)
+    os.makedirs(storage_dir / 'x/y')
+
+    received_events: List[FileEvent] = []
+    watcher = backend.start_watcher(handler=received_events.extend)
+    cleanup(backend.stop_watcher)
+
+    os.rename(storage_dir / 'x', storage_dir / 'z')
+    time.sleep(1)
+    assert received_events == [FileEvent(FileEventType.DELETE, PurePosixPath('x')),
+                               FileEvent(FileEventType.CREATE, PurePosixPath('z'))]
+    assert sorted(watcher.watch_paths) == [str(storage_dir), str(storage_dir / 'z'),
+                                           str(storage_dir / 'z/y')]
+    received_events.clear()
+
+    (storage_dir / 'z/y/file').write_text('file', encoding='utf-8')
+    time.sleep(1)
+    assert FileEvent(FileEventType.CREATE, PurePosixPath('z/y/file')) in received_events
+    received_events.clear()
+
+    shutil.rmtree(storage_dir / 'z')
+    time.sleep(1)
+    assert received_events[-1] == FileEvent(FileEventType.DELETE, PurePosixPath('z'))
+    assert list(watcher.watch_paths) == [str(storage_dir)]
+    assert sorted(watcher.watches.values()) == [str(storage_dir)]
+    assert watcher.watch_children == {}
+
+
+class _TreeBackend:
+    """
+    A storage with files in memory, and a token for each directory.
+    """
+
+    def __init__(self):
+        self.files: Dict[PurePosixPath, Attr] = {}
+        self.tokens: Dict[PurePosixPath, str] = {}
+        self.readdir_calls: List[PurePosixPath] = []
+
+    def set(self, path, attr):
+        if attr is None:
+            for file_path in list(self.files):
+                if file_path == path or path in file_path.parents:
+                    del self.files[file_path]
+        else:
+            self.files[path] = attr
+        self.tokens[path.parent] = str(time.monotonic())
+
+    def readdir(self, path):
+        self.readdir_calls.append(path)
+        return [file_path.name for file_path in self.files if file_path.parent == path]
+
+    def getattr(self, path):
+        return self.files[path]
+
+    def get_dir_token(self, path):
+        return self.tokens.get(path)
+
+    def clear_cache(self):
+        pass
+
+
+def test_simple_file_watcher():
+    backend = _TreeBackend()
+    backend.set(PurePosixPath('a'), Attr.dir())
+    backend.set(PurePosixPath('a/b'), Attr.dir())
+    backend.set(PurePosixPath('a/b/file'), Attr.file(size=1))
+    backend.set(PurePosixPath('c'), Attr.dir())
+    backend.set(PurePosixPath('c/file'), Attr.file(size=1))
+
+    watcher = SimpleFileWatcher(backend, interval=0)
+    watcher.init()
+    assert watcher.info == backend.files
+
+    # nothing changed, directories are not listed again
+    backend.readdir_calls.clear()
+    assert watcher.wait() is None
+    assert not backend.readdir_calls
+
+    backend.set(PurePosixPath('a/b/file'), Attr.file(size=2))
+    backend.set(PurePosixPath('a/b/new'), Attr.file(size=3))
+    backend.set(PurePosixPath('c'), None)
+    assert sorted(watcher.wait(), key=lambda event: (str(event.path), str(event.type))) == [
+        FileEvent(FileEventType.MODIFY, PurePosixPath('a/b/file')),
+        FileEvent(FileEventType.CREATE, PurePosixPath('a/b/new')),
+        FileEvent(FileEventType.DELETE, PurePosixPath('c')),
+        FileEvent(FileEventType.DELETE, PurePosixPath('c/file')),
+    ]
+    assert sorted(backend.readdir_calls) == [PurePosixPath('.'), PurePosixPath('a/b')]
+    assert watcher.info == backend.files
+    watcher.shutdown()
+
+
+def test_simple_file_watcher_no_tokens():
+    backend = _TreeBackend()
+    backend.set(PurePosixPath('a'), Attr.dir())
+    backend.set(PurePosixPath('a/file'), Attr.file(size=1))
+    backend.get_dir_token = lambda path: None
+
+    watcher = SimpleFileWatcher(backend, interval=0)
+    watcher.init()
+
+    # without tokens, everything is listed every time
+    backend.readdir_calls.clear()
+    assert watcher.wait() is None
+    assert sorted(backend.readdir_calls) == [PurePosixPath('.'), PurePosixPath('a')]
+
+    backend.set(PurePosixPath('a'), Attr.file(size=5))
+    assert sorted(watcher.wait(), key=lambda event: (str(event.path), str(event.type))) == [
+        FileEvent(FileEventType.CREATE, PurePosixPath('a')),
+        FileEvent(FileEventType.DELETE, PurePosixPath('a')),
+        FileEvent(FileEventType.DELETE, PurePosixPath('a/file')),
+    ]
+    assert watcher.info == {PurePosixPath('a'): Attr.file(size=5)}
+    watcher.shutdown()
+
+
 def test_hashing_short(tmpdir, storage_backend):
     backend, storage_dir = make_storage(tmpdir, storage_backend)
 
@@ -279,6 +420,39 @@ def test_hashing_db(tmpdir, storage_backend):
     assert hash_value == '81cc5b17018674b401b42f35ba07bb79e211239c23bffe658da1577e3e646877'
 
 
+def test_hashing_db_bulk(tmpdir, storage_backend):
+    backend, storage_dir = make_storage(tmpdir, storage_backend)
+
+    backend.set_config_dir(tmpdir)
+
+    with open(storage_dir / 'testfile1', mode='w') as f:
+        f.write('aaaa')
+    with open(storage_dir / 'testfile2', mode='w') as f:
+        f.write('bbbb')
+
+    time.sleep(1)
+
+    paths = [PurePosixPath('testfile1'), PurePosixPath('testfile2')]
+    assert backend.get_hashes(paths) == {
+        PurePosixPath('testfile1'):
+            '61be55a8e2f6b4e172338bddf184d6dbee29c98853e0a0485ecee7f27b9af0b4',
+        PurePosixPath('testfile2'):
+            '81cc5b17018674b401b42f35ba07bb79e211239c23bffe658da1577e3e646877',
+    }
+
+    stored = backend.hash_db.retrieve_hashes_bulk(backend.backend_id, paths + ['missing'])
+    assert set(stored) == {'testfile1', 'testfile2'}
+    assert stored['testfile1'].hash == \
+           '61be55a8e2f6b4e172338bddf184d6dbee29c98853e0a0485ecee7f27b9af0b4'
+
+    # a fresh backend should take cached hashes from the db instead of reading the files
+    backend2 = storage_backend(params=backend.params)
+    backend2.set_config_dir(tmpdir)
+    with patch('hashlib.sha256'):
+        assert backend2.get_hashes(paths)[PurePosixPath('testfile2')] == \
+               '81cc5b17018674b401b42f35ba07bb79e211239c23bffe658da1577e3e646877'
+
+
 def test_walk(tmpdir, storage_backend):
     backend, storage_dir = make_storage(tmpdir, storage_backend)
 
@@ -665,3 +839,268 @@ def test_local_dir_cached(tmpdir):
 
     backend.readdir(PurePosixPath('dir/subdir2/subdir22'))
     assert backend.dir_expiry[PurePosixPath('dir/subdir2/subdir22')] > time.time()
+
+
+class _InfoAllMixin:
+    # pylint: disable=no-member
+
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.files: Dict[PurePosixPath, Attr] = {}
+        self.changes: List[Tuple[PurePosixPath, Optional[Attr]]] = []
+        self.info_all_calls = 0
+        self.retrieving = threading.Event()
+        self.unblock = threading.Event()
+        self.unblock.set()
+
+    def _wait(self):
+        self.retrieving.set()
+        assert self.unblock.wait(10)
+
+    def info_all(self):
+        self.info_all_calls += 1
+        files = dict(self.files)
+        self._wait()
+        return files.items()
+
+    def info_changes(self, token):
+        current = len(self.changes)
+        if token is None:
+            return None, current
+        changes = self.changes[token:]
+        self._wait()
+        return changes, current
+
+
+class _TestCachedBackend(_InfoAllMixin, CachedStorageMixin):
+    BACKGROUND_REFRESH = True
+
+
+def _wait_for_refresh(backend):
+    thread = backend._refresh_thread  # pylint: disable=protected-access
+    if thread is not None:
+        thread.join(10)
+
+
+def test_cached_background_refresh():
+    backend = _TestCachedBackend()
+    backend.files[PurePosixPath('a')] = Attr.file(size=1)
+
+    # the first refresh is synchronous
+    assert backend.readdir(PurePosixPath('.')) == ['a']
+    assert backend.info_all_calls == 1
+
+    backend.files[PurePosixPath('b')] = Attr.file(size=2)
+    backend.retrieving.clear()
+    backend.unblock.clear()
+    backend.expiry = 1.
+    backend.change_token = None
+
+    # expired cache is still served while the refresh runs
+    assert backend.readdir(PurePosixPath('.')) == ['a']
+    assert backend.retrieving.wait(10)
+    assert backend.readdir(PurePosixPath('.')) == ['a']
+
+    backend.unblock.set()
+    _wait_for_refresh(backend)
+    assert backend.readdir(PurePosixPath('.')) == ['a', 'b']
+    assert backend.getattr(PurePosixPath('b')).size == 2
+
+
+def test_cached_refresh_changes():
+    backend = _TestCachedBackend()
+    backend.files[PurePosixPath('dir/a')] = Attr.file(size=1)
+    backend.files[PurePosixPath('dir/b')] = Attr.file(size=1)
+    assert backend.readdir(PurePosixPath('dir')) == ['a', 'b']
+
+    backend.changes.append((PurePosixPath('dir/a'), None))
+    backend.changes.append((PurePosixPath('dir/c'), Attr.file(size=3)))
+    backend.expiry = 1.
+    backend.readdir(PurePosixPath('dir'))
+    _wait_for_refresh(backend)
+
+    # applied incrementally, without listing all the files again
+    assert backend.info_all_calls == 1
+    assert backend.readdir(PurePosixPath('dir')) == ['b', 'c']
+    with pytest.raises(FileNotFoundError):
+        backend.getattr(PurePosixPath('dir/a'))
+    assert backend.change_token == 2
+
+
+def test_cached_refresh_update_during_refresh():
+    backend = _TestCachedBackend()
+    backend.files[PurePosixPath('a')] = Attr.file(size=1)
+    backend.readdir(PurePosixPath('.'))
+
+    backend.retrieving.clear()
+    backend.unblock.clear()
+    backend.expiry = 1.
+    backend.change_token = None
+    backend.readdir(PurePosixPath('.'))
+    assert backend.retrieving.wait(10)
+
+    # written after the listing was retrieved, has to survive the refresh
+    backend.update_cache(PurePosixPath('new'), Attr.file(size=5))
+    backend.unblock.set()
+    _wait_for_refresh(backend)
+
+    assert backend.readdir(PurePosixPath('.')) == ['a', 'new']
+
+
+def test_cached_refresh_clear_cache():
+    backend = _TestCachedBackend()
+    backend.files[PurePosixPath('a')] = Attr.file(size=1)
+    backend.readdir(PurePosixPath('.'))
+
+    backend.retrieving.clear()
+    backend.unblock.clear()
+    backend.expiry = 1.
+    backend.change_token = None
+    backend.readdir(PurePosixPath('.'))
+    assert backend.retrieving.wait(10)
+    thread = backend._refresh_thread  # pylint: disable=protected-access
+
+    backend.clear_cache()
+    del backend.files[PurePosixPath('a')]
+    backend.unblock.set()
+    thread.join(10)
+
+    # the outdated refresh result is discarded
+    assert backend.readdir(PurePosixPath('.')) == []
+
+
+class _TestDirectoryCachedBackend(DirectoryCachedStorageMixin):
+    def __init__(self, **kwds):
+        super().__init__(**kwds)
+        self.dirs: Dict[PurePosixPath, List[str]] = {}
+        self.info_dir_calls: List[PurePosixPath] = []
+
+    def info_dir(self, path):
+        self.info_dir_calls.append(path)
+        if path not in self.dirs:
+            raise FileNotFoundError(errno.ENOENT, str(path))
+        for name in self.dirs[path]:
+            attr = Attr.dir() if path / name in self.dirs else Attr.file(size=len(name))
+            yield path / name, attr
+
+
+def test_dir_cached_index():
+    backend = _TestDirectoryCachedBackend()
+    backend.cache_timeout = 60
+    backend.dirs[PurePosixPath('.')] = ['dir', 'b', 'a']
+    backend.dirs[PurePosixPath('dir')] = ['x']
+
+    assert backend.readdir(PurePosixPath('.')) == ['a', 'b', 'dir']
+    assert backend.readdir(PurePosixPath('dir')) == ['x']
+    assert backend.getattr(PurePosixPath('dir/x')).size == 1
+
+    backend.update_cache(PurePosixPath('c'), Attr.file(size=3))
+    backend.update_cache(PurePosixPath('a'), None)
+    assert backend.readdir(PurePosixPath('.')) == ['b', 'c', 'dir']
+    assert backend.getattr(PurePosixPath('c')).size == 3
+    with pytest.raises(FileNotFoundError):
+        backend.getattr(PurePosixPath('a'))
+
+    # only the given directory is dropped
+    backend.invalidate_dir_cache(PurePosixPath('dir'))
+    assert backend.readdir_cache == {PurePosixPath('.'): {'b', 'c', 'dir'}}
+    assert backend.info_dir_calls == [PurePosixPath('.'), PurePosixPath('dir')]
+
+    with pytest.raises(FileNotFoundError):
+        backend.readdir(PurePosixPath('missing'))
+    assert PurePosixPath('missing') in backend.dir_expiry
+
+
+def test_dir_cached_eviction():
+    backend = _TestDirectoryCachedBackend()
+    backend.cache_timeout = 60
+    backend.cache_max_entries = 8
+    for i in range(3):
+        backend.dirs[PurePosixPath(f'dir{i}')] = ['a', 'b', 'c']
+
+    backend.readdir(PurePosixPath('dir0'))
+    backend.readdir(PurePosixPath('dir1'))
+    backend.getattr(PurePosixPath('dir0/a'))
+    backend.readdir(PurePosixPath('dir2'))
+
+    # dir1 was the least recently used
+    assert sorted(backend.readdir_cache) == [PurePosixPath('dir0'), PurePosixPath('dir2')]
+
+    backend.info_dir_calls.clear()
+    backend.readdir(PurePosixPath('dir0'))
+    assert not backend.info_dir_calls
+    backend.readdir(PurePosixPath('dir1'))
+    assert backend.info_dir_calls == [PurePosixPath('dir1')]
+
+
+def test_dir_cached_invalidate():
+    backend = _TestDirectoryCachedBackend()
+    backend.cache_timeout = 60
+    backend.dirs[PurePosixPath('.')] = ['a', 'b']
+    backend.dirs[PurePosixPath('a')] = ['x', 'sub']
+    backend.dirs[PurePosixPath('a/sub')] = ['y']
+    backend.dirs[PurePosixPath('b')] = ['z']
+    for path in backend.dirs:
+        backend.readdir(path)
+
+    backend.dirs[PurePosixPath('b')].append('w')
+    backend.invalidate_cache([FileEvent(FileEventType.CREATE, PurePosixPath('b/w'))])
+    assert sorted(backend.readdir_cache) == [PurePosixPath('.'), PurePosixPath('a'),
+                                             PurePosixPath('a/sub')]
+    assert backend.readdir(PurePosixPath('b')) == ['w', 'z']
+
+    # everything under a removed directory is dropped as well
+    del backend.dirs[PurePosixPath('a/sub')]
+    del backend.dirs[PurePosixPath('a')]
+    backend.dirs[PurePosixPath('.')].remove('a')
+    backend.invalidate_cache([FileEvent(FileEventType.DELETE, PurePosixPath('a'))])
+    assert sorted(backend.readdir_cache) == [PurePosixPath('b')]
+    assert backend.readdir(PurePosixPath('.')) == ['b']
+
+
+def test_local_cached_watcher_invalidate(tmp_path, cleanup):
+    backend, storage_dir = make_storage(tmp_path, LocalCachedStorageBackend)
+    backend.cache_timeout = 60
+    os.mkdir(storage_dir / 'dir')
+    (storage_dir / 'dir/a').write_text('a', encoding='utf-8')
+    (storage_dir / 'other').write_text('other', encoding='utf-8')
+
+    assert backend.readdir(PurePosixPath('dir')) == ['a']
+    backend.start_watcher(handler=lambda events: None)
+    cleanup(backend.stop_watcher)
+
+    with patch.object(backend, 'info_all', wraps=backend.info_all) as info_all:
+        (storage_dir / 'dir/b').write_text('bbb', encoding='utf-8')
+        (storage_dir / 'dir/a').unlink()
+        os.mkdir(storage_dir / 'moved')
+        (storage_dir / 'moved/c').write_text('c', encoding='utf-8')
+        os.rename(storage_dir / 'moved', storage_dir / 'dir/moved')
+        time.sleep(1)
+
+        assert backend.readdir(PurePosixPath('dir')) == ['b', 'moved']
+        assert backend.getattr(PurePosixPath('dir/b')).size == 3
+        assert backend.readdir(PurePosixPath('dir/moved')) == ['c']
+        assert backend.readdir(PurePosixPath('.')) == ['dir', 'other']
+        info_all.assert_not_called()
+
+
+def test_hashing_db_thread_connections(tmp_path):
+    db = HashDb(PurePosixPath(tmp_path))
+    db.store_hash('backend', 'path', HashCache('hash', 'token'))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: db.retrieve_hash('backend', 'path'), range(20)))
+    assert results == [HashCache('hash', 'token')] * 20
+
+    # connections of finished threads are closed
+    gc.collect()
+    assert len(db._connections) == 1  # pylint: disable=protected-access
+
+    # including ones opened by another thread
+    thread = threading.Thread(target=db.retrieve_hash, args=('backend', 'path'))
+    thread.start()
+    db.close()
+    thread.join()
+    db.close()
+    assert not db._connections  # pylint: disable=protected-access
+    assert db.retrieve_hash('backend', 'path') == HashCache('hash', 'token')
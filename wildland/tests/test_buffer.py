@@ -24,10 +24,16 @@
 # pylint: disable=missing-docstring,redefined-outer-name,unused-argument
 
 """
-Tests for Buffer class
+Tests for Buffer, PagedFile and SpooledBufferedFile classes
 """
 
-from ..storage_backends.buffered import Buffer
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..storage_backends.base import Attr
+from ..storage_backends.buffered import Buffer, PagedFile, SpooledBufferedFile
 
 def test_get_needed_range():
     buf = Buffer(size=11, page_size=2, max_pages=10)
@@ -79,3 +85,192 @@ def test_set_read_trim():
     assert buf.read(5, 3) == b'defgh'
     assert len(buf.pages) == 2
     assert 2 not in buf.pages
+
+
+def test_trim_least_recently_used():
+    buf = Buffer(size=16, page_size=4, max_pages=2)
+    buf.set_read(b'abcd', 4, 0)
+    buf.set_read(b'efgh', 4, 4)
+    assert buf.read(1, 0) == b'a'
+
+    buf.set_read(b'ijkl', 4, 8)
+    assert buf.read(1, 8) == b'i'
+    assert sorted(buf.pages) == [0, 2]
+
+
+class CountingPagedFile(PagedFile):
+    page_size = 4
+    max_pages = 8
+    max_readahead_pages = 2
+
+    def __init__(self, data: bytes, delay: float = 0):
+        super().__init__(Attr.file(size=len(data)))
+        self.data = data
+        self.delay = delay
+        self.ranges = []
+        self.ranges_lock = threading.Lock()
+
+    def read_range(self, length, start):
+        with self.ranges_lock:
+            self.ranges.append((length, start))
+        time.sleep(self.delay)
+        return self.data[start:start+length]
+
+
+def test_paged_file_concurrent_reads():
+    data = bytes(range(32))
+    f = CountingPagedFile(data, delay=0.1)
+    f.max_readahead_pages = 0
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: f.read(4, (i % 4) * 4), range(16)))
+
+    assert results == [data[(i % 4) * 4:(i % 4) * 4 + 4] for i in range(16)]
+    # every page loaded once, in parallel
+    assert sorted(f.ranges) == [(4, 0), (4, 4), (4, 8), (4, 12)]
+
+
+def test_paged_file_readahead():
+    data = bytes(range(32))
+    f = CountingPagedFile(data)
+
+    assert f.read(2, 0) == data[0:2]
+    assert f.ranges == [(4, 0)]
+
+    # sequential read, next page is loaded in the background
+    assert f.read(2, 2) == data[2:4]
+    for event in list(f.loading.values()):
+        event.wait()
+    assert sorted(f.ranges) == [(4, 0), (4, 4)]
+
+    assert f.read(4, 4) == data[4:8]
+    for event in list(f.loading.values()):
+        event.wait()
+    assert sorted(f.ranges) == [(4, 0), (4, 4), (4, 8), (4, 12)]
+
+    # random access resets the window
+    assert f.read(4, 28) == data[28:32]
+    assert f.read(4, 20) == data[20:24]
+    assert sorted(f.ranges) == [(4, 0), (4, 4), (4, 8), (4, 12), (4, 20), (4, 28)]
+
+
+def test_trim_keeps_pinned_pages():
+    buf = Buffer(size=16, page_size=4, max_pages=1)
+    buf.pin([0])
+    buf.set_read(b'abcd', 4, 0)
+    buf.set_read(b'efgh', 4, 4)
+    buf.trim()
+    assert sorted(buf.pages) == [0]
+
+    # page 1 is gone, page 0 can be read even though the buffer is over the limit
+    buf.set_read(b'ijkl', 4, 8)
+    buf.trim()
+    assert buf.read(1, 0) == b'a'
+    assert sorted(buf.pages) == [0]
+
+    buf.unpin([0])
+    buf.set_read(b'mnop', 4, 12)
+    buf.trim()
+    assert sorted(buf.pages) == [3]
+
+
+def test_paged_file_concurrent_reads_small_buffer():
+    # every read evicts the pages of other readers
+    data = bytes(range(64))
+    f = CountingPagedFile(data, delay=0.01)
+    f.max_pages = 1
+    f.buf.max_pages = 1
+    f.max_readahead_pages = 0
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: f.read(8, (i % 8) * 8), range(32)))
+
+    assert results == [data[(i % 8) * 8:(i % 8) * 8 + 8] for i in range(32)]
+
+
+def test_paged_file_release_cancels_readahead():
+    data = bytes(range(32))
+    f = CountingPagedFile(data)
+
+    # keep the read-ahead workers busy, so that the job is still queued on release
+    unblock = threading.Event()
+    executor = PagedFile.readahead_executor()
+    blockers = [executor.submit(unblock.wait, 10) for _ in range(PagedFile.readahead_workers)]
+    try:
+        assert f.read(2, 0) == data[0:2]
+        assert f.read(2, 2) == data[2:4]
+        jobs = list(f.readahead_jobs.values())
+        assert jobs
+
+        f.release(0)
+        assert all(job.cancelled() for job in jobs)
+    finally:
+        unblock.set()
+        for blocker in blockers:
+            blocker.result()
+
+    assert f.ranges == [(4, 0)]
+
+
+class BytesSpooledFile(SpooledBufferedFile):
+    SPOOL_MAX_MEMORY = 16
+
+    def __init__(self, content: bytes):
+        super().__init__(Attr.file(size=len(content)))
+        self.content = content
+        self.chunk_sizes = []
+
+    def read_full_into(self, stream):
+        stream.write(self.content)
+
+    def write_full_from(self, stream, size):
+        chunks = []
+        while chunk := stream.read(8):
+            self.chunk_sizes.append(len(chunk))
+            chunks.append(chunk)
+        self.content = b''.join(chunks)
+        assert len(self.content) == size
+        return size
+
+
+def test_spooled_file():
+    f = BytesSpooledFile(b'0123456789')
+    assert f.read(4, 2) == b'2345'
+    assert f.read(None, 8) == b'89'
+    assert f.read(4, 20) == b''
+
+    f.write(b'abc', 8)
+    assert f.fgetattr().size == 11
+    f.write(b'xyz', 14)
+    assert f.read() == b'01234567abc\0\0\0xyz'
+
+    f.flush()
+    assert f.content == b'01234567abc\0\0\0xyz'
+    # streamed in chunks
+    assert f.chunk_sizes == [8, 8, 1]
+
+    f.ftruncate(5)
+    f.release(0)
+    assert f.content == b'01234'
+    assert f.spool is None
+
+
+def test_spooled_file_spills_to_disk():
+    f = BytesSpooledFile(b'')
+    f.write(b'a' * 10, 0)
+    # pylint: disable=protected-access
+    assert isinstance(f.spool._file, io.BytesIO)
+    f.write(b'b' * 10, 10)
+    assert not isinstance(f.spool._file, io.BytesIO)
+    assert f.read() == b'a' * 10 + b'b' * 10
+    f.release(0)
+    assert f.content == b'a' * 10 + b'b' * 10
+
+
+def test_spooled_file_truncate_unloaded():
+    f = BytesSpooledFile(b'0123456789')
+    f.read_full_into = None  # must not be loaded
+    f.ftruncate(0)
+    f.write(b'new', 0)
+    f.release(0)
+    assert f.content == b'new'
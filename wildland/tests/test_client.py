@@ -23,12 +23,15 @@
 # pylint: disable=missing-docstring,redefined-outer-name,protected-access
 
 import tempfile
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
 
 import pytest
 
 from wildland.wildland_object.wildland_object import WildlandObject
 from ..client import Client
+from ..manifest.manifest import Manifest
+from ..manifest.manifest_cache import ManifestCache
 from ..manifest.sig import DummySigContext
 from ..container import Container, _StorageCache
 from ..storage import Storage
@@ -160,3 +163,71 @@ def test_unquote_local_path(client, owner):
     local_url = 'file:///Users/Jan%20Kowalski/whatever'
     path = client.parse_file_url(local_url, owner)
     assert str(path) == '/Users/Jan Kowalski/whatever'
+
+
+def test_manifest_cache(client, owner, sig, monkeypatch):
+    container = Container(owner=owner, paths=[PurePosixPath('/path1')], backends=[],
+                          client=client)
+    cont_path = client.save_new_object(WildlandObject.Type.CONTAINER, container, 'container')
+
+    from_bytes = Manifest.from_bytes
+    loaded_paths = []
+
+    def counting_from_bytes(data, *args, **kwargs):
+        loaded_paths.append(kwargs.get('local_path'))
+        return from_bytes(data, *args, **kwargs)
+
+    monkeypatch.setattr(Manifest, 'from_bytes', counting_from_bytes)
+
+    def load_paths():
+        return [c.paths for c in client.load_all(WildlandObject.Type.CONTAINER)]
+
+    assert load_paths() == [container.paths]
+    assert loaded_paths == [cont_path]
+
+    # unchanged file, verified manifest is taken from the cache
+    assert load_paths() == [container.paths]
+    assert loaded_paths == [cont_path]
+
+    # modified file
+    container.paths.append(PurePosixPath('/path2'))
+    client.save_object(WildlandObject.Type.CONTAINER, container)
+    assert load_paths() == [container.paths]
+    assert loaded_paths == [cont_path, cont_path]
+    assert load_paths() == [container.paths]
+    assert loaded_paths == [cont_path, cont_path]
+
+    # changed keys
+    _, pubkey = sig.generate()
+    sig.add_pubkey(pubkey)
+    assert load_paths() == [container.paths]
+    assert loaded_paths == [cont_path, cont_path, cont_path]
+
+
+def test_manifest_cache_db(base_dir, owner, sig):
+    cache = ManifestCache(base_dir)
+    manifest = Manifest.from_fields({'object': 'test', 'owner': owner, 'version': '1'})
+    manifest.encrypt_and_sign(sig, encrypt=False)
+    data = manifest.to_bytes()
+    path = base_dir / 'test.yaml'
+    path.write_bytes(data)
+
+    cache.store(path, data, sig, '', manifest)
+    cached = cache.load(path, data, sig, '')
+    assert cached is not None and cached.fields == manifest.fields
+
+    # fields are stored decrypted, so the files are private
+    for db_file in base_dir.glob('manifest-cache.db*'):
+        assert db_file.stat().st_mode & 0o777 == 0o600
+
+    # JSON would turn the key into a string
+    manifest.fields['extra'] = {1: 'one'}
+    cache.store(path, data, sig, 'int-keys', manifest)
+    assert cache.load(path, data, sig, 'int-keys') is None
+
+    # connections of other threads can be closed from here
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(cache.load, path, data, sig, '').result()
+        cache.close()
+        assert executor.submit(cache.load, path, data, sig, '').result() is not None
+    cache.close()
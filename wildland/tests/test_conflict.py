@@ -336,3 +336,60 @@ def test_readdir_merged_writable():
         Resolved(ident=1, relpath=PurePosixPath('dir3'))
 
     assert fs.getattr_extended(PurePosixPath('/mount1/mount2'))[1] is None
+
+
+def test_resolve_cache_invalidation():
+    fs = FSTest(
+        (PurePosixPath('/mount1'), {
+            'dir1': {
+                'file1': None,
+            },
+        }),
+        (PurePosixPath('/mount1/dir1'), {
+            'file2': None,
+        }),
+        (PurePosixPath('/mount2'), {
+            'file3': None,
+        }),
+    )
+
+    assert fs.dir('/mount1/dir1') == ['file1', 'file2']
+    assert fs.mode('/mount2/file3') == stat.S_IFREG | 0o644
+    assert fs.resolve_cache.get(PurePosixPath('/mount2/file3')) is not None
+
+    # only paths under the mount path are invalidated
+    fs.unmount(PurePosixPath('/mount1/dir1'), 1)
+    assert fs.resolve_cache.get(PurePosixPath('/mount1/dir1')) is None
+    assert fs.resolve_cache.get(PurePosixPath('/mount2/file3')) is not None
+    assert fs.dir('/mount1/dir1') == ['file1']
+    with pytest.raises(FileNotFoundError):
+        fs.mode('/mount1/dir1/file2')
+
+    fs.mount(PurePosixPath('/mount1/dir1'), 1)
+    assert fs.dir('/mount1/dir1') == ['file1', 'file2']
+    assert fs.mode('/mount1/dir1/file2') == stat.S_IFREG | 0o644
+
+    fs.unmount(PurePosixPath('/mount2'), 2)
+    with pytest.raises(FileNotFoundError):
+        fs.mode('/mount2/file3')
+    assert fs.dir('/') == ['mount1']
+
+
+def test_mount_dir_prefix_lookup():
+    fs = FSTest(
+        (PurePosixPath('/mount1'), {}),
+        (PurePosixPath('/mount1/dir1/dir2'), {}),
+        (PurePosixPath('/mount2'), {}),
+    )
+
+    assert fs.root.find(PurePosixPath('/mount1/dir1')) is not None
+    assert fs.root.find(PurePosixPath('/mount1/other')) is None
+    assert sorted(fs.root.mounts_under(PurePosixPath('/mount1'))) == [
+        (PurePosixPath('/mount1'), 0),
+        (PurePosixPath('/mount1/dir1/dir2'), 1),
+    ]
+    assert list(fs.root.mounts_under(PurePosixPath('/mount3'))) == []
+    assert list(fs.root.resolve(PurePosixPath('/mount1/dir1/dir2/file'))) == [
+        Resolved(ident=0, relpath=PurePosixPath('dir1/dir2/file')),
+        Resolved(ident=1, relpath=PurePosixPath('file')),
+    ]
@@ -23,19 +23,27 @@
 
 # pylint: disable=missing-docstring,redefined-outer-name, unused-argument
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import tempfile
 import socket
+import threading
 import json
 
 import pytest
 
-from ..control_server import ControlServer, control_command
+from ..control_server import ControlServer, control_command, encode_frame, decode_frame, \
+    read_frame, FRAME_HEADER
 from ..control_client import ControlClient, ControlClientError
+from ..fs_client import WildlandFSClient
 
 
 class TestObj:
     # pylint: disable=no-self-use
+    __test__ = False  # not a test class
+
+    def __init__(self):
+        self.unblocked = threading.Event()
 
     @control_command('hello')
     def control_hello(self, handler):
@@ -54,6 +62,15 @@ class TestObj:
         handler.send_event('this is event')
         return 'this is result'
 
+    @control_command('block')
+    def control_block(self, handler):
+        return self.unblocked.wait(timeout=10)
+
+    @control_command('unblock')
+    def control_unblock(self, handler):
+        self.unblocked.set()
+        return 'unblocked'
+
 
 @pytest.fixture
 def temp_dir():
@@ -176,3 +193,131 @@ def test_control_client(client: ControlClient):
 def test_control_client_error(client: ControlClient):
     with pytest.raises(ControlClientError, match='ValueError: boom'):
         client.run_command('boom')
+
+
+def test_server_batch(conn):
+    conn.sendall(json.dumps({'cmd': 'batch', 'id': 5, 'args': {'commands': [
+        {'cmd': 'hello'},
+        {'cmd': 'boom'},
+        {'cmd': 'test-args', 'args': {'test-arg': 123}},
+    ]}}).encode())
+    conn.sendall(b'\n\n')
+
+    response = json.loads(conn.recv(4096))
+    assert response['id'] == 5
+    hello, boom, test_args = response['result']
+    assert hello == {'result': 'hello world'}
+    assert boom['error']['class'] == 'ValueError'
+    assert test_args == {'result': 123}
+
+
+def test_control_client_batch(client: ControlClient):
+    assert client.run_batch([('hello', {}), ('test-args', {'test_arg': 123})]) == \
+           ['hello world', 123]
+
+    with pytest.raises(ControlClientError, match='boom: ValueError: boom'):
+        client.run_batch([('boom', {}), ('hello', {})])
+
+
+def test_control_client_threads(client: ControlClient):
+    def run(i):
+        return [client.run_command('test-args', test_arg=i * 100 + j) for j in range(20)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(run, range(8)))
+
+    assert results == [[i * 100 + j for j in range(20)] for i in range(8)]
+
+
+def test_control_client_concurrent_commands(client: ControlClient):
+    # 'block' waits for 'unblock', sent later on the same connection
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        blocked = executor.submit(client.run_command, 'block')
+        assert client.run_command('unblock') == 'unblocked'
+        assert blocked.result(timeout=10) is True
+
+
+def test_fs_client_reconnect(server, socket_path, temp_dir):
+    fs_client = WildlandFSClient(None, temp_dir, socket_path)
+    assert fs_client.run_control_command('hello') == 'hello world'
+    connection = fs_client._control_client  # pylint: disable=protected-access
+    assert fs_client.run_control_command('test-args', test_arg=1) == 1
+    assert fs_client._control_client is connection  # pylint: disable=protected-access
+
+    # restart the server, the old connection is now broken
+    server.stop()
+    server.start(socket_path)
+
+    assert fs_client.run_control_command('hello') == 'hello world'
+    assert fs_client.run_control_batch([('hello', {})]) == ['hello world']
+
+
+def test_server_framing(conn):
+    conn.sendall(json.dumps({'cmd': 'set-framing', 'args': {'encoding': 'xml'}}).encode())
+    conn.sendall(b'\n\n')
+
+    # unsupported encoding, still using text protocol
+    response = json.loads(conn.recv(1024))
+    assert response['error']['desc'] == 'unsupported encoding: xml'
+
+    conn.sendall(json.dumps({'cmd': 'set-framing', 'args': {'encoding': 'json'}}).encode())
+    conn.sendall(b'\n\n')
+
+    connfile = conn.makefile('rb')
+    lines = []
+    for line in connfile:
+        lines.append(line)
+        if line == b'\n':
+            break
+    assert json.loads(b''.join(lines)) == {'result': {'encoding': 'json'}}
+
+    conn.sendall(encode_frame({'cmd': 'send-event', 'id': 1}, 'json'))
+    assert decode_frame(read_frame(connfile), 'json') == {'event': 'this is event'}
+    assert decode_frame(read_frame(connfile), 'json') == {'result': 'this is result', 'id': 1}
+
+    conn.sendall(encode_frame({'cmd': 'test-args', 'args': {'test-arg': 'x' * 100000}}, 'json'))
+    assert decode_frame(read_frame(connfile), 'json') == {'result': 'x' * 100000}
+
+
+def test_server_framing_too_large(conn):
+    conn.sendall(json.dumps({'cmd': 'set-framing', 'args': {'encoding': 'json'}}).encode())
+    conn.sendall(b'\n\n')
+    connfile = conn.makefile('rb')
+    for line in connfile:
+        if line == b'\n':
+            break
+
+    # only the header, announcing a 4 GiB payload
+    conn.sendall(FRAME_HEADER.pack(0xffffffff))
+    response = decode_frame(read_frame(connfile), 'json')
+    assert response['error']['class'] == 'ControlRequestError'
+    assert 'frame too large' in response['error']['desc']
+    # the server closes the connection
+    assert read_frame(connfile) is None
+
+
+@pytest.mark.parametrize('encoding', ['json', 'msgpack'])
+def test_control_client_framing(client: ControlClient, encoding):
+    if encoding == 'msgpack':
+        pytest.importorskip('msgpack')
+
+    assert client.set_framing(encoding) == encoding
+
+    assert client.run_command('hello') == 'hello world'
+    assert client.run_command('send-event') == 'this is result'
+    assert client.wait_for_events() == ['this is event']
+    assert client.run_batch([('hello', {}), ('test-args', {'test_arg': [1, 2]})]) == \
+           ['hello world', [1, 2]]
+    with pytest.raises(ControlClientError, match='ValueError: boom'):
+        client.run_command('boom')
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(
+            lambda i: client.run_command('test-args', test_arg=i), range(50)))
+    assert results == list(range(50))
+
+
+def test_control_client_framing_unsupported(client: ControlClient):
+    with pytest.raises(ControlClientError, match='unsupported encoding: xml'):
+        client.set_framing('xml')
+    assert client.run_command('hello') == 'hello world'
@@ -324,3 +324,29 @@ def test_backwards_compatibility(cli, old_container, data_dir, base_dir):
         '2010/05/07/.manifest.wildland.yaml',
         '2010/05/07/file1',
     ]
+
+
+def test_timeline_subcontainers_batches(base_dir, container, data_dir, monkeypatch):
+    for i, day in enumerate([3, 4, 5]):
+        (data_dir / f'dir{i}').mkdir()
+        (data_dir / f'dir{i}/file').write_text(f'file {i}')
+        timestamp = int(datetime(2010, 5, day, 10, 30).timestamp())
+        os.utime(data_dir / f'dir{i}/file', (timestamp, timestamp))
+
+    batches = []
+    preverify_links = Client._preverify_links  # pylint: disable=protected-access
+
+    def recording_preverify_links(self, subcontainers):
+        batches.append(len(subcontainers))
+        preverify_links(self, subcontainers)
+
+    monkeypatch.setattr(Client, '_preverify_links', recording_preverify_links)
+    client = Client(base_dir)
+    container = client.load_object_from_name(WildlandObject.Type.CONTAINER, container)
+
+    # the first subcontainer is available before the others are read
+    subcontainers = client.all_subcontainers(container)
+    assert next(subcontainers)
+    assert batches == [1]
+    assert len(list(subcontainers)) == 2
+    assert batches == [1, 2]
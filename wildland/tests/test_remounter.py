@@ -631,6 +631,10 @@ class SearchMock:
         self.wlpaths = []
         # return value for get_watch_params
         self.watch_params = ()
+        # pattern -> container uuids, filled by get_watch_params
+        self.pattern_sources = {}
+        # the patched Search class
+        self.cls = None
         # list of results on subsequent calls
         self.containers_results: List[List[Container]] = []
 
@@ -654,11 +658,13 @@ def search_mock():
     test_search = SearchMock()
     with mock.patch('wildland.remounter.Search') as search_mock:
         search_mock.return_value = test_search
+        test_search.cls = search_mock
         yield test_search
 
 
 def test_wlpath_single(cli, client, search_mock, control_client):
     search_mock.watch_params = ([], {'/.manifests/Container1.container.yaml'})
+    search_mock.pattern_sources = {'/.manifests/Container1.container.yaml': {'catalog-uuid'}}
 
     c1 = client.load_object_from_name(WildlandObject.Type.CONTAINER, 'Container1')
 
@@ -710,6 +716,9 @@ def test_wlpath_single(cli, client, search_mock, control_client):
     assert control_client.calls['add-watch'] == {
         'storage_id': 0,
         'pattern': 'Container1.container.yaml'}
+    # resolve results listed from the watched catalog are dropped before each re-evaluation
+    assert search_mock.cls.invalidate_container.call_args_list == [
+        mock.call('catalog-uuid'), mock.call('catalog-uuid')]
 
 
 def test_wlpath_delete_container(client, search_mock, control_client):
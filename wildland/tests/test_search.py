@@ -27,6 +27,8 @@ import os
 import re
 import uuid
 import shutil
+import threading
+import time
 from functools import partial
 from unittest import mock
 
@@ -39,7 +41,7 @@ from ..storage_backends.local import LocalStorageBackend
 from ..storage_backends.generated import GeneratedStorageMixin, FuncFileEntry, FuncDirEntry
 from ..storage_backends.file_children import FileChildrenMixin
 from ..wlpath import WildlandPath, PathError
-from ..search import Search
+from ..search import Search, ResolveCache
 from ..config import Config
 from ..utils import yaml_parser
 from ..exc import WildlandError
@@ -1179,6 +1181,146 @@ def test_get_watch_params_wildcard_pattern_path(control_client, client2):
     assert sorted(patterns) == expected_patterns_re
 
 
+def test_get_watch_params_pattern_sources(control_client, client2):
+    control_client.expect('status', {})
+    search = Search(client2,
+        WildlandPath.from_str(':/users/User2:/containers/c1:'),
+        aliases={'default': '0xaaa'},
+        fs_client=client2.fs_client)
+
+    control_client.expect('paths', {})
+
+    _, patterns = search.get_watch_params()
+    assert set(search.pattern_sources) == patterns
+    sources = {str(pattern).split('/')[4]: uuids
+               for pattern, uuids in search.pattern_sources.items()}
+    assert sources == {
+        '00000000-1111-0000-0000-000000000000': {'00000000-1111-0000-0000-000000000000'},
+        '00000000-2222-0000-0000-000000000000': {'00000000-2222-0000-0000-000000000000'},
+    }
+
+
+@pytest.mark.parametrize('path', [
+    ':/users/User2:/containers/c1:',
+    ':/users/User2:*:',
+    ':/users/User3:*:',
+    ':*:',
+])
+def test_resolve_parallel(client2, path):
+    wlpath = WildlandPath.from_str(path)
+    sequential = list(Search(client2, wlpath, aliases={'default': '0xaaa'}).resolve_raw())
+    assert sequential
+    Search.clear_cache()
+
+    listing_threads = set()
+    original_get_children = LocalStorageBackend.get_children
+
+    def get_children(*args, **kwargs):
+        listing_threads.add(threading.current_thread().name)
+        return original_get_children(*args, **kwargs)
+
+    search = Search(client2, wlpath, aliases={'default': '0xaaa'}, workers=4)
+    with mock.patch('wildland.storage_backends.local.LocalStorageBackend.get_children',
+                    side_effect=get_children, autospec=True):
+        parallel = list(search.resolve_raw())
+    assert parallel == sequential
+    # containers were listed by the worker threads, not by the caller
+    assert listing_threads
+    assert all(name.startswith('search-') for name in listing_threads)
+
+    # cached now
+    search = Search(client2, wlpath, aliases={'default': '0xaaa'}, workers=4)
+    with mock.patch('wildland.storage_backends.local.LocalStorageBackend.get_children') \
+            as get_children:
+        assert list(search.resolve_raw()) == sequential
+        get_children.assert_not_called()
+
+
+def test_read_file_parallel(client2):
+    search = Search(client2,
+                    WildlandPath.from_str(':/users/User2:/containers/c1:/test1.txt'),
+                    aliases={'default': '0xaaa'}, workers=2)
+    assert search.read_file() == b'test1'
+
+
+def test_resolve_cache():
+    cache = ResolveCache(maxsize=2, ttl=10)
+    key1 = ('0xaaa', PurePosixPath('/a'))
+    key2 = ('0xaaa', PurePosixPath('/b'))
+    key3 = ('0xaaa', PurePosixPath('/c'))
+
+    cache.put(key1, {1}, ['c1'])
+    cache.put(key2, {2}, ['c1', 'c2'])
+    assert cache.get(key1) == {1}
+
+    # key2 is the least recently used one
+    cache.put(key3, {3}, ['c2'])
+    assert cache.get(key2) is None
+    assert len(cache) == 2
+
+    assert cache.invalidate('c2') == 1
+    assert cache.get(key3) is None
+    assert cache.get(key1) == {1}
+    assert cache.invalidate('c2') == 0
+
+    with mock.patch('time.monotonic', return_value=time.monotonic() + 11):
+        assert cache.get(key1) is None
+    assert len(cache) == 0
+    assert cache.invalidate('c1') == 0
+
+    cache.put(key1, {1}, ['c1'])
+    cache.put(key2, {2}, ['c2'])
+    cache.configure(maxsize=1, ttl=10)
+    assert len(cache) == 1
+    assert cache.get(key2) == {2}
+
+
+def test_search_cache_hit_keeps_expiry(client):
+    wlpath = WildlandPath.from_str(':/path:/other/path:')
+    now = time.monotonic()
+    search = Search(client, wlpath, aliases={'default': '0xaaa'})
+    assert len(list(search.read_container())) == 1
+
+    # a cache hit does not store the entry again, so it still expires on time
+    with mock.patch('time.monotonic', return_value=now + 200):
+        search = Search(client, wlpath, aliases={'default': '0xaaa'})
+        with mock.patch.object(client, 'load_all') as load_all:
+            assert len(list(search.read_container())) == 1
+            load_all.assert_not_called()
+
+    with mock.patch('time.monotonic', return_value=now + 350):
+        search = Search(client, wlpath, aliases={'default': '0xaaa'})
+        with mock.patch.object(client, 'load_all', wraps=client.load_all) as load_all:
+            assert len(list(search.read_container())) == 1
+            load_all.assert_called()
+
+
+def test_search_cache_config(client):
+    client.config.override(override_fields={'search-cache-size': 10, 'search-cache-ttl': 5})
+    Search(client, WildlandPath.from_str(':/path:'), aliases={'default': '0xaaa'})
+    # pylint: disable=protected-access
+    assert (Search._resolve_cache.maxsize, Search._resolve_cache.ttl) == (10, 5)
+
+
+def test_search_cache_invalidate_container(base_dir, client):
+    wlpath = WildlandPath.from_str(':/path:/other/path:')
+    search = Search(client, wlpath, aliases={'default': '0xaaa'})
+    assert len(list(search.read_container())) == 1
+
+    # the result is cached, and the local manifests are not even loaded
+    (base_dir / 'storage1/other/path.container.yaml').unlink()
+    (base_dir / 'containers/Container2.container.yaml').unlink()
+    search = Search(client, wlpath, aliases={'default': '0xaaa'})
+    with mock.patch.object(client, 'load_all') as load_all:
+        assert len(list(search.read_container())) == 1
+        load_all.assert_not_called()
+
+    # Container1 (/path) was listed to find /other/path
+    assert Search.invalidate_container('0000000000-1111-0000-1111-000000000000') == 1
+    search = Search(client, wlpath, aliases={'default': '0xaaa'})
+    assert not list(search.read_container())
+
+
 @pytest.mark.parametrize('owner', ['0xfff', '0xddd'])
 def test_search_hint(base_dir, client, owner):
     storage_path_catalog = base_dir / 'storage_catalog'
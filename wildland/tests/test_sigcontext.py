@@ -127,6 +127,36 @@ def test_verify_unknown_owner(sig, owner):
         sig_2.verify(signature, test_data)
 
 
+def test_verify_memo(sig, owner):
+    test_data = b'hello world'
+    signature = sig.sign(owner, test_data)
+
+    assert sig.verify(signature, test_data) == owner
+    # already verified, but the signer still has to be recognized
+    sig_2 = SodiumSigContext(sig.key_dir)
+    with pytest.raises(SigError, match='Public key not found'):
+        sig_2.verify(signature, test_data)
+    with pytest.raises(SigError, match='Could not verify signature'):
+        sig.verify(signature, test_data + b'more')
+
+
+def test_verify_many(sig, owner, other_owner):
+    items = []
+    for i in range(5):
+        data = f'data {i}'.encode()
+        items.append((sig.sign(owner if i % 2 else other_owner, data), data, None))
+    items.append((items[0][0], b'other data', None))
+    items.append(('0xaaa' + items[1][0][4:], items[1][1], None))
+
+    results = sig.verify_many(items)
+
+    assert results[:5] == [other_owner, owner, other_owner, owner, other_owner]
+    assert isinstance(results[5], SigError)
+    assert 'Could not verify signature' in str(results[5])
+    assert isinstance(results[6], SigError)
+    assert 'Public key not found' in str(results[6])
+
+
 def test_pubkey_to_owner(sig):
     pubkey = \
         'RWSFTQBA3OKaC4EZCP8n7fz0PeeUuDOOwjxys/n7xOWkJG19mKu6bIGS/bWyV1eLB1zWhIuJtCCd4JnseOaEp/Q0'
@@ -316,3 +346,25 @@ def test_sig_key_validity(sig):
     bogus = pubkey[0:len(pubkey)-3]
 
     assert not sig.is_valid_pubkey(bogus)
+
+
+def test_cache_token(tmp_path):
+    sig = SodiumSigContext(tmp_path)
+    token = sig.cache_token()
+    assert sig.cache_token() == token
+
+    owner, pubkey = sig.generate()
+    assert sig.cache_token() == token
+    sig.add_pubkey(pubkey)
+    token_with_key = sig.cache_token()
+    assert token_with_key != token
+
+    # keys that can be loaded from key_dir on demand
+    sig.use_local_keys = True
+    token_local = sig.cache_token()
+    assert token_local != token_with_key
+    (tmp_path / 'other.pub').write_text('')
+    assert sig.cache_token() != token_local
+
+    sig.remove_key(owner)
+    assert sig.cache_token() not in (token_with_key, token_local)
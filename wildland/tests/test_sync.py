@@ -20,20 +20,26 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-# pylint: disable=missing-docstring,redefined-outer-name,unused-argument
+# pylint: disable=missing-docstring,redefined-outer-name,unused-argument,too-many-lines
 
+import gc
+import hashlib
 import os
 import shutil
+import threading
 import time
 from typing import Callable, List
 from pathlib import PurePosixPath, Path
 from itertools import combinations, product
+from unittest.mock import patch
 
 import pytest
 
-from wildland.storage_sync.naive_sync import BLOCK_SIZE
+from wildland.storage_sync.naive_sync import BLOCK_SIZE, SMALL_FILE_SIZE, TRANSFER_BATCH_SIZE, \
+    NaiveSyncer
 from wildland.storage_sync.base import SyncConflict, BaseSyncer, SyncState, SyncEvent, \
-    SyncStateEvent, SyncErrorEvent, SyncConflictEvent, SyncProgressEvent
+    SyncStateEvent, SyncErrorEvent, SyncConflictEvent, SyncProgressEvent, TransferScheduler
+from wildland.storage_backends.watch import FileEventType
 from ..client import Client
 from ..storage_backends.local import LocalStorageBackend
 from ..storage_backends.local_cached import LocalCachedStorageBackend, \
@@ -183,6 +189,249 @@ def test_sync_large_file(tmpdir, storage_backend, cleanup):
     wait_for_file(Path(storage_dir2 / 'testfile'), data)
 
 
+def test_sync_large_file_delta(tmpdir, storage_backend, cleanup):
+    backend1, storage_dir1 = make_storage(storage_backend, tmpdir / 'storage1')
+    backend2, storage_dir2 = make_storage(storage_backend, tmpdir / 'storage2')
+
+    data = b''.join(bytes([i]) * BLOCK_SIZE for i in range(4)) + b'tail'
+    Path(storage_dir1 / 'testfile').write_bytes(data)
+
+    written: List[int] = []
+    # pylint: disable=protected-access
+    original_copy_changed_blocks = NaiveSyncer._copy_changed_blocks
+
+    def copy_changed_blocks(*args):
+        written.append(original_copy_changed_blocks(*args))
+        return written[-1]
+
+    syncer = make_syncer(backend1, backend2)
+    cleanup(syncer.stop_sync)
+    with patch.object(NaiveSyncer, '_copy_changed_blocks', side_effect=copy_changed_blocks):
+        syncer.start_sync()
+        assert wait_for_file(Path(storage_dir2 / 'testfile'), data.decode())
+
+        time.sleep(1)
+        # change one byte in the middle of the file
+        with open(storage_dir1 / 'testfile', 'r+b') as f:
+            f.seek(BLOCK_SIZE * 2 + 10)
+            f.write(b'x')
+        data = data[:BLOCK_SIZE * 2 + 10] + b'x' + data[BLOCK_SIZE * 2 + 11:]
+        assert wait_for_file(Path(storage_dir2 / 'testfile'), data.decode())
+
+        time.sleep(1)
+        with open(storage_dir1 / 'testfile', 'r+b') as f:
+            f.truncate(BLOCK_SIZE)
+        assert wait_for_file(Path(storage_dir2 / 'testfile'), data[:BLOCK_SIZE].decode())
+
+    # the file was copied in full when created; then only the changed block was written
+    assert written == [BLOCK_SIZE, 0]
+
+
+@pytest.mark.parametrize('workers', [None, 1, 4])
+def test_sync_one_shot_parallel(tmpdir, storage_backend, workers):
+    backend1, storage_dir1 = make_storage(storage_backend, tmpdir / 'storage1')
+    backend2, storage_dir2 = make_storage(storage_backend, tmpdir / 'storage2')
+
+    for i in range(5):
+        os.mkdir(storage_dir1 / f'dir{i}')
+        for j in range(20):
+            make_file(storage_dir1 / f'dir{i}/file{j}', f'{i}-{j}')
+    os.mkdir(storage_dir2 / 'dir0')
+    make_file(storage_dir2 / 'dir0/file0', 'conflict')
+
+    backend1.set_config_dir(PurePosixPath(tmpdir))
+    backend2.set_config_dir(PurePosixPath(tmpdir))
+
+    syncer = BaseSyncer.from_storages(backend1, backend2, 'test: ', unidirectional=True,
+                                      one_shot=True, continuous=False, can_require_mount=False)
+    syncer.set_workers(workers)
+    syncer.one_shot_sync(unidirectional=True)
+
+    # hash db connections of the pool threads do not outlive them
+    gc.collect()
+    for backend in (backend1, backend2):
+        assert len(backend.hash_db._connections) <= 1  # pylint: disable=protected-access
+
+    hashes1 = syncer.storage_hashes[backend1]
+    assert list(hashes1) == [path for path, attr in backend1.walk() if not attr.is_dir()]
+    assert hashes1 == {path: backend1.get_hash(path) for path in hashes1}
+
+    assert [str(c.path) for c in syncer.iter_conflicts()] == ['dir0/file0']
+    for i in range(5):
+        for j in range(20):
+            if (i, j) != (0, 0):
+                assert read_file(storage_dir2 / f'dir{i}/file{j}') == f'{i}-{j}'
+
+
+class TokenStorageBackend(LocalStorageBackend):
+    """
+    Local backend with file tokens available right after a change (like S3's E-Tags).
+    """
+    def get_file_token(self, path):
+        st = os.stat(self.root / path)
+        return f'{st.st_mtime_ns}-{st.st_size}'
+
+
+def test_sync_one_shot_resume(tmpdir):
+    backend1, storage_dir1 = make_storage(TokenStorageBackend, tmpdir / 'storage1')
+    backend2, _ = make_storage(TokenStorageBackend, tmpdir / 'storage2')
+    for i in range(10):
+        make_file(storage_dir1 / f'file{i}', str(i))
+
+    backend1.set_config_dir(PurePosixPath(tmpdir))
+    backend2.set_config_dir(PurePosixPath(tmpdir))
+    syncer = BaseSyncer.from_storages(backend1, backend2, 'test: ', unidirectional=True,
+                                      one_shot=True, continuous=False, can_require_mount=False)
+    syncer.one_shot_sync(unidirectional=True)
+
+    # a new sync (e.g. after restarting the daemon) does not read the files again
+    backend1, _ = make_storage(TokenStorageBackend, tmpdir / 'storage1')
+    backend2, _ = make_storage(TokenStorageBackend, tmpdir / 'storage2')
+    backend1.set_config_dir(PurePosixPath(tmpdir))
+    backend2.set_config_dir(PurePosixPath(tmpdir))
+    syncer = BaseSyncer.from_storages(backend1, backend2, 'test: ', unidirectional=True,
+                                      one_shot=True, continuous=False, can_require_mount=False)
+    with patch.object(backend1, 'open') as open1, patch.object(backend2, 'open') as open2:
+        syncer.one_shot_sync(unidirectional=True)
+    open1.assert_not_called()
+    open2.assert_not_called()
+    assert syncer.storage_hashes[backend2][PurePosixPath('file1')] == \
+        hashlib.sha256(b'1').hexdigest()
+
+
+def test_sync_transfer_batches(tmpdir):
+    backend, storage_dir = make_storage(LocalStorageBackend, tmpdir / 'storage')
+    sizes = [10, 10, SMALL_FILE_SIZE, 10] + [10] * (TRANSFER_BATCH_SIZE + 1)
+    for i, size in enumerate(sizes):
+        Path(storage_dir / f'file{i}').write_bytes(b'x' * size)
+    paths = [PurePosixPath(f'file{i}') for i in range(len(sizes))]
+
+    # pylint: disable=protected-access
+    batches = NaiveSyncer._transfer_batches(backend, paths)
+    assert batches == [paths[0:2], paths[2:3], paths[3:3 + TRANSFER_BATCH_SIZE],
+                       paths[3 + TRANSFER_BATCH_SIZE:]]
+
+
+def test_transfer_scheduler_slots():
+    scheduler = TransferScheduler(max_transfers=2)
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def transfer():
+        nonlocal running, max_running
+        with scheduler.transfer():
+            # nested transfers share the slot
+            with scheduler.transfer():
+                with lock:
+                    running += 1
+                    max_running = max(max_running, running)
+                time.sleep(0.05)
+                with lock:
+                    running -= 1
+
+    threads = [threading.Thread(target=transfer) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max_running == 2
+
+
+def test_transfer_scheduler_bandwidth():
+    scheduler = TransferScheduler(bandwidth=10 * 1024 ** 2)
+    start = time.monotonic()
+    for _ in range(5):
+        scheduler.throttle(1024 ** 2)
+    # the first megabyte goes at once, the rest takes (at least) 0.4s
+    assert time.monotonic() - start >= 0.39
+
+
+def test_sync_progress_event_json():
+    event = SyncProgressEvent(FileEventType.MODIFY, PurePosixPath('dir/file'), job_id='job',
+                              transferred=1024, throughput=512.5)
+    parsed = SyncEvent.fromJSON(event.toJSON())
+    assert isinstance(parsed, SyncProgressEvent)
+    assert parsed == event
+    assert (parsed.transferred, parsed.throughput) == (1024, 512.5)
+
+    event = SyncProgressEvent(FileEventType.CREATE, PurePosixPath('file'))
+    parsed = SyncEvent.fromJSON(event.toJSON())
+    assert parsed == event
+    assert parsed.transferred is None
+
+
+class NativeHashStorageBackend(LocalStorageBackend):
+    """
+    Local backend with md5 native hashes, except for files named 'big*'. Counts sha256 hashing.
+    """
+    hashed: List[PurePosixPath] = []
+
+    def native_hash_type(self):
+        return 'md5'
+
+    def get_native_hash(self, path):
+        if path.name.startswith('big'):
+            return None
+        with self.open(path, os.O_RDONLY) as f:
+            return hashlib.md5(f.read(f.fgetattr().size, 0)).hexdigest()
+
+    def get_hashes(self, paths):
+        paths = list(paths)
+        self.hashed.extend(paths)
+        return super().get_hashes(paths)
+
+    def get_hash(self, path):
+        self.hashed.append(path)
+        return super().get_hash(path)
+
+
+def test_sync_native_hashes(tmpdir):
+    backend1, storage_dir1 = make_storage(NativeHashStorageBackend, tmpdir / 'storage1')
+    backend2, storage_dir2 = make_storage(NativeHashStorageBackend, tmpdir / 'storage2')
+    backend1.hashed = []
+    backend2.hashed = []
+
+    make_file(storage_dir1 / 'same', 'abcd')
+    make_file(storage_dir2 / 'same', 'abcd')
+    make_file(storage_dir1 / 'different', 'abcd')
+    make_file(storage_dir2 / 'different', 'efgh')
+    make_file(storage_dir1 / 'big_same', 'ijkl')
+    make_file(storage_dir2 / 'big_same', 'ijkl')
+    make_file(storage_dir1 / 'missing', 'mnop')
+
+    syncer = BaseSyncer.from_storages(backend1, backend2, 'test: ', unidirectional=True,
+                                      one_shot=True, continuous=False, can_require_mount=False)
+    syncer.one_shot_sync(unidirectional=True)
+
+    assert [str(c.path) for c in syncer.iter_conflicts()] == ['different']
+    assert read_file(storage_dir2 / 'missing') == 'mnop'
+
+    # sha256 is computed only for files without a native hash
+    assert backend1.hashed == [PurePosixPath('big_same')]
+    assert backend2.hashed == [PurePosixPath('big_same')]
+
+    md5 = hashlib.md5(b'mnop').hexdigest()
+    assert syncer.storage_hashes[backend1][PurePosixPath('missing')] == f'md5:{md5}'
+    assert syncer.storage_hashes[backend2][PurePosixPath('missing')] == f'md5:{md5}'
+
+
+def test_sync_native_hashes_different_types(tmpdir):
+    backend1, storage_dir1 = make_storage(NativeHashStorageBackend, tmpdir / 'storage1')
+    backend2, storage_dir2 = make_storage(LocalStorageBackend, tmpdir / 'storage2')
+
+    make_file(storage_dir1 / 'same', 'abcd')
+    make_file(storage_dir2 / 'same', 'abcd')
+
+    syncer = BaseSyncer.from_storages(backend1, backend2, 'test: ', unidirectional=True,
+                                      one_shot=True, continuous=False, can_require_mount=False)
+    syncer.one_shot_sync(unidirectional=True)
+
+    assert not list(syncer.iter_conflicts())
+    assert syncer.storage_hashes[backend1][PurePosixPath('same')] == \
+        hashlib.sha256(b'abcd').hexdigest()
+
+
 def test_sync_move_dir(tmpdir, storage_backend, cleanup):
     backend1, storage_dir1 = make_storage(storage_backend, tmpdir / 'storage1')
     backend2, storage_dir2 = make_storage(storage_backend, tmpdir / 'storage2')